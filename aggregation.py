@@ -0,0 +1,180 @@
+"""
+Server-side group-by cube for the charts.
+
+Instead of handing the raw frame to Vega-Lite and aggregating in the browser,
+each chart gets a small table with one row per group. Every value column is
+kept as <value>_sum, <value>_count and <value>_mean so the rows can be
+re-aggregated (e.g. after a brush filter) without losing correctness, and
+pair_table collapses a cube to the two fields a pair of linked brushes
+filters on.
+
+SliceSummary does the same for slice-vs-rest comparisons: per-category sums
+of a column family for a slice and its complement without building a long
+table, and for many slices side by side (compare_many, group_totals).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from reshape import family_columns, suffix_labels
+
+# masks x rows cells multiplied at once by SliceSummary.compare_many
+BATCH_CELLS = int(os.environ.get('SLICE_BATCH_CELLS', 2**24))
+
+
+def group_stats(df, by, values=()):
+    """
+    Group `df` by the columns in `by` and return one row per group with a
+    `count` column (number of rows) plus sum/count/mean for each of `values`.
+    """
+    by = list(by)
+    grouped = df.groupby(by, observed=True, dropna=False, sort=True)
+    out = grouped.size().rename('count').to_frame()
+    for value in values:
+        column = grouped[value]
+        out[value + '_sum'] = column.sum().astype(float)
+        out[value + '_count'] = column.count()
+        out[value + '_mean'] = out[value + '_sum'] / out[value + '_count']
+    return out.reset_index()
+
+
+@timed('aggregate:cube')
+def build_cube(df, groupings):
+    """
+    Compute every group-by in `groupings` ({name: (by, values)}) once and
+    return them as {name: aggregated frame}.
+    """
+    return {name: group_stats(df, by, values) for name, (by, values) in groupings.items()}
+
+
+def pair_table(cube, pair, values=()):
+    """
+    Joint table of the two fields of a pair of linked brushes (race x
+    education, state x zone) from cube rows that may be grouped finer (e.g.
+    per wave): one row per (a, b) with the summed `count` and sum/count/mean
+    for each of `values`. The brushes then filter O(categories) rows in the
+    browser, and charts.reaggregate_mean recovers the means after filtering.
+    """
+    pair = list(pair)
+    columns = [c for c in ['count'] + [v + part for v in values for part in ('_sum', '_count')] if c in cube.columns]
+    table = cube.groupby(pair, observed=True, dropna=False, sort=True)[columns].sum()
+    for value in values:
+        table[value + '_mean'] = table[value + '_sum'] / table[value + '_count'].where(table[value + '_count'] > 0)
+    return table.reset_index()
+
+
+
+class SliceSummary:
+    """
+    Per-slice totals for a column family (e.g. why_no_vaccine_*) plus a few
+    mean columns, computed in one pass.
+
+    All the columns [family columns | mean columns] are converted once into a
+    float32 matrix of values (NaNs as 0) and a bool matrix of non-NaN flags,
+    5 bytes per cell. The value sums of a slice are then a single mask @
+    values product, the non-NaN counts a sum over the flags of its rows, and
+    the complement is the column totals minus the slice totals.
+    """
+
+    def __init__(self, df, prefix=None, means=(), suffix='.+'):
+        columns = family_columns(df, prefix, suffix) if prefix else []
+        self.labels = suffix_labels(columns, prefix)
+        self.means = list(means)
+        values = df[columns + self.means].to_numpy(dtype=np.float32, na_value=np.nan)
+        self.present = ~np.isnan(values)
+        self.values = np.where(self.present, values, np.float32(0))
+        del values
+        self.totals = self.sums(np.ones(len(df), dtype=bool))
+        self.n_rows = len(df)
+
+    def sums(self, mask):
+        """[value sums | non-NaN counts] of the rows in `mask`."""
+        return np.concatenate([mask.astype(np.float32) @ self.values, self.present[mask].sum(axis=0)])
+
+    @timed('aggregate:slice_summary')
+    def compare(self, mask):
+        """
+        Summaries for the rows in `mask` and for the rest: each is a dict with
+        the row count, a (reason, agree, respondents) table and the means.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        in_slice = self.sums(mask)
+        size = int(mask.sum())
+        return (split_totals(self.labels, self.means, in_slice, size),
+                split_totals(self.labels, self.means, self.totals - in_slice, self.n_rows - size))
+
+    @timed('aggregate:compare_many')
+    def compare_many(self, masks):
+        """
+        Summaries of the rows in each of `masks` (a list of boolean masks).
+        The masks are stacked and multiplied with the values in batches of at
+        most BATCH_CELLS cells, so the value sums of N slices cost a few
+        matrix products instead of N passes (the counts are summed per mask).
+        """
+        summaries = []
+        batch = max(1, BATCH_CELLS // max(self.n_rows, 1))
+        for start in range(0, len(masks), batch):
+            stacked = np.array(masks[start:start + batch], dtype=bool).reshape(-1, self.n_rows)
+            for mask, value_sums in zip(stacked, stacked.astype(np.float32) @ self.values):
+                sums = np.concatenate([value_sums, self.present[mask].sum(axis=0)])
+                summaries.append(split_totals(self.labels, self.means, sums, int(mask.sum())))
+        return summaries
+
+    @timed('aggregate:group_totals')
+    def group_totals(self, codes, n_groups):
+        """
+        Summaries of every group of rows in one pass, `codes` being the group
+        number of each row (-1 to leave it out, see SliceIndex.group_codes).
+        """
+        # left out rows go to an extra last bin instead of copying the kept rows
+        codes = np.where(codes >= 0, codes, n_groups)
+        sizes = np.bincount(codes, minlength=n_groups + 1)[:n_groups]
+        width = self.values.shape[1]
+        sums = np.zeros((n_groups, 2 * width))
+        for j in range(width):
+            sums[:, j] = np.bincount(codes, weights=self.values[:, j], minlength=n_groups + 1)[:n_groups]
+            sums[:, width + j] = np.bincount(codes, weights=self.present[:, j], minlength=n_groups + 1)[:n_groups]
+        return [split_totals(self.labels, self.means, row, int(size)) for size, row in zip(sizes, sums)]
+
+
+def split_totals(labels, means, sums, size):
+    """
+    Turn a totals vector laid out as [family sums | mean sums | family counts |
+    mean counts] into a slice summary dict: the row count, a (reason, agree,
+    respondents) table for the family and the NaN-aware means.
+    """
+    k = len(labels)
+    width = k + len(means)
+    value_sums, counts = np.asarray(sums[:width], dtype=float), np.asarray(sums[width:], dtype=float)
+    reasons = pd.DataFrame({
+        'reason': labels,
+        'agree': value_sums[:k],
+        'respondents': counts[:k].astype(int),
+    })
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_values = dict(zip(means, value_sums[k:] / counts[k:]))
+    return {'size': size, 'reasons': reasons, 'means': mean_values}
+
+
+def comparison_table(labels, summaries, by=('slice',)):
+    """
+    Tidy table of many slice summaries for small-multiples charts: one row
+    per (slice, measure) with the slice's columns `by` (from its label
+    tuple), its size, and the value of each mean (kind 'mean') and of each
+    family category's agree share (kind 'share'). Empty slices are left out.
+    """
+    rows = []
+    for label, summary in zip(labels, summaries):
+        if not summary['size']:
+            continue
+        label = dict(zip(by, label if isinstance(label, tuple) else (label,)))
+        for measure, value in summary['means'].items():
+            rows.append(dict(label, size=summary['size'], kind='mean', measure=measure, value=value))
+        reasons = summary['reasons']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shares = reasons['agree'].to_numpy() / reasons['respondents'].to_numpy()
+        for reason, share in zip(reasons['reason'], shares):
+            rows.append(dict(label, size=summary['size'], kind='share', measure=reason, value=share))
+    return pd.DataFrame(rows, columns=list(by) + ['size', 'kind', 'measure', 'value'])
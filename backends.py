@@ -0,0 +1,276 @@
+"""
+Query backends for the slice metrics.
+
+Both backends answer the same question: for the rows matching the widget
+filters and for the rest, what are the row counts, the per-column totals of a
+column family and the means of a few columns? The result has the shape
+returned by aggregation.SliceSummary.compare.
+
+compare_many and compare_groups answer it for many slices side by side:
+a list of (selections, ranges) specs, or every cell of the grid of a few
+categorical columns (e.g. every state) within the widget filters. They
+return the in-slice summaries only, ready for aggregation.comparison_table.
+
+weighted() returns the weighting.WeightedStats behind the metric tiles and
+grids (weighted means with their intervals) for the same rows.
+
+PandasBackend works on the in-memory frame (slice index + SliceSummary).
+SQLBackend pushes the filters down as SQL predicates into an embedded database
+file (SQLite, or DuckDB for *.duckdb files when duckdb is installed) and only
+pulls the aggregates back, the weighted sums included (SQLWeightedStats).
+With it every slice metric of the pages is a query, but the pages still load
+the frames for their filter widgets and slice masks, charts, raw-data tables
+and person sampler (and the innovation page its inventor drill-down), so it
+does not reduce what each app process holds. Create the database file with
+
+    python backends.py <database> <table> <csv file or wave glob like 'pulse*.csv'>
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+from aggregation import SliceSummary, split_totals
+from data_store import dataset_version, discover_waves, read_dataset, read_waves
+from instrumentation import timed
+from reshape import suffix_labels
+from result_cache import lock_arrays
+from slicing import plain
+from weighting import SUMS, WeightedStats
+
+# concurrent queries of SQLBackend.compare_many
+SLICE_WORKERS = int(os.environ.get('SLICE_WORKERS', 4))
+
+
+class PandasBackend:
+    def __init__(self, df, index):
+        self.df = df
+        self.index = index
+        self.columns = list(df.columns)
+        self.summaries = {}
+
+    def summary(self, prefix, means):
+        # built on first use, after the backend was cached, so its arrays are locked here
+        key = (prefix, tuple(means))
+        if key not in self.summaries:
+            self.summaries[key] = lock_arrays(SliceSummary(self.df, prefix, means))
+        return self.summaries[key]
+
+    def compare(self, selections=None, ranges=None, prefix=None, means=()):
+        return self.summary(prefix, means).compare(self.index.mask(selections, ranges))
+
+    def compare_many(self, specs, prefix=None, means=()):
+        """In-slice summaries of every (selections, ranges) in `specs`, in one batched product."""
+        masks = [self.index.mask(selections, ranges) for selections, ranges in specs]
+        return self.summary(prefix, means).compare_many(masks)
+
+    def compare_groups(self, by, selections=None, ranges=None, prefix=None, means=()):
+        """
+        ([(value, ...) per cell], [summary per cell]) for every cell of the
+        categorical columns `by` within the filters, in one grouped pass.
+        """
+        codes, labels = self.index.group_codes(by)
+        codes = np.where(self.index.mask(selections, ranges), codes, -1)
+        return labels, self.summary(prefix, means).group_totals(codes, len(labels))
+
+    def weighted(self, values, version, weight=None, frequency=False, proportions=()):
+        """Weighted estimates of `values` for slices and grids (see weighting.py)."""
+        return WeightedStats(self.df, self.index, values, version, weight, frequency, proportions)
+
+
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def predicate(selections=None, ranges=None):
+    """SQL condition (with ? placeholders) and its parameters for the widget filters."""
+    clauses, params = [], []
+    for col, selected in (selections or {}).items():
+        if selected:
+            clauses.append('{} IN ({})'.format(quote(col), ', '.join('?' * len(selected))))
+            params.extend(plain(v) for v in selected)
+    for col, value_range in (ranges or {}).items():
+        if value_range is not None:
+            clauses.append('{} BETWEEN ? AND ?'.format(quote(col)))
+            params.extend(plain(v) for v in value_range)
+    return ' AND '.join(clauses) or '1 = 1', params
+
+
+def connect(path):
+    if path.endswith('.duckdb'):
+        import duckdb
+        return duckdb.connect(path, read_only=True)
+    return sqlite3.connect('file:{}?mode=ro'.format(path), uri=True, check_same_thread=False)
+
+
+class SQLBackend:
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.version = dataset_version(path)
+        conn = connect(path)
+        try:
+            cursor = conn.execute('SELECT * FROM {} LIMIT 0'.format(quote(table)))
+            self.columns = [d[0] for d in cursor.description]
+        finally:
+            conn.close()
+
+    def fetch(self, sql, params):
+        """All result rows of `sql`, on a connection of its own."""
+        conn = connect(self.path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    @timed('query:sql')
+    def compare(self, selections=None, ranges=None, prefix=None, means=()):
+        family = [c for c in self.columns if prefix and c.startswith(prefix)]
+        labels = suffix_labels(family, prefix)
+        means = list(means)
+        value_columns = [quote(c) for c in family + means]
+
+        # per column: slice sum, total sum, slice count, total count
+        aggregates = ['SUM(in_slice)', 'COUNT(*)']
+        for col in value_columns:
+            aggregates += ['SUM(CASE WHEN in_slice = 1 THEN {} END)'.format(col), 'SUM({})'.format(col)]
+        for col in value_columns:
+            aggregates += ['COUNT(CASE WHEN in_slice = 1 THEN {} END)'.format(col), 'COUNT({})'.format(col)]
+
+        condition, params = predicate(selections, ranges)
+        sql = 'SELECT {} FROM (SELECT *, CASE WHEN {} THEN 1 ELSE 0 END AS in_slice FROM {}) AS t'.format(
+            ', '.join(aggregates), condition, quote(self.table))
+        row = self.fetch(sql, params)[0]
+
+        size, total = int(row[0] or 0), int(row[1])
+        pairs = np.array([v or 0 for v in row[2:]], dtype=float).reshape(-1, 2)
+        in_slice, overall = pairs[:, 0], pairs[:, 1]
+        return (split_totals(labels, means, in_slice, size),
+                split_totals(labels, means, overall - in_slice, total - size))
+
+    def compare_many(self, specs, prefix=None, means=()):
+        """
+        In-slice summaries of every (selections, ranges) in `specs`. Each is
+        one query on its own connection; the database does the scanning
+        outside the GIL, so SLICE_WORKERS threads run them side by side.
+        """
+        with ThreadPoolExecutor(SLICE_WORKERS) as pool:
+            results = pool.map(lambda spec: self.compare(spec[0], spec[1], prefix, means), specs)
+            return [in_slice for in_slice, _ in results]
+
+    @timed('query:sql_groups')
+    def compare_groups(self, by, selections=None, ranges=None, prefix=None, means=()):
+        """Same as PandasBackend.compare_groups, as one GROUP BY query."""
+        family = [c for c in self.columns if prefix and c.startswith(prefix)]
+        labels = suffix_labels(family, prefix)
+        means = list(means)
+        value_columns = [quote(c) for c in family + means]
+        keys = [quote(c) for c in by]
+        aggregates = ['COUNT(*)'] + ['SUM({})'.format(c) for c in value_columns] \
+            + ['COUNT({})'.format(c) for c in value_columns]
+
+        condition, params = predicate(selections, ranges)
+        missing = ' AND '.join('{} IS NOT NULL'.format(k) for k in keys)
+        sql = 'SELECT {}, {} FROM {} WHERE ({}) AND {} GROUP BY {} ORDER BY {}'.format(
+            ', '.join(keys), ', '.join(aggregates), quote(self.table), condition, missing,
+            ', '.join(keys), ', '.join(keys))
+        rows = self.fetch(sql, params)
+
+        cells, summaries = [], []
+        for row in rows:
+            cells.append(tuple(row[:len(keys)]))
+            sums = np.array([v or 0 for v in row[len(keys) + 1:]], dtype=float)
+            summaries.append(split_totals(labels, means, sums, int(row[len(keys)])))
+        return cells, summaries
+
+    def weighted(self, values, version, weight=None, frequency=False, proportions=()):
+        """Same as PandasBackend.weighted, the sums aggregated by the database."""
+        return SQLWeightedStats(self, values, version, weight, frequency, proportions)
+
+
+class SQLWeightedStats(WeightedStats):
+    """
+    WeightedStats whose sums (the columns of WeightedStats.matrix) come from
+    the database: one query for a slice and the whole table, one GROUP BY
+    query for a grid. The estimates and their caching are the same.
+    """
+
+    def __init__(self, backend, values, version, weight=None, frequency=False, proportions=()):
+        self.backend = backend
+        self.values = list(values)
+        # the results are cached under the database file's version too
+        self.version = (version, backend.path, backend.version)
+        self.weight = weight
+        self.frequency = frequency
+        self.proportions = np.array([v in proportions for v in self.values])
+
+    def sums(self, condition='1 = 1'):
+        """SUM aggregates in the order of SUMS x values, over the rows where `condition` holds."""
+        w = quote(self.weight) if self.weight else '1.0'
+        aggregates = []
+        for kind in SUMS:
+            for value in self.values:
+                x = quote(value)
+                term = {'rows': '1', 'weight': w, 'weight2': '{0} * {0}'.format(w),
+                        'wx': '{} * {}'.format(w, x), 'wx2': '{0} * {1} * {1}'.format(w, x)}[kind]
+                # the rows where the value is known and the weight positive, as in WeightedStats
+                aggregates.append('SUM(CASE WHEN {} AND {} IS NOT NULL AND {} > 0 THEN {} END)'.format(
+                    condition, x, w, term))
+        return aggregates
+
+    @timed('query:sql_weighted')
+    def slice_estimates(self, selections, ranges):
+        condition, params = predicate(selections, ranges)
+        sql = 'SELECT {}, {} FROM (SELECT *, CASE WHEN {} THEN 1 ELSE 0 END AS in_slice FROM {}) AS t'.format(
+            ', '.join(self.sums('in_slice = 1')), ', '.join(self.sums()), condition, quote(self.backend.table))
+        row = self.backend.fetch(sql, params)[0]
+        inside, totals = np.array([v or 0 for v in row], dtype=float).reshape(2, -1)
+        return self.estimates(inside[None]), self.estimates((totals - inside)[None])
+
+    @timed('query:sql_weighted_groups')
+    def group_estimates(self, by, selections, ranges):
+        keys = [quote(c) for c in by]
+        condition, params = predicate(selections, ranges)
+        missing = ' AND '.join('{} IS NOT NULL'.format(k) for k in keys)
+        sql = 'SELECT {}, {} FROM {} WHERE ({}) AND {} GROUP BY {} ORDER BY {}'.format(
+            ', '.join(keys), ', '.join(self.sums()), quote(self.backend.table), condition, missing,
+            ', '.join(keys), ', '.join(keys))
+        rows = self.backend.fetch(sql, params)
+        labels = [tuple(row[:len(keys)]) for row in rows]
+        sums = np.array([[v or 0 for v in row[len(keys):]] for row in rows], dtype=float)
+        return self.cell_estimates(by, labels, sums.reshape(len(rows), len(SUMS) * len(self.values)))
+
+
+def export_table(df, path, table, indexed=()):
+    """Write `df` into the database file as `table`, with indexes on the filter columns."""
+    if path.endswith('.duckdb'):
+        import duckdb
+        conn = duckdb.connect(path)
+        conn.register('frame', df)
+        conn.execute('CREATE OR REPLACE TABLE {} AS SELECT * FROM frame'.format(quote(table)))
+        conn.close()
+        return
+    conn = sqlite3.connect(path)
+    try:
+        df.to_sql(table, conn, if_exists='replace', index=False)
+        for col in indexed:
+            conn.execute('CREATE INDEX {} ON {} ({})'.format(
+                quote('{}_{}'.format(table, col)), quote(table), quote(col)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print(__doc__)
+        sys.exit(1)
+    db_path, table_name, source = sys.argv[1:4]
+    if '*' in source:
+        frame = read_waves(discover_waves(source))
+    else:
+        frame = read_dataset(source)
+    categorical = [c for c in frame.columns if str(frame[c].dtype) == 'category']
+    export_table(frame, db_path, table_name, indexed=categorical + [c for c in ('age', 'cohort', 'year', 'wave') if c in frame.columns])
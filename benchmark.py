@@ -0,0 +1,622 @@
+"""
+Benchmarks for the explorables.
+
+    python benchmark.py load [csv ...]
+
+compares the plain pd.read_csv path against data_store.read_dataset (cold
+build and warm cache hit). Every measurement runs in a fresh interpreter so
+the reported peak RSS belongs to that load alone.
+
+    python benchmark.py synth SCALE [SCALE ...]
+
+writes synthetic copies of the datasets, SCALE times the size of
+invention.csv / the state file / pulse39.csv, to <DATA_CACHE_DIR>/bench/x<SCALE>
+(resampled from the real files where they exist, generated from their schema
+otherwise; the Pulse rows are spread over several wave files).
+
+    python benchmark.py traces [--scales 1,10,100] [--trace FILE] [--save FILE] [--baseline FILE]
+
+replays interaction traces against both explorables headlessly: the page
+scripts themselves run through streamlit.testing, and every trace step sets
+widgets and reruns the page. Each (app, scale, trace) runs in its own
+interpreter with profiling on and reports startup time (the first page
+view), rerun latency percentiles (from the profiling records, see
+instrumentation.py), peak RSS and chart payload bytes. Traces recorded
+elsewhere can be added with --trace: a JSON list of
+{"app": "pulse" | "innovation", "name": ..., "steps": [{widget key: value, ...}, ...]},
+each step holding the widget values that changed (plus "click": <button key>,
+e.g. "person" for the Get Random Person button). --save writes the results as a baseline,
+--baseline compares against one and exits with 1 on regressions.
+
+    python benchmark.py sessions [--app pulse] [--trace multiselect] [--sessions 32] [--scale 1]
+
+load-tests one explorable: N sessions of the page script share one process
+(the datasets, result cache, section cache and worker pool, see workers.py)
+and replay the trace at the same time, each from its own step, as N users
+clicking through the page would. Reports the throughput (reruns per
+second), the rerun latency percentiles and how many computations the
+worker pool turned away as busy.
+
+traces and sessions patch streamlit.testing internals (see
+share_streamlit_state), so they need the streamlit release in
+STREAMLIT_TESTED and stop with an error naming it on one that lacks them.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data_store import CACHE_DIR
+
+DEFAULT_FILES = [
+    'invention.csv',
+    'Innovation Rates by Childhood CZ, State, Gender and Parent Income.csv',
+    'Innovation by Current State, Year of Birth and Age.csv',
+    'pulse39.csv',
+]
+
+STATE_FILE = 'Innovation by Current State, Year of Birth and Age.csv'
+INVENTOR_FILE = 'invention.csv'
+PULSE_FILE = 'pulse39.csv'
+PULSE_BASE_ROWS = 70_000  # about one Household Pulse wave
+MAX_WAVES = 10
+CHUNK_ROWS = 500_000
+DEFAULT_SCALES = [1, 10, 100]
+# a metric this much worse than the baseline is reported as a regression
+TOLERANCE = 1.25
+# ... and at least this much worse in absolute terms (timings of a few ms are mostly noise)
+NOISE_FLOOR = {'startup_s': 0.1, 'first_ms': 250, 'p50_ms': 5, 'p90_ms': 5, 'p99_ms': 5,
+               'peak_rss_mb': 20, 'max_chart_bytes': 0}
+
+LOAD_SNIPPET = """
+import json, resource, sys, time
+import pandas as pd
+import data_store
+method, path = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+df = pd.read_csv(path) if method == 'read_csv' else data_store.read_dataset(path)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'frame_mb': df.memory_usage(deep=True).sum() / 2**20,
+}))
+"""
+
+
+def run_load(method, path, cache_dir):
+    env = dict(os.environ, DATA_CACHE_DIR=cache_dir)
+    out = subprocess.run([sys.executable, '-c', LOAD_SNIPPET, method, path],
+                         env=env, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout)
+
+
+def bench_load(paths, repeat=3):
+    print('{:<40} {:<12} {:>10} {:>12} {:>10}'.format('file', 'method', 'seconds', 'peak rss MB', 'frame MB'))
+    for path in paths:
+        if not os.path.exists(path):
+            print('{:<40} skipped (not found)'.format(path[:40]))
+            continue
+        with tempfile.TemporaryDirectory() as cache_dir:
+            rows = [('read_csv', run_load('read_csv', path, cache_dir)),
+                    ('cold', run_load('cached', path, cache_dir))]
+            rows += [('warm', run_load('cached', path, cache_dir)) for _ in range(repeat)]
+        for method, r in rows:
+            print('{:<40} {:<12} {:>10.4f} {:>12.1f} {:>10.2f}'.format(
+                path[:40], method, r['seconds'], r['peak_rss_mb'], r['frame_mb']))
+
+
+#############################################################################################################
+# synthetic datasets
+#############################################################################################################
+
+STATES = [
+    'Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 'Delaware',
+    'District of Columbia', 'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa',
+    'Kansas', 'Kentucky', 'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota',
+    'Mississippi', 'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey',
+    'New Mexico', 'New York', 'North Carolina', 'North Dakota', 'Ohio', 'Oklahoma', 'Oregon',
+    'Pennsylvania', 'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah',
+    'Vermont', 'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming']
+
+PULSE_CHOICES = {
+    'gender': ['Female', 'Male', 'Transgender', 'None of these'],
+    'race': ['White', 'Black', 'Asian', 'Any other race alone, or races in combination'],
+    'education': ['Less than high school', 'Some high school', 'High school graduate or equivalent',
+                  'Some college', 'Associates degree', 'Bachelors degree', 'Graduate degree'],
+    'sexual_orientation': ['Straight', 'Gay or lesbian', 'Bisexual', 'Something else', "I don't know"],
+    'marital_status': ['Married', 'Widowed', 'Divorced', 'Separated', 'Never married'],
+}
+NO_VACCINE_REASONS = [
+    'Concerned about possible side effects', "Don't know if it will protect me", "Don't believe I need it",
+    "Don't think COVID-19 is a big threat", "Don't like vaccines", 'Doctor has not recommended it',
+    'Plan to wait and see if it is safe', 'Other people need it more right now',
+    'Concerned about the cost', "Don't trust COVID-19 vaccines", "Don't trust the government",
+    'Already had COVID-19', 'Other reason']
+
+
+def synth_state(rng):
+    """One row per (state, birth cohort, calendar year) for ages 20-80, like the state file."""
+    state, cohort, year = np.meshgrid(np.arange(len(STATES)), np.arange(1940, 1985), np.arange(1996, 2013))
+    df = pd.DataFrame({'state': np.array(STATES)[state.ravel()], 'cohort': cohort.ravel(), 'year': year.ravel()})
+    df['age'] = df['year'] - df['cohort']
+    df = df[df['age'].between(20, 80)].reset_index(drop=True)
+    df['num_grants'] = rng.gamma(0.5, 0.002, len(df)).round(6)
+    return df
+
+
+def synth_pulse(n, rng):
+    """`n` respondents with the columns the Pulse page uses."""
+    df = pd.DataFrame({col: rng.choice(values, n) for col, values in PULSE_CHOICES.items()})
+    df['age'] = rng.integers(19, 90, n)
+    df['hispanic'] = rng.random(n) < 0.15
+    df['received_vaccine'] = rng.random(n) < 0.8
+    intention = rng.integers(1, 6, n).astype(float)
+    intention[df['received_vaccine'].to_numpy()] = np.nan
+    df['vaccine_intention'] = intention
+    for reason in NO_VACCINE_REASONS:
+        df['why_no_vaccine_' + reason] = (~df['received_vaccine']) & (rng.random(n) < 0.3)
+    # person weights, like the PWEIGHT column of the public use files
+    df['PWEIGHT'] = rng.lognormal(7.5, 0.8, n).round(2)
+    return df
+
+
+def replicate(base, scale, rng, relabel=None):
+    """Chunks (lists of up to CHUNK_ROWS rows) of `base` repeated `scale` times."""
+    per_chunk = max(1, CHUNK_ROWS // max(len(base), 1))
+    for start in range(0, scale, per_chunk):
+        parts = []
+        for k in range(start, min(scale, start + per_chunk)):
+            part = base.copy()
+            if relabel is not None:
+                relabel(part, k)
+            parts.append(part)
+        yield pd.concat(parts, ignore_index=True)
+
+
+def relabel_zones(part, k):
+    # copies are new commuting zones, so zone-level group-bys grow with the scale
+    if k:
+        part['par_cz'] = part['par_cz'] + 100_000 * k
+        part['par_czname'] = part['par_czname'] + ' {}'.format(k)
+
+
+def write_chunks(chunks, path):
+    tmp = path + '.tmp'
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(tmp, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    os.replace(tmp, path)
+
+
+def synth_dir(scale):
+    return os.path.abspath(os.path.join(CACHE_DIR, 'bench', 'x{}'.format(scale)))
+
+
+def write_synthetic(scale, seed=0):
+    """Write the scaled datasets (once) and return their directory."""
+    out_dir = synth_dir(scale)
+    marker = os.path.join(out_dir, 'synth.json')
+    if os.path.exists(marker):
+        return out_dir
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    write_chunks(replicate(pd.read_csv(INVENTOR_FILE), scale, rng, relabel_zones),
+                 os.path.join(out_dir, INVENTOR_FILE))
+
+    state = pd.read_csv(STATE_FILE) if os.path.exists(STATE_FILE) else synth_state(rng)
+    write_chunks(replicate(state, scale, rng), os.path.join(out_dir, STATE_FILE))
+
+    # the Pulse rows go to `waves` files pulse<39-i>.csv, newest wave first
+    waves = min(scale, MAX_WAVES)
+    total = PULSE_BASE_ROWS * scale
+    pulse = pd.read_csv(PULSE_FILE) if os.path.exists(PULSE_FILE) else None
+    for i in range(waves):
+        rows = total // waves + (i < total % waves)
+        if pulse is not None:
+            chunks = (pulse.iloc[rng.integers(0, len(pulse), min(CHUNK_ROWS, rows - start))]
+                      for start in range(0, rows, CHUNK_ROWS))
+        else:
+            chunks = (synth_pulse(min(CHUNK_ROWS, rows - start), rng) for start in range(0, rows, CHUNK_ROWS))
+        write_chunks(chunks, os.path.join(out_dir, 'pulse{}.csv'.format(39 - i)))
+
+    with open(marker, 'w') as f:
+        json.dump({'scale': scale, 'seed': seed, 'real_pulse': pulse is not None,
+                   'real_state': os.path.exists(STATE_FILE)}, f)
+    return out_dir
+
+
+#############################################################################################################
+# headless reruns
+#############################################################################################################
+
+APPS = {'pulse': 'streamlit_app.py', 'innovation': 'innovation_streamlit_app.py'}
+WIDGET_KINDS = ['multiselect', 'slider', 'checkbox', 'number_input', 'selectbox', 'text_input']
+
+
+class PageSession:
+    """
+    One browser session of an explorable: the page script itself, run
+    headlessly through streamlit.testing (as snapshot.py does) in this
+    process. Every PageSession of the process shares the datasets, result
+    and section caches and the worker pool, like the sessions of one server.
+    """
+
+    def __init__(self, app, timeout=600):
+        from streamlit.testing.v1 import AppTest
+
+        share_streamlit_state()
+        self.page = app
+        self.app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), APPS[app]),
+                                     default_timeout=timeout)
+
+    def widget(self, key):
+        for kind in WIDGET_KINDS:
+            for widget in getattr(self.app, kind):
+                if widget.key == key:
+                    return widget
+        raise KeyError('{} has no widget {!r}'.format(APPS[self.page], key))
+
+    def rerun(self, step=None):
+        """Apply the trace step (widget values, a clicked button) and rerun the page."""
+        step = dict(step or {})
+        click = step.pop('click', None)
+        for key, value in step.items():
+            self.widget(key).set_value(tuple(value) if key.endswith('_range') else value)
+        if click:
+            self.app.button(key=click).click()
+        self.app.run()
+        if self.app.exception:
+            raise RuntimeError(self.app.exception[0].message)
+
+    def options(self, key):
+        return list(self.widget(key).options)
+
+    def bounds(self, key):
+        slider = self.widget(key)
+        return int(slider.min), int(slider.max)
+
+    def traces(self):
+        """The built-in traces, from the widgets of the first page view."""
+        if self.page == 'pulse':
+            low, high = self.bounds('age_range')
+            genders, races, educations = self.options('genders'), self.options('races'), self.options('educations')
+            return {
+                'multiselect': [{'genders': genders[:i]} for i in range(len(genders) + 1)]
+                               + [{'races': races[:i]} for i in range(1, len(races) + 1)]
+                               + [{'educations': educations[:i]} for i in range(1, len(educations) + 1)]
+                               + [{'genders': [], 'races': [], 'educations': []}],
+                'age_sweep': [{'age_range': (a, min(a + 10, high))} for a in range(low, high, 2)],
+                'random_person': [{'click': 'person'}] * 10
+                                 + [{'in_slice_only': True, 'races': races[:1], 'click': 'person'}]
+                                 + [{'no_vaccine': True, 'num_people': 12, 'click': 'person'}] * 10,
+            }
+        low, high = self.bounds('cohort_range')
+        states, drill_states = self.options('states'), self.options('drill_states')
+        return {
+            'state_multiselect': [{'states': states[:i]} for i in range(0, len(states) + 1, 5)],
+            'cohort_sweep': [{'cohort_range': (c, min(c + 5, high))} for c in range(low, high)],
+            'repeat': [{'states': states[:3]}, {'states': []}] * 10,
+            'drill_down': [{'drill_states': drill_states[:i]} for i in range(1, len(drill_states) + 1, 5)],
+        }
+
+
+# the streamlit release whose streamlit.testing internals share_streamlit_state patches
+STREAMLIT_TESTED = '1.65'
+UNSUPPORTED_STREAMLIT = ('the headless benchmarks patch streamlit.testing internals that streamlit {} does not '
+                         'have ({}); install streamlit ' + STREAMLIT_TESTED + ' (pip install "streamlit~='
+                         + STREAMLIT_TESTED + '.0") to run them')
+
+
+class KeepRuntime(type):
+    """Metaclass that forwards the runtime streamlit.testing installs to the real Runtime and never removes it."""
+
+    def __setattr__(cls, name, value):
+        from streamlit.runtime import Runtime
+
+        if name != '_instance':
+            super().__setattr__(name, value)
+        elif value is not None:
+            Runtime._instance = value
+
+
+def share_streamlit_state():
+    """
+    Make the PageSessions of this process share one compiled script and one
+    runtime, as the sessions of a server do. streamlit.testing compiles the
+    script again for every run (time the server does not spend, and
+    CPython's parser crashes when sessions compile at the same time) and
+    installs a stand-in runtime for each run that it removes at the end,
+    under the feet of the other sessions.
+    """
+    import streamlit
+
+    try:
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.testing.v1 import app_test, local_script_runner
+    except ImportError as error:
+        raise RuntimeError(UNSUPPORTED_STREAMLIT.format(streamlit.__version__, error))
+    missing = ['{}.{}'.format(owner.__name__, name)
+               for owner, name in [(app_test, 'Runtime'), (app_test, 'ScriptCache'),
+                                   (local_script_runner, 'ScriptCache'), (Runtime, '_instance')]
+               if not hasattr(owner, name)]
+    if missing:
+        raise RuntimeError(UNSUPPORTED_STREAMLIT.format(streamlit.__version__, 'no ' + ', '.join(missing)))
+    if not streamlit.__version__.startswith(STREAMLIT_TESTED + '.'):
+        warnings.warn('benchmark.py was written against streamlit {}, running streamlit {}: if the sessions '
+                      'fail, install streamlit {}'.format(STREAMLIT_TESTED, streamlit.__version__, STREAMLIT_TESTED))
+
+    if app_test.Runtime is Runtime:
+        cache = ScriptCache()
+        app_test.ScriptCache = local_script_runner.ScriptCache = lambda: cache
+        app_test.Runtime = KeepRuntime('SharedRuntime', (Runtime,), {})
+
+
+def first_view(app):
+    """A PageSession of `app` after its first page view, with the warm-up finished."""
+    import warmup
+
+    session = PageSession(app)
+    session.rerun()
+    warmup.wait(app)  # what the page does not need right away is still loading in the background
+    return session
+
+
+def trace_steps(session, trace, trace_file=None):
+    if trace_file:
+        with open(trace_file) as f:
+            return next(t['steps'] for t in json.load(f) if t['app'] == session.page and t['name'] == trace)
+    return session.traces()[trace]
+
+
+def data_rows(app):
+    """Rows in the data files of `app` (the Pulse waves, the state file)."""
+    import glob
+
+    files = sorted(glob.glob('pulse*.csv')) if app == 'pulse' else [STATE_FILE]
+    rows = 0
+    for path in files:
+        with open(path, 'rb') as f:
+            rows += sum(1 for _ in f) - 1
+    return rows
+
+
+def profile_records(path, offset):
+    """The rerun records appended to the profile log since `offset`, and the new offset."""
+    with open(path) as f:
+        f.seek(offset)
+        lines = f.readlines()
+        return [json.loads(line) for line in lines if line.strip()], f.tell()
+
+
+def replay_trace(app, trace, trace_file=None):
+    """Run one trace in this interpreter (see run_trace) and return its metrics."""
+    import resource
+    import time
+
+    import instrumentation
+
+    log = instrumentation.LOG_PATH
+    offset = os.path.getsize(log) if os.path.exists(log) else 0
+    start = time.perf_counter()
+    session = first_view(app)
+    startup = time.perf_counter() - start
+    for step in trace_steps(session, trace, trace_file):
+        session.rerun(step)
+    records, _ = profile_records(log, offset)
+
+    # the first rerun builds every section; the percentiles are over the interactions
+    latencies = np.array([r['total_ms'] for r in records[1:]])
+    chart_bytes = [sum(r['values'].get('chart_bytes', [])) for r in records]
+    spans = {}
+    for r in records:
+        for s in r['spans']:
+            spans[s['name']] = spans.get(s['name'], 0) + s['ms']
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'rows': data_rows(app),
+        'warnings': [w.value for w in session.app.warning],
+        'startup_s': startup,
+        'reruns': len(records),
+        'first_ms': records[0]['total_ms'],
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p90_ms': float(np.percentile(latencies, 90)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        'peak_rss_mb': peak_rss,
+        'max_chart_bytes': max(chart_bytes),
+        'total_chart_bytes': sum(chart_bytes),
+        'span_ms': spans,
+    }
+
+
+def run_trace(app, trace, data_dir, trace_file=None):
+    """replay_trace in a fresh interpreter working on the files in `data_dir`."""
+    env = dict(os.environ, EXPLORABLE_PROFILE='1', DATA_CACHE_DIR=os.path.join(data_dir, '.cache'),
+               EXPLORABLE_PROFILE_LOG=os.path.join(data_dir, 'profile.jsonl'))
+    args = [sys.executable, os.path.abspath(__file__), '_trace', app, trace]
+    if trace_file:
+        args.append(os.path.abspath(trace_file))
+    out = subprocess.run(args, cwd=data_dir, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        # e.g. a chart over altair's row limit or the process running out of memory
+        lines = out.stderr.strip().splitlines() or ['exit status {}'.format(out.returncode)]
+        return {'error': next((l for l in lines if re.match(r'[\w.]+(Error|Exception)\b', l)), lines[-1])}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def trace_names(trace_file=None):
+    """[(app, trace name, trace file or None)] to run."""
+    names = [('pulse', t, None) for t in ['multiselect', 'age_sweep', 'random_person']]
+    names += [('innovation', t, None) for t in ['state_multiselect', 'cohort_sweep', 'repeat', 'drill_down']]
+    if trace_file:
+        with open(trace_file) as f:
+            names += [(t['app'], t['name'], trace_file) for t in json.load(f)]
+    return names
+
+
+def compare_baseline(results, baseline):
+    """Print metrics that got worse than TOLERANCE x the baseline; True if there were any."""
+    regressed = False
+    for key, metrics in results.items():
+        if key not in baseline:
+            continue
+        for metric, floor in NOISE_FLOOR.items():
+            if 'error' in metrics and 'error' not in baseline[key]:
+                regressed = True
+                print('REGRESSION {:<40} now fails: {}'.format(key, metrics['error']))
+                break
+            before, after = baseline[key].get(metric), metrics.get(metric)
+            if before and after is not None and after > before * TOLERANCE and after - before > floor:
+                regressed = True
+                print('REGRESSION {:<40} {:<16} {:>12.2f} -> {:>12.2f} ({:.2f}x)'.format(
+                    key, metric, before, after, after / before))
+    if not regressed:
+        print('no regressions against the baseline (tolerance {:.2f}x)'.format(TOLERANCE))
+    return regressed
+
+
+def bench_traces(scales, trace_file=None, save=None, baseline=None):
+    results = {}
+    print('{:<40} {:>10} {:>10} {:>9} {:>9} {:>9} {:>9} {:>12} {:>12}'.format(
+        'app/scale/trace', 'rows', 'startup s', 'first ms', 'p50 ms', 'p90 ms', 'p99 ms', 'peak rss MB', 'chart bytes'))
+    for scale in scales:
+        data_dir = write_synthetic(scale)
+        for app, trace, source in trace_names(trace_file):
+            key = '{}/x{}/{}'.format(app, scale, trace)
+            r = results[key] = run_trace(app, trace, data_dir, source)
+            if 'error' in r:
+                print('{:<40} failed: {}'.format(key, r['error']))
+                continue
+            print('{:<40} {:>10} {:>10.2f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>12.1f} {:>12}'.format(
+                key, r['rows'], r['startup_s'], r['first_ms'], r['p50_ms'], r['p90_ms'], r['p99_ms'],
+                r['peak_rss_mb'], r['max_chart_bytes']))
+            for warning in r['warnings']:
+                print('    {}'.format(warning))
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if baseline:
+        with open(baseline) as f:
+            return compare_baseline(results, json.load(f))
+    return False
+
+
+def load_sessions(app, trace, sessions, seed=0):
+    """
+    Replay `trace` in `sessions` PageSessions of this interpreter at once
+    (see run_sessions), each on its own thread and from a random step;
+    return the metrics. The latencies are the whole reruns as a session
+    sees them, page script and element handling.
+    """
+    import threading
+    import time
+
+    import workers
+
+    # the first page views, before the clock starts
+    pages = [first_view(app)] + [PageSession(app) for _ in range(sessions - 1)]
+    for session in pages[1:]:
+        session.rerun()
+    steps = trace_steps(pages[0], trace)
+    offsets = np.random.default_rng(seed).integers(len(steps), size=sessions)
+    barrier = threading.Barrier(sessions + 1)
+    latencies = [[] for _ in range(sessions)]
+    errors = []
+
+    def replay(i):
+        barrier.wait()
+        try:
+            for j in range(len(steps)):
+                start = time.perf_counter()
+                pages[i].rerun(steps[(offsets[i] + j) % len(steps)])
+                latencies[i].append((time.perf_counter() - start) * 1000)
+        except Exception as error:
+            errors.append(repr(error))
+
+    threads = [threading.Thread(target=replay, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    before = workers.POOL.stats()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = workers.POOL.stats()
+
+    all_latencies = np.concatenate([np.array(l) for l in latencies if l] or [np.zeros(1)])
+    reruns = sum(len(l) for l in latencies)
+    return {
+        'rows': data_rows(app),
+        'sessions': sessions,
+        'workers': workers.COMPUTE_WORKERS,
+        'reruns': reruns,
+        'seconds': elapsed,
+        'reruns_per_s': reruns / elapsed,
+        'p50_ms': float(np.percentile(all_latencies, 50)),
+        'p90_ms': float(np.percentile(all_latencies, 90)),
+        'p99_ms': float(np.percentile(all_latencies, 99)),
+        'max_ms': float(all_latencies.max()),
+        'pool': {k: after[k] - before[k] for k in after},
+        'errors': errors[:5],
+    }
+
+
+def run_sessions(app, trace, sessions, scale):
+    """load_sessions in a fresh interpreter working on the synthetic files of `scale`."""
+    data_dir = write_synthetic(scale)
+    env = dict(os.environ, DATA_CACHE_DIR=os.path.join(data_dir, '.cache'))
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '_sessions', app, trace, str(sessions)],
+                         cwd=data_dir, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        lines = out.stderr.strip().splitlines() or ['exit status {}'.format(out.returncode)]
+        print('{}/x{}/{} failed: {}'.format(app, scale, trace, lines[-1]))
+        return 1
+    r = json.loads(out.stdout.strip().splitlines()[-1])
+    print('{}/x{}/{}: {} sessions, {} reruns in {:.1f} s on {} workers'.format(
+        app, scale, trace, r['sessions'], r['reruns'], r['seconds'], r['workers']))
+    print('{:>12} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'reruns/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'pooled', 'busy'))
+    print('{:>12.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9} {:>9}'.format(
+        r['reruns_per_s'], r['p50_ms'], r['p90_ms'], r['p99_ms'], r['max_ms'], r['pool']['run'], r['pool']['busy']))
+    for error in r['errors']:
+        print('    session failed: {}'.format(error))
+    return 1 if r['errors'] else 0
+
+
+def option(args, name, default=None):
+    if name in args:
+        return args[args.index(name) + 1]
+    return default
+
+
+if __name__ == '__main__':
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else (None, [])
+    if command == 'load':
+        bench_load(args or DEFAULT_FILES)
+    elif command == 'synth' and args:
+        for scale in args:
+            print(write_synthetic(int(scale)))
+    elif command == 'traces':
+        scales = [int(s) for s in option(args, '--scales', ','.join(map(str, DEFAULT_SCALES))).split(',')]
+        sys.exit(1 if bench_traces(scales, option(args, '--trace'), option(args, '--save'),
+                                   option(args, '--baseline')) else 0)
+    elif command == 'sessions':
+        app = option(args, '--app', 'pulse')
+        trace = option(args, '--trace', 'multiselect' if app == 'pulse' else 'state_multiselect')
+        sys.exit(run_sessions(app, trace, int(option(args, '--sessions', 32)), int(option(args, '--scale', 1))))
+    elif command == '_sessions':
+        print(json.dumps(load_sessions(args[0], args[1], int(args[2]))))
+    elif command == '_trace':
+        print(json.dumps(replay_trace(args[0], args[1], args[2] if len(args) > 2 else None)))
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -0,0 +1,188 @@
+"""
+Altair helpers shared by the explorables.
+"""
+from collections import OrderedDict
+import functools
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+from altair.utils.data import to_values
+
+import instrumentation
+from instrumentation import note, span, timed
+from result_cache import freeze
+
+DATUM_REFERENCE = re.compile(r"""datum\.(\w+)|datum\[['"]([^'"]+)['"]\]""")
+
+MAX_TEMPLATES = 256
+PROBE_COLUMN = '__template_data__'
+
+
+def reaggregate_mean(chart, value, groupby=(), as_=None):
+    """
+    Recover mean(value) from cube rows (see aggregation.py) inside Vega-Lite:
+    sums <value>_sum and <value>_count per `groupby` after whatever filters
+    are already on `chart`, then divides. The result is exposed as `as_`
+    (default <value>_mean).
+    """
+    as_ = as_ or value + '_mean'
+    total, n = value + '_total', value + '_n'
+    return chart.transform_aggregate(
+        groupby=list(groupby),
+        **{total: 'sum({}_sum)'.format(value), n: 'sum({}_count)'.format(value)}
+    ).transform_calculate(
+        **{as_: 'datum.{} / datum.{}'.format(total, n)}
+    )
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling: positions of the `n_out`
+    points of the (x-sorted) series that best keep its visual shape. The
+    first and last points are always kept.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = [0]
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # average of the next bucket (or the last point) is the third corner
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        a = keep[-1]
+        area = np.abs((x[a] - next_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (next_y - y[a]))
+        keep.append(start + int(np.nanargmax(area)) if np.isfinite(area).any() else start)
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+@timed('chart:level_of_detail')
+def level_of_detail(df, x, y, series=None, max_points=600):
+    """
+    One row per (x, series) of `df` (already aggregated, e.g. a cube), with
+    every series longer than `max_points` (the chart's pixel width)
+    decimated with lttb_indices, so the line and hover layers stay about the
+    same size however many distinct x values the data has.
+    """
+    groups = df.groupby(series, observed=True, sort=False) if series else [(None, df)]
+    parts = []
+    for _, part in groups:
+        part = part.sort_values(x)
+        parts.append(part.iloc[lttb_indices(part[x].to_numpy(), part[y].to_numpy(), max_points)])
+    return pd.concat(parts, ignore_index=True) if parts else df.head(0)
+
+
+def x_positions(df, x):
+    """The distinct x values of `df`: all a nearest-x hover selector needs."""
+    return df[[x]].drop_duplicates().sort_values(x).reset_index(drop=True)
+
+
+def referenced_names(spec):
+    """
+    Every string in the spec (field names, groupbys, selection fields, ...)
+    plus the names used as datum.<name> in expressions. This over-approximates
+    the fields a chart reads, which is what we want for safe pruning.
+    """
+    names = set()
+    stack = [spec]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(v for k, v in node.items() if k not in ('data', 'datasets'))
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, str):
+            names.add(node)
+            for match in DATUM_REFERENCE.finditer(node):
+                names.add(match.group(1) or match.group(2))
+    return names
+
+
+def payload_size(spec):
+    """Size in bytes of the spec as it goes over the websocket."""
+    return len(json.dumps(spec, separators=(',', ':'), default=str))
+
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+class ChartTemplate:
+    """
+    A chart whose Vega-Lite spec is built and serialized once per structure.
+
+        @chart_template
+        def reasons_chart(reasons, title):
+            return alt.Chart(reasons, title=title).mark_bar().encode(x='sum(agree)', y='reason')
+
+        out.chart(reasons_chart(reasons=in_slice['reasons'], title="In Slice"))
+
+    Calling the template with DataFrames (the data) and other values (the
+    parameters) returns a spec dict. The first call for given parameters and
+    column types runs the build function on a one-row probe of each frame
+    and keeps the resulting spec as JSON, its datasets renamed after the
+    arguments; later calls only parse that JSON and patch in the frames,
+    projected to the fields the spec references. Building the Altair objects
+    and to_dict are out of the rerun path.
+
+    Everything that changes the spec other than the data must be a
+    parameter: the build function must not read page state.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        # pages run as __main__ on every rerun, the file name and function name identify the template
+        self.name = '{}:{}'.format(os.path.basename(build.__code__.co_filename), build.__qualname__)
+        functools.update_wrapper(self, build)
+
+    def __call__(self, **arguments):
+        frames = {k: v for k, v in arguments.items() if isinstance(v, pd.DataFrame)}
+        params = {k: v for k, v in arguments.items() if k not in frames}
+        schema = tuple((k, tuple(df.columns), tuple(str(t) for t in df.dtypes)) for k, df in sorted(frames.items()))
+        key = (self.name, schema, freeze(params))
+        with _compiled_lock:
+            compiled = _compiled.get(key)
+            if compiled is not None:
+                _compiled.move_to_end(key)
+        if compiled is None:
+            compiled = self.compile(frames, params)
+            with _compiled_lock:
+                _compiled[key] = compiled
+                while len(_compiled) > MAX_TEMPLATES:
+                    _compiled.popitem(last=False)
+
+        text, used = compiled
+        with span('chart:patch'):
+            spec = json.loads(text)
+            spec['datasets'] = {name: to_values(df[[c for c in df.columns if c in used]])['values']
+                                for name, df in frames.items()}
+        if instrumentation.ENABLED:  # a json.dumps of the whole spec, only worth it when profiling
+            note('chart_bytes', payload_size(spec))
+        return spec
+
+    def compile(self, frames, params):
+        with span('chart:compile'):
+            probes = {}
+            for name, df in frames.items():
+                probe = df.head(1) if len(df) else df.reindex(range(1))
+                probes[name] = probe.assign(**{PROBE_COLUMN: name})
+            spec = self.build(**probes, **params).to_dict()
+            renamed = {dataset: values[0][PROBE_COLUMN] for dataset, values in spec.pop('datasets', {}).items()}
+            used = referenced_names(spec)
+            text = json.dumps(spec)
+            for dataset, name in renamed.items():
+                text = text.replace(json.dumps(dataset), json.dumps(name))
+        return text, used
+
+
+def chart_template(build):
+    return ChartTemplate(build)
+
@@ -0,0 +1,247 @@
+"""
+Shared data loading for the explorables.
+
+Every CSV is parsed once into a typed columnar file (Parquet) kept in a cache
+directory next to the source. Later loads read that file straight back,
+and it is only rebuilt when the source file's mtime/size changes *and* its
+content hash no longer matches. Replicas sharing a volume therefore parse each
+CSV at most once per source version.
+
+Set DATA_CACHE_DIR to move the cache somewhere else (e.g. a shared volume).
+
+Multi-wave Household Pulse data is streamed instead (see read_waves): only
+the needed columns, in chunks, newest wave first, under a memory budget.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from instrumentation import count, timed
+
+try:
+    import pyarrow  # noqa: F401  (parquet engine)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+CACHE_DIR = os.environ.get("DATA_CACHE_DIR", ".data_cache")
+
+# bump this whenever pin_dtypes changes so old cache files are rebuilt
+CACHE_FORMAT = 1
+
+CATEGORICAL_COLUMNS = [
+    'par_state', 'par_stateabbrv', 'par_czname', 'state',
+    'gender', 'race', 'education', 'age_group', 'sexual_orientation', 'marital_status',
+]
+SMALL_INT_COLUMNS = ['cohort', 'age', 'year']
+
+
+def file_hash(path, block_size=1 << 20):
+    """Return the sha1 hex digest of the file contents."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def pin_dtypes(df):
+    """
+    Convert a freshly parsed frame to compact dtypes: categoricals for the
+    label columns, int16 for cohort/age/year and float32 for every other
+    float column (the rates). Columns are converted in place and df is returned.
+    """
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif col in SMALL_INT_COLUMNS and df[col].notna().all():
+            df[col] = df[col].astype(np.int16)
+        elif df[col].dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def parse_csv(path):
+    """Parse the CSV with the label columns read directly as categoricals."""
+    header = pd.read_csv(path, nrows=0).columns
+    dtype = {c: 'category' for c in header if c in CATEGORICAL_COLUMNS}
+    return pin_dtypes(pd.read_csv(path, dtype=dtype))
+
+
+def cache_paths(path):
+    # files with the same name in different folders (e.g. American Inventors/) get their own cache
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    name = '{}.{}'.format(os.path.basename(path), digest)
+    return (os.path.join(CACHE_DIR, name + '.parquet'),
+            os.path.join(CACHE_DIR, name + '.meta.json'))
+
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {'mtime': st.st_mtime_ns, 'size': st.st_size, 'format': CACHE_FORMAT}
+
+
+def read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomic(path, write):
+    # several replicas may rebuild at once, so never expose a half-written file
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_meta(meta_path, meta):
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+    write_atomic(meta_path, write)
+
+
+@timed('load:read_dataset')
+def read_dataset(path):
+    """
+    Load the CSV at `path` as a typed DataFrame, going through the columnar
+    cache. Falls back to a plain typed parse if pyarrow is not installed.
+    """
+    if not HAS_PARQUET:
+        return parse_csv(path)
+
+    data_path, meta_path = cache_paths(path)
+    stamp = source_stamp(path)
+    meta = read_meta(meta_path)
+
+    if meta is not None and os.path.exists(data_path):
+        cached_stamp = {k: meta.get(k) for k in stamp}
+        if cached_stamp == stamp:
+            count('parquet_cache', 'hit')
+            return pd.read_parquet(data_path)
+        # the file was touched (e.g. a fresh checkout); only rebuild if the content differs
+        if meta.get('format') == CACHE_FORMAT and meta.get('sha1') == file_hash(path):
+            write_meta(meta_path, dict(meta, **stamp))
+            count('parquet_cache', 'hit')
+            return pd.read_parquet(data_path)
+
+    count('parquet_cache', 'miss')
+    df = parse_csv(path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    write_atomic(data_path, lambda tmp: df.to_parquet(tmp, index=False))
+    write_meta(meta_path, dict(stamp, sha1=file_hash(path), source=os.path.abspath(path)))
+    return df
+
+
+def dataset_version(path):
+    """
+    Cheap version id for the source file (mtime and size), used to key
+    anything derived from a loaded dataset. `path` may also be a list of
+    files (e.g. all Pulse waves).
+    """
+    if not isinstance(path, str):
+        return '|'.join(dataset_version(p) for p in sorted(path))
+    stamp = source_stamp(path)
+    return '{mtime}-{size}'.format(**stamp)
+
+
+def discover_waves(pattern='pulse*.csv'):
+    """
+    {wave number: path} for every file matching `pattern` whose name carries
+    the wave number (pulse39.csv -> 39).
+    """
+    waves = {}
+    for path in glob.glob(pattern):
+        match = re.search(r'(\d+)\D*$', os.path.basename(path))
+        if match:
+            waves[int(match.group(1))] = path
+    return dict(sorted(waves.items()))
+
+
+def missing_column(like, rows):
+    """An all-missing column of `rows` rows for a chunk without column `like` (a part from another chunk)."""
+    if isinstance(like.dtype, pd.CategoricalDtype):
+        return pd.Series(pd.Categorical.from_codes(np.full(rows, -1), categories=like.cat.categories[:0]))
+    return pd.Series(np.full(rows, np.nan, dtype=np.float32))
+
+
+def combine_chunks(chunks):
+    """
+    Concatenate typed chunks. Categoricals are unioned column by column so
+    they stay categorical (pd.concat would fall back to object). Chunks may
+    have different columns (e.g. waves asking different questions): the
+    result has all of them, missing in the chunks without them.
+    """
+    if not chunks:
+        return pd.DataFrame()
+    columns = {}
+    for col in dict.fromkeys(col for c in chunks for col in c.columns):
+        like = next(c[col] for c in chunks if col in c.columns)
+        parts = [c[col] if col in c.columns else missing_column(like, len(c)) for c in chunks]
+        if isinstance(like.dtype, pd.CategoricalDtype):
+            columns[col] = pd.Series(union_categoricals(parts, ignore_order=True))
+        else:
+            if len(parts) > sum(col in c.columns for c in chunks) and like.dtype.kind in 'biu':
+                # integer and bool columns can not hold the missing values
+                parts = [p.astype(np.float32) for p in parts]
+            columns[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+@timed('load:read_waves')
+def read_waves(waves, usecols=None, chunksize=100_000, memory_budget_mb=None):
+    """
+    Stream the wave files ({wave: path}, see discover_waves) into one typed
+    frame with a `wave` column. Only `usecols` (a list or a callable, as in
+    pd.read_csv) are parsed, label columns are read as categoricals and every
+    chunk goes through pin_dtypes before it is kept.
+
+    Waves are read newest first. When the next chunk would push the frame past
+    `memory_budget_mb`, loading stops and the skipped waves are listed in
+    df.attrs['skipped_waves'] (with a warning). The budget covers the peak of
+    the load: the kept chunks and the combined frame, alive together while
+    combine_chunks runs.
+    """
+    budget = memory_budget_mb * 2**20 if memory_budget_mb else None
+    chunks, used, loaded, skipped = [], 0, [], []
+    for wave in sorted(waves, reverse=True):
+        if skipped:
+            skipped.append(wave)
+            continue
+        path = waves[wave]
+        header = pd.read_csv(path, nrows=0, usecols=usecols).columns
+        dtype = {c: 'category' for c in header if c in CATEGORICAL_COLUMNS}
+        wave_chunks = []
+        for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize):
+            chunk = pin_dtypes(chunk)
+            chunk['wave'] = np.int16(wave)
+            # counted twice, once as a chunk and once in the combined frame
+            size = 2 * chunk.memory_usage(deep=True).sum()
+            if budget is not None and used + size > budget:
+                break
+            used += size
+            wave_chunks.append(chunk)
+        else:
+            chunks.extend(wave_chunks)
+            loaded.append(wave)
+            continue
+        # a partially read wave would skew every statistic, drop it whole
+        used -= sum(2 * c.memory_usage(deep=True).sum() for c in wave_chunks)
+        skipped.append(wave)
+
+    df = combine_chunks(chunks)
+    df.attrs['waves'] = sorted(loaded)
+    df.attrs['skipped_waves'] = sorted(skipped)
+    if skipped:
+        warnings.warn('memory budget of {} MB reached, skipped Pulse waves {}'.format(
+            memory_budget_mb, sorted(skipped)))
+    return df
@@ -1,282 +1,444 @@
+import os
 import streamlit as st
 st.set_page_config(layout="wide")  # increase the width of web page
-import pandas as pd
 import altair as alt
-from re import U
+
+from aggregation import build_cube, comparison_table, pair_table
+from backends import PandasBackend, SQLBackend
+from charts import chart_template, level_of_detail, reaggregate_mean, x_positions
+from data_store import dataset_version
+from instrumentation import begin_rerun, end_rerun
+from pages import Page, multiselect, range_slider
+from ranking import Rankings, top_k
+from shared_store import open_dataset
+from slicing import SliceIndex, filter_key
+from tables import TableView, data_table
+from weighting import WeightedStats, estimate
+from zones import ZoneIndex
+
+begin_rerun('innovation')  # no-op unless EXPLORABLE_PROFILE=1, see instrumentation.py
 
 st.title("What are the factors can impact innovation in America?")
 
-@st.cache  # add caching so we load the data only once
-def load_data(file_path):
-    return pd.read_csv(file_path)
-@st.cache
-def get_slice_membership(df, states, cohort_range):
+# the folder with the csv files, so copies of the page (e.g. American Inventors/) can run on their own data
+DATA_DIR = os.environ.get("INNOVATION_DATA_DIR", ".")
+STATE_DATA = os.path.join(DATA_DIR, 'Innovation by Current State, Year of Birth and Age.csv')
+INVENTOR_DATA = os.path.join(DATA_DIR, 'invention.csv')
+STATE_VERSION = dataset_version(STATE_DATA)
+INVENTOR_VERSION = dataset_version(INVENTOR_DATA)
+
+# group-bys behind the charts, computed once per dataset version (see aggregation.py)
+STATE_CUBE = {
+    'state': (['state'], ['num_grants']),
+    'cohort_age': (['cohort', 'age'], ['num_grants']),
+    'year_cohort': (['year', 'cohort'], ['num_grants']),
+}
+
+def build_slice_index(df):
+    """The bitmap/sorted index over the slicing columns (see slicing.py)."""
+    return SliceIndex(df, categorical=['state'], ranges=['cohort'])
+
+# the states the story starts with; the drill-down below can pick any others
+TOP3_STATES = ['Vermont', 'California', 'Massachusetts']
+
+def top_grant_states(state_cube, k):
+    """The `k` states with the highest average number of grants."""
+    states = state_cube['state']
+    return states['state'].iloc[top_k(states['num_grants_mean'].to_numpy(), k)].tolist()
+
+def peak(table, column, width=1):
     """
-    Implement a function that computes which rows of the given dataframe should
-    be part of the slice, and returns a boolean pandas Series that indicates 0
-    if the row is not part of the slice, and 1 if it is part of the slice.
-    
-    In the example provided, we assume genders is a list of selected strings
-    (e.g. ['Male', 'Transgender']). We then filter the labels based on which
-    rows have a value for gender that is contained in this list. You can extend
-    this approach to the other variables based on how they are returned from
-    their respective Streamlit components.
+    First and last `column` value of the `width` consecutive values with the
+    highest average number of grants, None if there are none.
     """
-    labels = pd.Series([1] * len(df), index=df.index)
+    totals = table.groupby(column)[['num_grants_sum', 'num_grants_count']].sum()
+    windows = totals.rolling(width).sum().iloc[width - 1:]
+    best = top_k((windows['num_grants_sum'] / windows['num_grants_count']).to_numpy(), 1)
+    if not len(best):
+        return None
+    return totals.index[best[0]], totals.index[best[0] + width - 1]
+
+# technology categories of the inventor_cat_* / top5cit_cat_* columns (NBER patent classification)
+CATEGORY_NAMES = {
+    1: 'Chemical', 2: 'Computers and Communications', 3: 'Drugs and Medical', 4: 'Electrical and Electronic',
+    5: 'Mechanical', 6: 'Others', 7: 'Design and Plant',
+}
+
+def and_join(names):
+    names = [str(n) for n in names]
+    return ' and '.join([', '.join(names[:-1]), names[-1]]) if len(names) > 1 else ''.join(names)
+
+def top_states_finding(rankings, states):
+    top_inventor = rankings.states('inventor', 1, states)['par_state'].tolist()
+    top_cited = rankings.states('top5cit', 1, states)['par_state'].tolist()
+    if not (top_inventor and top_cited):
+        return "Pick some states above to compare them"
+    return "{} has the highest average inventor rate and {} is the top 1 state with the average highly cited inventor rate" \
+        .format(top_inventor[0], top_cited[0])
+
+# optional database file (table `innovation_state`) the slice metrics are queried from, see backends.py
+QUERY_DB = os.environ.get("EXPLORABLE_DB")
+# its mtime and size key the cached query results, so a rewritten file is queried again
+QUERY_DB_VERSION = dataset_version(QUERY_DB) if QUERY_DB else None
+
+def build_inventor_index(df):
+    return SliceIndex(df, categorical=['par_state'])
+
+# inventor rates per kid: each row stands for kid_count kids (see weighting.py)
+INVENTOR_RATES = ['inventor', 'top5cit']
+
+def build_inventor_stats(df, index):
+    return WeightedStats(df, index, INVENTOR_RATES, INVENTOR_VERSION, weight='kid_count',
+                         frequency=True, proportions=INVENTOR_RATES)
+
+def build_state_stats(backend):
+    # the state file has no population counts, its rows are weighted equally
+    return backend.weighted(['num_grants'], STATE_VERSION)
+
+def interval(row, fmt):
+    return "95% CI {} to {}".format(fmt.format(row['low']), fmt.format(row['high']))
+
+def build_backend(df, index):
+    if QUERY_DB:
+        return SQLBackend(QUERY_DB, 'innovation_state')
+    return PandasBackend(df, index)
+
+def compare_states(backend, cohort_range):
+    """Mean number of grants of every state in the cohort range, side by side (see backends.py)."""
+    labels, summaries = backend.compare_groups(['state'], ranges={'cohort': cohort_range}, means=['num_grants'])
+    return comparison_table(labels, summaries, by=['state'])
+
+CHART_WIDTH = 600  # pixels; the line charts never carry more points per series than this
+
+# Chart specs are compiled once and only get their data patched on reruns (see charts.chart_template)
+
+@chart_template
+def state_grants_chart(states):
+    brush = alt.selection(type='interval', encodings =['x'])
+    bars = alt.Chart().mark_bar().encode(
+            x=alt.X("state", sort='y', scale=alt.Scale(zero=False)),
+            y=alt.Y(field = "num_grants_mean", type ='quantitative', title = "Mean of num_grants", scale=alt.Scale(zero=False))
+        ).properties(
+            width=700, height=400
+        ).add_selection(brush).interactive()
+
+    line = reaggregate_mean(alt.Chart().transform_filter(brush), 'num_grants').mark_rule(color='pink').encode(
+          y='num_grants_mean:Q',
+          size=alt.SizeValue(3)
+    )
+    return alt.layer(bars, line, data=states)
+
+@chart_template
+def state_rates_chart(rates):
+    def rate_chart(measure, title):
+        # kid-weighted rate of each state with its 95% interval
+        rate = alt.Chart(rates).transform_filter(alt.datum.measure == measure)
+        bars = rate.mark_bar().encode(
+           y= alt.Y("par_state", title = "Childhood State"),
+           x= alt.X("mean:Q", title = title)
+        )
+        error = rate.mark_rule(color='black').encode(y='par_state', x='low:Q', x2='high:Q')
+        return alt.layer(bars, error).properties(height=200, width=360)
+
+    avg_inventor_state_chart = rate_chart('inventor', "Average Inventor Rate by State")
+    top5Cited_chart = rate_chart('top5cit', "Average Highly Cited Inventor Rate by State")
+
+    # Go horizontal: one concatenated chart so both sides share a single copy of the state table
+    return avg_inventor_state_chart | top5Cited_chart
+
+@chart_template
+def zone_rates_chart(zones):
+    return reaggregate_mean(alt.Chart(zones), 'top5cit', groupby=['par_czname']).mark_bar().encode(
+       alt.Y("par_czname", sort = '-x' , title = 'Childhood Commuting Zone of Residence'), # descending order
+       alt.X("top5cit_mean:Q", title = "Average Highly Cited Inventor Rate")
+    ).properties(
+       height=360, width=600
+    )
+
+@chart_template
+def state_zone_brush_chart(pairs):
+    state_brush = alt.selection_multi(fields=['par_state'])
+    zone_brush = alt.selection_multi(fields=['par_czname'])
+
+    # brushes filter the state x zone table of the rollups, the means are recomputed from sum/count afterwards
+    state_chart = reaggregate_mean(
+        alt.Chart(pairs).transform_filter(zone_brush), 'top5cit', groupby=['par_state']
+    ).mark_bar().encode(
+        x= alt.X("top5cit_mean:Q", title = "average highly cited rates by state"),
+        y= alt.Y('par_state', sort='x', title = "Childhood State"),
+        color= alt.condition(state_brush, alt.value('steelblue'), alt.value('lightgray'))
+    ).add_selection(state_brush).interactive()
+
+    zone_chart = reaggregate_mean(
+        alt.Chart(pairs).transform_filter(state_brush), 'top5cit', groupby=['par_czname']
+    ).mark_bar().encode(
+        x= alt.X('top5cit_mean:Q', title ="average highly cited rates by zone"),
+        y= alt.Y('par_czname', sort='-x', title = "Childhood Commuting Zone of Residence"),
+        color= alt.condition(zone_brush, alt.value('pink'), alt.value('lightgray'))
+    ).add_selection(zone_brush).interactive()
+
+    return state_chart & zone_chart
+
+@chart_template
+def grants_over_chart(series, xs, x, color, mark, title):
+    """Mean grants per `x`, one `mark` series per `color`, with a nearest-x hover readout."""
+    # create Tooltip, below code are referenced from https://altair-viz.github.io/gallery/multiline_tooltip.html
+
+    nearest = alt.selection(type='single', nearest=True, on='mouseover',fields=[x], empty='none')
+
+    line = getattr(alt.Chart(series), 'mark_' + mark)(interpolate='basis').encode(
+                       x= alt.X(x, scale=alt.Scale(zero=False), title = title), 
+                       y= alt.Y(field = "num_grants_mean", type ='quantitative', sort='-y', scale=alt.Scale(zero=False), title = "average number of patents grants per individual"),
+                       color = alt.Color(color)
+                    )
+    selectors = alt.Chart(xs).mark_point().encode(
+        x=x + ':Q',
+        opacity=alt.value(0)).add_selection(nearest)
+
+    # Draw points on the line, and highlight based on selection
+    points = line.mark_point().encode(
+        opacity=alt.condition(nearest, alt.value(1), alt.value(0))
+    )
+    # Draw text labels near the points, and highlight based on selection
+    text = line.mark_text(align='left', dx=5, dy=-5).encode(
+        text=alt.condition(nearest, 'num_grants_mean:Q', alt.value(' '))
+    )
+    # Draw a rule at the location of the selection
+    rules = alt.Chart(xs).mark_rule(color='gray').encode(
+        x=x + ':Q',
+    ).transform_filter(
+        nearest
+    )
+    # Put the five layers into a chart and bind the data
+    return alt.layer(
+        line, selectors, points, rules, text
+    ).properties(
+        width=CHART_WIDTH, height=300
+    )
 
-    if states:
-        labels &= df['state'].isin(states)
-    if cohort_range is not None:
-        labels &= df['cohort'] >= cohort_range[0]
-        labels &= df['cohort'] <= cohort_range[1]
-    return labels
+@chart_template
+def state_comparison_chart(table):
+    return alt.Chart(table).mark_bar().encode(
+        x=alt.X('state', sort='-y', title='State'),
+        y=alt.Y('value:Q', title='Mean of num_grants'),
+        color=alt.condition(alt.datum.picked, alt.value('steelblue'), alt.value('lightgray')),
+        tooltip=['state', 'size', alt.Tooltip('value:Q', format='.3f')]
+    ).properties(width=700, height=300)
+
+# The datasets of the page are declared on a Page (see pages.py): each one is warmed
+# up in the background and loaded once per data version (typed columnar cache, shared
+# across processes with SHARED_DATA=1, see shared_store.py)
+page = Page('innovation')
+page.dataset('state', open_dataset, STATE_DATA, version=STATE_VERSION)
+page.dataset('inventor', open_dataset, INVENTOR_DATA, version=INVENTOR_VERSION)
+page.dataset('state_cube', build_cube, STATE_CUBE, after=['state'], cpu=True)
+page.dataset('slice_index', build_slice_index, after=['state'], cpu=True)
+page.dataset('zones', ZoneIndex, after=['inventor'], cpu=True)
+page.dataset('rankings', Rankings, INVENTOR_VERSION, after=['zones'])
+page.dataset('backend', build_backend, after=['state', 'slice_index'], version=QUERY_DB_VERSION)
+page.dataset('state_stats', build_state_stats, after=['backend'], cpu=True)
+page.dataset('inventor_index', build_inventor_index, after=['inventor'], cpu=True)
+page.dataset('inventor_stats', build_inventor_stats, after=['inventor', 'inventor_index'], cpu=True)
+# the raw data is shown one page at a time (see tables.py)
+page.dataset('state_table', TableView, STATE_VERSION, after=['state'], cpu=True)
+page.dataset('inventor_table', TableView, INVENTOR_VERSION, after=['inventor'], cpu=True)
+page.start()
 
 
 #############################################################################################################
 ################################################### Main Code ###############################################
 #############################################################################################################
 st.header("Part1. The Importance of Exposure to Innovation")
-df = load_data('Innovation by Current State, Year of Birth and Age.csv')
+df = page.get('state')
+state_cube = page.get('state_cube')
 st.text("Let's look at the dataset - Innovation by Current State, Year of Birth and Age")
 
 # show dataframe or not
 if st.checkbox("Show Raw Data"):
-    st.write(df)
+    data_table(page.get('state_table'), 'state_table')
 
-st.subheader("Which state has the highest average number of grants per individual over the years?")
+# Each section below is only rebuilt when its inputs change, otherwise its output
+# is replayed from the section cache (see sections.py)
+def state_grants(out):
+    out.subheader("Which state has the highest average number of grants per individual over the years?")
 
-brush = alt.selection(type='interval', encodings =['x'])
-bars = alt.Chart(df).mark_bar().encode(
-        x=alt.X("state", sort='y', scale=alt.Scale(zero=False)),
-        y=alt.Y(field = "num_grants", aggregate = 'mean', type ='quantitative', scale=alt.Scale(zero=False))
-    ).properties(
-        width=700, height=400
-    ).add_selection(brush).interactive()
+    out.chart(state_grants_chart(states=state_cube['state']))
 
-line = alt.Chart().mark_rule(color='pink').encode(
-      y='mean(num_grants):Q',
-      size=alt.SizeValue(3)
-).transform_filter(
-    brush
-)
+    top3 = page.cached('top_grant_states', ['state_cube'], 3, top_grant_states, state_cube, 3)
+    out.subheader("The top 3 states are {}".format(and_join(top3)))
+    out.subheader("Let us dig deeper to find out possible reasons.")
 
-st.write(alt.layer(bars, line, data=df))
+page.section('state_grants', state_grants, inputs=['state_cube'])
 
-st.subheader("The top 3 states are Vermont, Masschusetts and California")
-st.subheader("It is not surprising that MA and CA are within the top states, but why Vermont? \
-              Let us dig deeper to find out possible reasons.")
+zone_index = page.get('zones')
+rankings = page.get('rankings')
+inventor_stats = page.get('inventor_stats')
+inventor_table = page.get('inventor_table')
 
 st.write("Inventors in America: Commuting Zone Innovation Rates by Childhood Commuting Zone, Gender, and Parent Income")
-inventor = load_data('invention.csv')
-st.write(inventor)
-
-avg_inventor_state_chart = alt.Chart(inventor).mark_bar().encode(
-   y= alt.Y("par_state", title = "Childhood State"),
-   x= alt.X("average(inventor)", title = "Average Inventor Rate by State")
-).transform_filter(
-   alt.FieldOneOfPredicate(field='par_state', oneOf =['Vermont', 'California', 'Massachusetts'])
-).properties(
-   height=200, width=360
-)
-
-top5Cited_chart = alt.Chart(inventor).mark_bar().encode(
-   y= alt.Y("par_state", title = "Childhood State"), 
-   x= alt.X("average(top5cit)", title = "Average Highly Cited Inventor Rate by State")
-).transform_filter(
-   alt.FieldOneOfPredicate(field='par_state', oneOf =['Vermont', 'California', 'Massachusetts'])
-).properties(
-   height=200, width=360
-)
-
-# Go horizontal with columns: referenced from https://blog.streamlit.io/introducing-new-layout-options-for-streamlit/
-cols = st.columns(2)
-with cols[0]:
-    st.write(avg_inventor_state_chart, use_column_width=True)
-with cols[1]:
-    st.write(top5Cited_chart,use_column_width=True)
-
-st.subheader("Vermont has the highest average inventor rate and Masschusetts is the top 1 state with the average higly cited inventor rate")
-
-
-st.subheader("Let us look into commuting zones for these top 3 states(CA, MA and VT)")
-top5Cited_zone = alt.Chart(inventor).mark_bar().encode(
-   alt.Y("par_czname", sort = '-x' , title = 'Childhood Commuting Zone of Residence'), # descending order
-   alt.X("average(top5cit)", title = "Average Highly Cited Inventor Rate")
-).transform_filter(
-   alt.FieldOneOfPredicate(field='par_state', oneOf =['Vermont', 'California', 'Massachusetts'])
-).properties(
-   height=360, width=600
-)
-st.write(top5Cited_zone)
-
-st.text("let us add a state brush then we will know which zone is from which state")
-state_brush = alt.selection_multi(fields=['par_state'])
-zone_brush = alt.selection_multi(fields=['par_czname'])
-
-top3State = ['Vermont', 'California', 'Massachusetts']
-top3InventorState = inventor[inventor['par_state'].isin(top3State)]
-
-st.write(top3InventorState)
-
-
-state_chart = alt.Chart(top3InventorState).mark_bar().encode(
-    x= alt.X("average(top5cit)", title = "average highly cited rates by state"),
-    y= alt.Y('par_state', sort='x', title = "Childhood State"),
-    color= alt.condition(state_brush, alt.value('steelblue'), alt.value('lightgray'))
-).transform_filter(zone_brush).add_selection(state_brush).interactive()
-
-zone_chart = alt.Chart(top3InventorState).mark_bar().encode(
-    x= alt.X('average(top5cit)', title ="average highly cited rates by zone"),
-    y= alt.Y('par_czname', sort='-x', title = "Childhood Commuting Zone of Residence"),
-    color= alt.condition(zone_brush, alt.value('pink'), alt.value('lightgray'))
-).transform_filter(state_brush).add_selection(zone_brush).interactive()
-
-st.altair_chart(state_chart & zone_chart)
-
-
-st.subheader("Vermont has the highest average inventor rate and Masschusetts is the top 1 state with the average higly cited inventor rate")
-st.subheader("From interactive charts above, we can see that childhood commuting zone of residence: \
-              Oak Bluffs in MA is top No.1 with highest share of children with patent\
-              citations in the top 5 percent of their birth cohort (using total number of citations).\
-              Let us find out which inventor cateogry(s) contribute to this result :)")
-
-top5_CZ = ['Oak Bluffs', 'Claremont', 'Burlington', 'San Francisco', 'Santa Barbara']
-top_state = ['CA', 'MA', 'VT']
-top5Zone = inventor[inventor['par_czname'].isin(top5_CZ)]
-top5ZoneState = top5Zone[top5Zone['par_stateabbrv'].isin(top_state)]
-st.text("top5cit_zone&state")
-st.write(top5ZoneState)
-
-
-top5ZoneState_top5cit = top5ZoneState[['par_czname', 'top5cit_cat_1','top5cit_cat_2','top5cit_cat_3','top5cit_cat_4','top5cit_cat_5','top5cit_cat_6','top5cit_cat_7']]
-
-top5ZoneState_top5cit["id"] = top5ZoneState_top5cit.index
-top5_cit_category = pd.wide_to_long(top5ZoneState_top5cit,["top5cit_cat_"], i = "id", j ="seq")
-top5_cit_category_sorted = top5_cit_category.sort_values(['par_czname', 'top5cit_cat_'], ascending=[True, False])
-st.text("top5_cit_zone sorted by category value")
-st.write(top5_cit_category_sorted)
-
-st.text("-> Burlington, VT has three highly cited category which are 4 -Electrical and Electronic, 2-Computers and Communications , 5-Mechanical ")
-st.text("-> Claremont, VT has two highly cited category which are 7 - Design and Plant, 3 - Drugs and Medical")
-st.text("-> Oak Bluffs, MA has one highly cited category which is 3 - Drugs and Medical")
-st.text("-> San Francisco, CA has one highly cited category which is 2 - Computers and Communications ")
-st.text("-> Santa Barbara, CA has one highly cited category which is 6 - Others")
-
-st.subheader("Among the top 5 highly cited zones, Vermont shares 2 of 5. And Vermont’s patent category covers 5 categories out of 7. That concludes why Vermont is the top 1 inventor state in the U.S.  ")
-st.subheader("Massachusetts is the Drugs and Medical inventor incubator state, And California, no surprise, is the state where Computers and Communications inventors grew up. ")
-st.markdown("This project was created by Cuiting Li and Haoyu Wang for the [Interactive Data Science](https://dig.cmu.edu/ids2022) course at [Carnegie Mellon University](https://www.cmu.edu).")
-
+data_table(inventor_table, 'inventor_table')
+
+# drill-down: every state/zone pick below is a lookup in the zone index (see zones.py),
+# rates are weighted by the number of kids in each row
+drill_states = st.multiselect("Childhood states to drill into", zone_index.state_names(),
+                              default=TOP3_STATES, key='drill_states')
+
+def inventor_states(out):
+    if not drill_states:
+        # an empty pick does not filter the grouped rates, it would chart every state
+        out.subheader(top_states_finding(rankings, drill_states))
+        return
+    rates = inventor_stats.groups(['par_state'], {'par_state': [zone_index.state(s) for s in drill_states]})
+    out.chart(state_rates_chart(rates=rates), use_container_width=True)
+
+    out.subheader(top_states_finding(rankings, drill_states))
+
+
+    out.subheader("Let us look into commuting zones for these states ({})".format(and_join(drill_states)))
+    state_zones = zone_index.zones_in(drill_states)
+    out.chart(zone_rates_chart(zones=state_zones))
+
+    out.text("let us add a state brush then we will know which zone is from which state")
+
+page.section('inventor_states', inventor_states, inputs=['zones', 'inventor_stats'], widgets=['drill_states'])
+
+data_table(inventor_table, 'state_rows', rows=zone_index.state_rows(drill_states))
+
+def state_zone_brushes(out):
+    state_zone_pairs = pair_table(zone_index.zones_in(drill_states), ['par_state', 'par_czname'], ['top5cit'])
+    out.chart(state_zone_brush_chart(pairs=state_zone_pairs))
+
+page.section('state_zone_brushes', state_zone_brushes, inputs=['zones'], widgets=['drill_states'])
+
+# defaults to the most highly cited zones of the picked states, again whenever the states change
+# (a keyed widget only takes its default on the first run)
+if st.session_state.get('drill_zones_states') != drill_states:
+    st.session_state['drill_zones_states'] = drill_states
+    st.session_state['drill_zones'] = rankings.zones('top5cit', 5, drill_states)['par_cz'].tolist()
+drill_zones = st.multiselect("Childhood commuting zones to drill into", zone_index.zones_in(drill_states)['par_cz'].tolist(),
+                             format_func=zone_index.label, key='drill_zones')
+
+
+def top_zones(out):
+    out.subheader(top_states_finding(rankings, drill_states))
+    top_zone = rankings.zones('top5cit', 1, drill_states)
+    if len(top_zone):
+        out.subheader("From interactive charts above, we can see that childhood commuting zone of residence: \
+                      {} in {} is top No.1 with highest share of children with patent\
+                      citations in the top 5 percent of their birth cohort (using total number of citations).\
+                      Let us find out which inventor cateogry(s) contribute to this result :)"
+                      .format(top_zone['par_czname'][0], top_zone['par_stateabbrv'][0]))
+
+    out.text("top5cit_zone&state")
+
+page.section('top_zones', top_zones, inputs=['rankings'], widgets=['drill_states'])
+
+data_table(inventor_table, 'zone_rows', rows=zone_index.rows(drill_zones))
+
+def zone_categories(out):
+    # categories with highly cited inventors per zone, ranked in the zone table (see ranking.py)
+    categories = rankings.categories('top5cit_cat_', drill_zones)
+    out.text("top5_cit_zone categories ranked by value")
+    out.write(categories.assign(category=categories['category'].map(CATEGORY_NAMES)))
+
+    leading = categories[categories['rank'] <= 3]
+    for cz in drill_zones:
+        zone = leading[leading['par_cz'] == cz]
+        if len(zone) == 0:
+            out.text("-> {} has no highly cited category".format(zone_index.label(cz)))
+            continue
+        names = ', '.join('{} - {}'.format(c, CATEGORY_NAMES.get(c, c)) for c in zone['category'])
+        if len(zone) == 1:
+            out.text("-> {} has one highly cited category which is {}".format(zone_index.label(cz), names))
+        else:
+            out.text("-> {}'s top {} highly cited categories are {}".format(zone_index.label(cz), len(zone), names))
+
+    if len(categories):
+        # the state with most of the picked zones, and the categories its zones cover
+        zone_states = zone_index.zones['par_state'].iloc[[zone_index.zone_position[cz] for cz in drill_zones]]
+        lead_state = zone_states.value_counts().index[0]
+        covered = categories.loc[categories['par_state'] == lead_state, 'category'].nunique()
+        out.subheader("Among the {} highly cited zones, {} shares {} of {}. And {}’s patent category covers {} categories out of {}."
+                      .format(len(drill_zones), lead_state, (zone_states == lead_state).sum(), len(drill_zones),
+                              lead_state, covered, len(CATEGORY_NAMES)))
+        by_state = categories.groupby(['par_state', 'category'], observed=True)['top5cit_cat_'].sum()
+        incubators = ['{} is the {} inventor incubator state'.format(state, CATEGORY_NAMES.get(category, category))
+                      for state, category in by_state.groupby(level=0, observed=True).idxmax().str[1].items()]
+        out.subheader(and_join(incubators) + '.')
+    out.markdown("This project was created by Cuiting Li and Haoyu Wang for the [Interactive Data Science](https://dig.cmu.edu/ids2022) course at [Carnegie Mellon University](https://www.cmu.edu).")
+
+page.section('zone_categories', zone_categories, inputs=['rankings'], widgets=['drill_states', 'drill_zones'])
 
 
 st.header("Part2. The year most inventors were born")
 
+COHORT_RANGE = 6  # birth years per cohort range in the findings below
 
-st.text("The dataset reports patenting outcomes for individuals aged 20 to 80 in years 1996-2012 by year of birth")
-
-
-# create Tooltip, below code are referenced from https://altair-viz.github.io/gallery/multiline_tooltip.html
-
-nearest = alt.selection(type='single', nearest=True, on='mouseover',fields=['x'], empty='none')
-
-line = alt.Chart(df).mark_line(interpolate='basis').encode(
-                   x= alt.X('cohort', scale=alt.Scale(zero=False), title = "Year of Birth"), 
-                   y= alt.Y(field = "num_grants", aggregate = 'mean', type ='quantitative', sort='-y', scale=alt.Scale(zero=False), title = "average number of patents grants per individual"),
-                   color = alt.Color('age')
-                )
-selectors = alt.Chart(df).mark_point().encode(
-    x='x:Q',
-    opacity=alt.value(0)).add_selection(nearest)
-
-# Draw points on the line, and highlight based on selection
-points = line.mark_point().encode(
-    opacity=alt.condition(nearest, alt.value(1), alt.value(0))
-)
-# Draw text labels near the points, and highlight based on selection
-text = line.mark_text(align='left', dx=5, dy=-5).encode(
-    text=alt.condition(nearest, 'y:Q', alt.value(' '))
-)
-# Draw a rule at the location of the selection
-rules = alt.Chart(df).mark_rule(color='gray').encode(
-    x='x:Q',
-).transform_filter(
-    nearest
-)
-# Put the five layers into a chart and bind the data
-layer = alt.layer(
-    line, selectors, points, rules, text
-).properties(
-    width=600, height=300
-)
-st.altair_chart(layer)
-
-st.subheader("Cohort Range (1960 - 1965) has the highest average number of patents grants per individual")
-
-nearest = alt.selection(type='single', nearest=True, on='mouseover',fields=['x'], empty='none')
-
-line = alt.Chart(df).mark_bar(interpolate='basis').encode(
-                   x= alt.X('year', scale=alt.Scale(zero=False), title = "Calendar Year"), 
-                   y= alt.Y(field = "num_grants", aggregate = 'mean', type ='quantitative', sort='-y', scale=alt.Scale(zero=False), title = "average number of patents grants per individual"),
-                   color= alt.Color('cohort')
-                )
-selectors = alt.Chart(df).mark_point().encode(
-    x='x:Q',
-    opacity=alt.value(0)).add_selection(nearest)
-
-# Draw points on the line, and highlight based on selection
-points = line.mark_point().encode(
-    opacity=alt.condition(nearest, alt.value(1), alt.value(0))
-)
-# Draw text labels near the points, and highlight based on selection
-text = line.mark_text(align='left', dx=5, dy=-5).encode(
-    text=alt.condition(nearest, 'y:Q', alt.value(' '))
-)
-# Draw a rule at the location of the selection
-rules = alt.Chart(df).mark_rule(color='gray').encode(
-    x='x:Q',
-).transform_filter(
-    nearest
-)
-# Put the five layers into a chart and bind the data
-layer2 = alt.layer(
-    line, selectors, points, rules, text
-).properties(
-    width=600, height=300
-)
-st.altair_chart(layer2)
-
-st.subheader("Calendar year 2003 has the highest average number of patents grants per individual.")               
-st.markdown(
-    """
-    #### Inventors aged around 40 (=2003 -1963) are most productive per average number of patents grants per individual :sunglasses:
-    """
-    )
+def birth_cohorts(out):
+    out.text("The dataset reports patenting outcomes for individuals aged 20 to 80 in years 1996-2012 by year of birth")
+
+    # one row per (cohort, age), each age series decimated to at most one point per pixel
+    cohort_age = level_of_detail(state_cube['cohort_age'], 'cohort', 'num_grants_mean', series='age', max_points=CHART_WIDTH)
+    out.chart(grants_over_chart(series=cohort_age, xs=x_positions(cohort_age, 'cohort'),
+                                x='cohort', color='age', mark='line', title="Year of Birth"))
+
+    cohorts = peak(state_cube['cohort_age'], 'cohort', width=COHORT_RANGE)
+    if cohorts:
+        out.subheader("Cohort Range ({} - {}) has the highest average number of patents grants per individual".format(*cohorts))
+
+    year_cohort = level_of_detail(state_cube['year_cohort'], 'year', 'num_grants_mean', series='cohort', max_points=CHART_WIDTH)
+    out.chart(grants_over_chart(series=year_cohort, xs=x_positions(year_cohort, 'year'),
+                                x='year', color='cohort', mark='bar', title="Calendar Year"))
+
+    year = peak(state_cube['year_cohort'], 'year')
+    if year:
+        out.subheader("Calendar year {} has the highest average number of patents grants per individual.".format(year[0]))
+    age = peak(state_cube['cohort_age'], 'age')
+    if age:
+        out.markdown("#### Inventors aged around {} are most productive per average number of patents grants per individual :sunglasses:"
+                     .format(age[0]))
 
+page.section('birth_cohorts', birth_cohorts, inputs=['state_cube'])
 
 
 st.subheader("Custom Slicing Based on State and Year of Birth")
 
-cols = st.columns(2)
-with cols[0]:
-    states = st.multiselect('State: ',df['state'].unique())  #drop down for categorical variable
-with cols[1]:
-    cohort_range = st.slider('Cohort',
-                    min_value=int(df['cohort'].min()),
-                    max_value=int(df['cohort'].max()),
-                    value=(int(df['cohort'].min()), int(df['cohort'].max()))
-                    )
+selections, ranges = page.filters('slice_index', [
+    multiselect('states', 'State: ', 'state'),  #drop down for categorical variable
+    range_slider('cohort_range', 'Cohort', 'cohort'),
+], columns=2)
+states, cohort_range = selections['state'], ranges['cohort']
+
+backend = page.get('backend')
+state_stats = page.get('state_stats')
+
+def slice_metrics(out):
+    # popular slices (CA/MA/VT, standard cohort ranges) are shared by every session (see result_cache.py)
+    in_slice, out_slice = state_stats.slice(selections, ranges)
+
+    # out.write("The sliced dataset contains {} elements".format(in_slice['size']))
+
+    Inslice_num_grants = estimate(in_slice, 'num_grants')
+    Noslice_num_grants = estimate(out_slice, 'num_grants')
+
+    col1, col2 = out.columns(2)
+    col1.header("In Slice")
+    col1.metric('Num of Grants', '{:.2%}'.format(Inslice_num_grants['mean']))
+    col1.caption(interval(Inslice_num_grants, '{:.2%}'))
 
-slice_labels = get_slice_membership(df, states, cohort_range)
+    col2.header("Out of Slice")
+    col2.metric('Num of Grants', '{:.2%}'.format(Noslice_num_grants['mean']))
+    col2.caption(interval(Noslice_num_grants, '{:.2%}'))
 
-# st.write("The sliced dataset contains {} elements".format(slice_labels.sum()))
+page.section('slice_metrics', slice_metrics, inputs=['state_stats'], widgets=page.filter_keys)
 
-Inslice_num_grants = df[slice_labels]['num_grants'].mean()
-Noslice_num_grants = df[~slice_labels]['num_grants'].mean()
+def state_comparison(out):
+    out.text("Every state in the cohort range, with the picked states highlighted")
+    # all states in one grouped pass instead of one slice query per state
+    table = page.cached('state_grid', ['backend'], filter_key(ranges={'cohort': cohort_range}),
+                        compare_states, backend, cohort_range)
+    out.chart(state_comparison_chart(table=table.assign(picked=table['state'].isin(states))))
 
-col1, col2 = st.columns(2)
-with col1:
-    st.header("In Slice")
-    st.metric('Num of Grants', '{:.2%}'.format(Inslice_num_grants))
+page.section('state_comparison', state_comparison, inputs=['backend'], widgets=page.filter_keys)
 
-with col2:
-    st.header("Out of Slice")
-    st.metric('Num of Grants', '{:.2%}'.format(Noslice_num_grants))
+end_rerun()
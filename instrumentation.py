@@ -0,0 +1,135 @@
+"""
+Per-rerun profiling for the explorables.
+
+Enable with EXPLORABLE_PROFILE=1. Every rerun then collects timing spans
+(data loading, slicing, reshaping, chart construction, spec serialization),
+chart payload sizes and hit/miss counters of the caches. The record
+is appended as one JSON line to EXPLORABLE_PROFILE_LOG (default
+profile.jsonl) and shown in a collapsed "Profiling" panel at the bottom of
+the page.
+
+When profiling is off, `timed` returns the plain function and `span` is a
+shared no-op, so the hot paths carry no extra work.
+"""
+from contextlib import contextmanager
+import functools
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('EXPLORABLE_PROFILE') == '1'
+LOG_PATH = os.environ.get('EXPLORABLE_PROFILE_LOG', 'profile.jsonl')
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+def current():
+    """The record of the rerun running on this thread, or None."""
+    return getattr(_local, 'record', None)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = current()
+        if record is not None:
+            record['spans'].append({'name': name, 'ms': (time.perf_counter() - start) * 1000})
+
+
+def span(name):
+    """Context manager timing a block into the current rerun's record."""
+    return _span(name) if ENABLED else NO_SPAN
+
+
+def timed(name=None):
+    """Decorator version of span (no wrapper at all when profiling is off)."""
+    def decorate(func):
+        if not ENABLED:
+            return func
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, event):
+    """Increment counter `event` (e.g. 'hit', 'miss') for cache `name`."""
+    record = current()
+    if record is not None:
+        counters = record['caches'].setdefault(name, {})
+        counters[event] = counters.get(event, 0) + 1
+
+
+def note(key, value):
+    """Attach a measurement (e.g. a chart payload size) to the current rerun."""
+    record = current()
+    if record is not None:
+        record['values'].setdefault(key, []).append(value)
+
+
+@contextmanager
+def rerun_of(record):
+    """Record into `record` (current() of another thread, e.g. the session a worker computes for)."""
+    previous = current()
+    _local.record = record
+    try:
+        yield
+    finally:
+        _local.record = previous
+
+
+def begin_rerun(page):
+    if ENABLED:
+        _local.record = {'page': page, 'start': time.time(), 'spans': [], 'caches': {}, 'values': {}}
+        _local.started = time.perf_counter()
+
+
+def close_rerun():
+    """Close the rerun record, append it to the log and return it (None when not profiling)."""
+    record = current()
+    if record is None:
+        return None
+    _local.record = None
+    record['total_ms'] = (time.perf_counter() - _local.started) * 1000
+    with _log_lock, open(LOG_PATH, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return record
+
+
+def end_rerun():
+    """Close the rerun record, log it and draw the debug panel."""
+    import streamlit as st
+    from result_cache import all_stats
+
+    record = close_rerun()
+    if record is None:
+        return
+
+    with st.expander("Profiling", expanded=False):
+        st.write("Rerun took {:.1f} ms".format(record['total_ms']))
+        st.table([{'span': s['name'], 'ms': round(s['ms'], 2)} for s in record['spans']])
+        st.table([dict(cache=name, **counters) for name, counters in record['caches'].items()])
+        if record['values']:
+            st.json(record['values'])
+        st.write("Result caches since the server started")
+        st.table([dict(cache=name, **stats) for name, stats in all_stats().items()])
@@ -0,0 +1,156 @@
+"""
+Declarative page engine for the explorables.
+
+A page declares its datasets, filters, cached metrics and sections, and this
+runtime turns the declarations into the warm-up tasks, memoized loaders,
+widgets, slice masks and incremental sections the pages used to wire by hand:
+
+    page = Page('pulse')
+    page.dataset('data', read_pulse, version=PULSE_VERSION)
+    page.dataset('slice_index', build_slice_index, after=['data'], cpu=True)
+    page.start()
+
+    selections, ranges = page.filters('slice_index', [
+        multiselect('genders', 'Gender', 'gender'),
+        range_slider('age_range', 'Age', 'age'),
+    ], columns=1)
+    outcomes = page.cached('slice_outcomes', ['backend'], page.slice_key(),
+                           page.get('backend').compare, selections, ranges)
+    page.section('slice_outcomes', slice_outcomes, inputs=['backend'], widgets=page.filter_keys)
+
+A dataset is func(*datasets in `after`, *args). Its version is its own
+`version` (e.g. the data file's, see data_store.dataset_version) plus the
+versions of what it is derived from. page.get(name) returns it from the
+process-wide DATASETS cache, keyed on the function, its arguments and that
+version rather than on the page, so the same table derived by several
+sections or pages is loaded once; the first run of the page warms every
+dataset up in the background (see warmup.py).
+
+Filters are widgets over the columns of a SliceIndex dataset; every call to
+page.filters adds to the page's current slice (page.slice(), page.mask()).
+Charts are declared with charts.chart_template so their specs compile once.
+
+Datasets and cached results are shared read-only views (see result_cache.py).
+page.cached computations run on the bounded worker pool (see workers.py);
+a section whose computation is turned away because the server is busy
+shows a retry message instead (outside sections, the page stops there).
+"""
+import os
+
+import streamlit as st
+
+from result_cache import DATASETS, RESULTS, freeze
+from sections import run_section
+from slicing import filter_key
+import warmup
+import workers
+
+BUSY = "The server is busy, this part of the page is not shown. Rerun the page to try again."
+
+
+def multiselect(key, label, column, **kwargs):
+    """A multiselect filter over the values of a categorical index column."""
+    return dict(kwargs, kind='multiselect', key=key, label=label, column=column)
+
+
+def range_slider(key, label, column, **kwargs):
+    """A (low, high) slider filter over a range index column, all values by default."""
+    return dict(kwargs, kind='range', key=key, label=label, column=column)
+
+
+class Page:
+    def __init__(self, name):
+        self.name = name
+        self.datasets = {}
+        self.selections = {}
+        self.ranges = {}
+        self.filter_keys = []
+        self.building = None
+
+    def dataset(self, name, func, *args, after=(), cpu=False, version=None):
+        """Declare dataset `name` = func(*datasets in `after`, *args)."""
+        self.datasets[name] = {'func': func, 'args': args, 'after': list(after), 'cpu': cpu, 'version': version}
+
+    def version(self, name):
+        d = self.datasets[name]
+        return (d['version'],) + tuple(self.version(dep) for dep in d['after'])
+
+    def start(self):
+        """Warm every declared dataset up in the background (once per process)."""
+        warmup.start(self.name, [
+            warmup.task((name, self.version(name)), d['func'], *d['args'],
+                        after=[(dep, self.version(dep)) for dep in d['after']], cpu=d['cpu'])
+            for name, d in self.datasets.items()])
+
+    def get(self, name):
+        d = self.datasets[name]
+        func = '{}:{}'.format(os.path.basename(d['func'].__code__.co_filename), d['func'].__qualname__) \
+            if hasattr(d['func'], '__code__') else repr(d['func'])
+        key = (func, self.version(name), freeze(d['args']))
+        return DATASETS.get_or_compute(key, self.build, name)
+
+    def build(self, name):
+        d = self.datasets[name]
+        return warmup.get(self.name, (name, self.version(name)),
+                          lambda: d['func'](*[self.get(dep) for dep in d['after']], *d['args']))
+
+    def filters(self, index, specs, columns=0):
+        """
+        Draw the filter widgets of `specs` over the SliceIndex dataset
+        `index`, the first `columns` of them side by side, and add them to
+        the page's slice. Returns the page's (selections, ranges) so far.
+        """
+        slice_index = self.get(index)
+        placed = list(st.columns(columns)) if columns else []
+        for i, spec in enumerate(specs):
+            target = placed[i] if i < len(placed) else st
+            options = {k: v for k, v in spec.items() if k not in ('kind', 'key', 'label', 'column')}
+            if spec['kind'] == 'multiselect':
+                value = target.multiselect(spec['label'], slice_index.values(spec['column']), key=spec['key'], **options)
+                self.selections[spec['column']] = value
+            else:
+                low, high = (int(v) for v in slice_index.value_range(spec['column']))
+                value = target.slider(spec['label'], min_value=low, max_value=high, value=(low, high),
+                                      key=spec['key'], **options)
+                self.ranges[spec['column']] = value
+            if spec['key'] not in self.filter_keys:
+                self.filter_keys.append(spec['key'])
+        return self.slice()
+
+    def slice(self):
+        return dict(self.selections), dict(self.ranges)
+
+    def slice_key(self):
+        return filter_key(self.selections, self.ranges)
+
+    def mask(self, index):
+        """Boolean mask of the rows in the page's slice (see slicing.py), shared by every session."""
+        slice_index = self.get(index)
+        return RESULTS.get_or_compute(('slice_mask', self.name, self.version(index), self.slice_key()),
+                                      slice_index.mask, self.selections, self.ranges)
+
+    def cached(self, name, inputs, key, compute, *args, **kwargs):
+        """
+        compute(*args, **kwargs), run on the worker pool and cached in RESULTS
+        under the versions of the datasets in `inputs` and `key` (e.g.
+        page.slice_key()).
+        """
+        versions = tuple(self.version(i) for i in inputs)
+        try:
+            return RESULTS.get_or_compute((self.name, name, versions, key), workers.run, compute, *args, **kwargs)
+        except workers.Busy:
+            if self.building:
+                raise
+            st.warning(BUSY)
+            st.stop()
+
+    def section(self, name, build, inputs=(), widgets=()):
+        """Draw section `name`, rebuilt only when the datasets in `inputs` or the `widgets` change."""
+        self.building = name
+        try:
+            run_section(name, build, versions=[self.version(i) for i in inputs], widgets=list(widgets),
+                        page=self.name)
+        except workers.Busy:
+            st.warning(BUSY)
+        finally:
+            self.building = None
@@ -0,0 +1,136 @@
+"""
+Top-K rankings behind the findings of the innovation page.
+
+The ranked metrics are converted to float arrays once per dataset version
+(the state and zone rollups of zones.ZoneIndex), and a top-K is an
+np.argpartition over the slice, which is linear, followed by a sort of the
+K winners only, instead of a sort_values of a whole (or long-format) frame
+on every rerun. NaN never ranks.
+
+Rankings are memoized in result_cache.RESULTS per (dataset version, what is
+ranked, metric, k, slice), so the findings for a selection are computed
+once per server process:
+
+    rankings = Rankings(zone_index, version)
+    rankings.zones('top5cit', 5, states=['Vermont', 'California'])
+    rankings.categories('top5cit_cat_', zone_ids)
+"""
+import numpy as np
+import pandas as pd
+
+from reshape import family_columns, suffix_labels
+from result_cache import RESULTS
+from slicing import filter_key
+
+
+def top_k(values, k, largest=True):
+    """Positions of the `k` largest (smallest) finite `values`, best first."""
+    values = np.asarray(values, dtype=float)
+    finite = np.flatnonzero(np.isfinite(values))
+    scores = -values[finite] if largest else values[finite]
+    k = min(k, len(finite))
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    if k < len(finite):
+        # every value tied with the k-th best competes, so ties keep the table order
+        kth = scores[np.argpartition(scores, k - 1)[:k]].max()
+        chosen = np.flatnonzero(scores <= kth)
+    else:
+        chosen = np.arange(len(finite))
+    chosen = chosen[np.lexsort((chosen, scores[chosen]))][:k]
+    return finite[chosen]
+
+
+def top_k_per_row(matrix, k, min_value=None):
+    """
+    For every row of `matrix`, (column positions, values) of its `k` largest
+    finite cells (only those > `min_value` if given), best first.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    k = min(k, matrix.shape[1])
+    if k <= 0:
+        return [(np.array([], dtype=np.int64), np.array([]))] * len(matrix)
+    scores = np.where(np.isfinite(matrix), -matrix, np.inf)
+    if k < matrix.shape[1]:
+        kth = np.take_along_axis(scores, np.argpartition(scores, k - 1, axis=1)[:, :k], axis=1).max(axis=1)
+    else:
+        kth = np.full(len(matrix), np.inf)
+    result = []
+    for row, row_scores, row_kth in zip(matrix, scores, kth):
+        # as in top_k, every cell tied with the k-th best competes
+        columns = np.flatnonzero(row_scores <= row_kth)
+        columns = columns[np.lexsort((columns, row_scores[columns]))][:k]
+        values = row[columns]
+        keep = np.isfinite(values) if min_value is None else np.isfinite(values) & (values > min_value)
+        result.append((columns[keep], values[keep]))
+    return result
+
+
+def slice_key(states):
+    """The slice part of a ranking key; None (every state) differs from []."""
+    return None if states is None else filter_key({'par_state': list(states)})
+
+
+class Rankings:
+    """Memoized top-K states, zones and categories of a ZoneIndex (see zones.py)."""
+
+    def __init__(self, zone_index, version):
+        self.index = zone_index
+        self.version = version
+        self.zone_values = {v: zone_index.zones[v + '_mean'].to_numpy(dtype=float) for v in zone_index.values}
+        self.state_values = {v: zone_index.states[v + '_mean'].to_numpy(dtype=float) for v in zone_index.values}
+        self.state_position = {s: i for i, s in enumerate(zone_index.states.index)}
+
+    def cached(self, kind, metric, k, states, compute, *args):
+        key = ('ranking', kind, self.version, metric, k, slice_key(states))
+        return RESULTS.get_or_compute(key, compute, *args)
+
+    def states(self, metric, k, states=None):
+        """The `k` states (of `states`, default all) with the highest <metric>_mean, best first."""
+        return self.cached('states', metric, k, states, self.rank_states, metric, k, states)
+
+    def zones(self, metric, k, states=None):
+        """The `k` zones of `states` (default all) with the highest <metric>_mean, best first."""
+        return self.cached('zones', metric, k, states, self.rank_zones, metric, k, states)
+
+    def categories(self, prefix, zones, k=None, min_value=0):
+        """
+        Long frame of the categories of the family `prefix` (e.g. top5cit_cat_)
+        in each of the zones with ids `zones`, best first per zone, keeping
+        the top `k` (default all) with a rate above `min_value`.
+        """
+        key = ('ranking', 'categories', self.version, prefix, k, min_value, tuple(zones))
+        return RESULTS.get_or_compute(key, self.rank_categories, prefix, list(zones), k, min_value)
+
+    def rank_states(self, metric, k, states):
+        if states is None:
+            positions = np.arange(len(self.index.states))
+        else:
+            positions = np.array([self.state_position[self.index.state(s)] for s in states
+                                  if self.index.state(s) in self.state_position], dtype=np.int64)
+        best = positions[top_k(self.state_values[metric][positions], k)]
+        table = self.index.states.iloc[best]
+        return pd.DataFrame({'par_state': table.index, metric + '_mean': table[metric + '_mean'].to_numpy()})
+
+    def rank_zones(self, metric, k, states):
+        positions = np.arange(len(self.index.zones)) if states is None else self.index.zone_positions(states)
+        best = positions[top_k(self.zone_values[metric][positions], k)]
+        return self.index.zones.iloc[best][['par_cz', 'par_czname', 'par_stateabbrv', 'par_state', metric + '_mean']] \
+            .reset_index(drop=True)
+
+    def rank_categories(self, prefix, zones, k, min_value):
+        columns = family_columns(self.index.zones, prefix, r'\d+_mean')
+        labels = np.array(suffix_labels([c[:-len('_mean')] for c in columns], prefix))
+        positions = [self.index.zone_position[cz] for cz in zones if cz in self.index.zone_position]
+        table = self.index.zones.iloc[positions]
+        ranked = top_k_per_row(table[columns].to_numpy(dtype=float), k or len(columns), min_value)
+        counts = [len(c) for c, _ in ranked]
+        return pd.DataFrame({
+            'par_cz': np.repeat(table['par_cz'].to_numpy(), counts),
+            'par_czname': np.repeat(table['par_czname'].to_numpy(), counts),
+            'par_stateabbrv': np.repeat(table['par_stateabbrv'].to_numpy(), counts),
+            'par_state': np.repeat(table['par_state'].to_numpy(), counts),
+            'category': labels[np.concatenate([c for c, _ in ranked])] if counts else labels[:0],
+            prefix: np.concatenate([v for _, v in ranked]) if counts else np.array([]),
+            'rank': np.concatenate([np.arange(1, n + 1) for n in counts]) if counts else np.array([], dtype=int),
+        })
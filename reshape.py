@@ -0,0 +1,20 @@
+"""
+Helpers for prefixed column families such as why_no_vaccine_*,
+inventor_cat_* and top5cit_cat_*, named like pd.wide_to_long names them.
+"""
+import re
+
+
+def family_columns(df, prefix, suffix='.+'):
+    """Columns named <prefix><suffix>, `suffix` being a regex as in pd.wide_to_long."""
+    pattern = re.compile(re.escape(prefix) + suffix)
+    return [c for c in df.columns if pattern.fullmatch(c)]
+
+
+def suffix_labels(columns, prefix):
+    """Column suffixes; numeric suffixes (top5cit_cat_1, ...) become ints like wide_to_long does."""
+    suffixes = [c[len(prefix):] for c in columns]
+    if all(s.isdigit() for s in suffixes):
+        return [int(s) for s in suffixes]
+    return suffixes
+
@@ -0,0 +1,298 @@
+"""
+Process-wide result caches, replacing st.cache.
+
+st.cache hashes its arguments (and, without allow_output_mutation, its
+result) on every call, which is O(rows) per rerun for DataFrames, and it
+never evicts anything. A ResultCache is keyed on small values instead
+(dataset version ids, normalized filter tuples, see slicing.filter_key),
+shared by every session of the server process, and bounded by a memory
+budget with LRU eviction. Results that are being computed by one session
+are waited for by the others instead of being computed twice.
+
+With a disk directory, results are also pickled there and shared across
+processes; the disk tier has its own budget and drops the least recently
+written files first.
+
+Cached values are shared by every session, so they are handed out
+read-only: numpy arrays in them are locked (writeable=False) when they are
+stored, and every lookup returns a view (see readonly) in which frames are
+copy-on-write shallow copies and dicts are read-only mappings. A session
+that adds a column or assigns into a returned frame changes its own view,
+not the cached frame.
+
+What stays mutable: frames held as attributes of cached objects (e.g.
+ZoneIndex.zones, TableView.df, PandasBackend.df) are not copied on lookup,
+and pandas offers no way to lock a frame, so adding a column to or
+assigning into one of them would change it for every session. The objects
+only read those frames; code using a cached object does the same (or works
+on a .copy()). Arrays an object builds after it was stored are not locked
+either, unless it locks them itself (see PandasBackend.summary).
+
+The memory budget counts a frame or array referenced by several entries
+(e.g. a dataset and the backend built on it) once, by id().
+
+Every cache counts hits (memory and disk), misses and evictions, both in
+total (stats()) and per rerun for the profiling panel (see instrumentation.py).
+
+    RESULTS.get_or_compute(('slice', version, filter_key(selections, ranges)), compute, ...)
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from data_store import CACHE_DIR, write_atomic
+from instrumentation import count
+
+DATASET_CACHE_MB = float(os.environ.get('DATASET_CACHE_MB', 4096))
+RESULT_CACHE_MB = float(os.environ.get('RESULT_CACHE_MB', 256))
+# RESULT_CACHE_DISK=1 adds the on-disk tier in <DATA_CACHE_DIR>/results
+RESULT_DISK_DIR = os.path.join(CACHE_DIR, 'results') if os.environ.get('RESULT_CACHE_DISK') == '1' else None
+RESULT_DISK_MB = float(os.environ.get('RESULT_CACHE_DISK_MB', 1024))
+
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)  # the default from pandas 3, the views below rely on it
+
+
+def freeze(value):
+    """Hashable, order-stable version of nested lists/dicts/sets (for keys)."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze(v) for v in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def sizeof(value, seen=None, parts=None):
+    """
+    Rough memory footprint of a cached value in bytes. With `parts`, the
+    frames and arrays in it are recorded there ({id: bytes}) instead of
+    being counted, so that the cache can count one shared by several
+    entries once.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+        if isinstance(value, np.ndarray):
+            size = value.nbytes
+        else:
+            usage = value.memory_usage(deep=True)
+            size = int(usage.sum() if hasattr(usage, 'sum') else usage)
+        if parts is None:
+            return size
+        parts[id(value)] = size
+        return 0
+    if isinstance(value, dict):
+        return sum(sizeof(k, seen, parts) + sizeof(v, seen, parts) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(sizeof(v, seen, parts) for v in value)
+    if hasattr(value, '__dict__'):
+        return sizeof(vars(value), seen, parts)
+    return sys.getsizeof(value)
+
+
+def lock_arrays(value, seen=None):
+    """
+    Make the numpy arrays in a value to be cached (and in its attributes)
+    read-only. Frames are left as they are, see the module docstring.
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen or isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return value
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for v in value.values():
+            lock_arrays(v, seen)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            lock_arrays(v, seen)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        lock_arrays(vars(value), seen)
+    return value
+
+
+def readonly(value):
+    """
+    A view of a cached value for one caller: frames and series as shallow
+    copy-on-write copies, dicts as read-only mappings and lists as tuples
+    (recursively); other objects as they are, their arrays locked.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, dict):
+        return MappingProxyType({k: readonly(v) for k, v in value.items()})
+    if type(value) in (list, tuple):
+        return tuple(readonly(v) for v in value)
+    return value
+
+
+CACHES = []
+
+
+class ResultCache:
+    def __init__(self, name, max_mb, disk_dir=None, disk_mb=None):
+        self.name = name
+        self.max_bytes = max_mb * 2**20
+        self.disk_dir = disk_dir
+        self.disk_bytes = (disk_mb or 0) * 2**20
+        self.entries = OrderedDict()  # key -> (value, size, {id: bytes} of its frames and arrays)
+        self.shared = {}  # id of a frame or array -> [bytes, number of entries holding it]
+        self.pending = {}  # key -> Future of a result being computed
+        self.bytes = 0
+        self.counters = {'hit': 0, 'disk_hit': 0, 'miss': 0, 'eviction': 0}
+        self.lock = threading.Lock()
+        CACHES.append(self)
+
+    def event(self, event):
+        self.counters[event] += 1
+        count('result_cache:' + self.name, event)
+
+    def get_or_compute(self, key, compute, *args, **kwargs):
+        """
+        A read-only view of the cached result for `key`, else of
+        compute(*args, **kwargs) (cached).
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.event('hit')
+                return readonly(self.entries[key][0])
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = self.pending[key] = Future()
+        if not owner:
+            self.event('hit')
+            return readonly(future.result())
+
+        try:
+            value = self.read_disk(key)
+            if value is None:
+                self.event('miss')
+                value = compute(*args, **kwargs)
+                self.write_disk(key, value)
+            else:
+                self.event('disk_hit')
+            lock_arrays(value)
+            self.put(key, value)
+            future.set_result(value)
+            return readonly(value)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def put(self, key, value):
+        parts = {}
+        size = sizeof(value, parts=parts)
+        if size + sum(parts.values()) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.release(self.entries.pop(key))
+            self.entries[key] = (value, size, parts)
+            self.bytes += size
+            for part, part_size in parts.items():
+                if part in self.shared:
+                    self.shared[part][1] += 1
+                else:
+                    self.shared[part] = [part_size, 1]
+                    self.bytes += part_size
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.release(evicted)
+                self.event('eviction')
+
+    def release(self, entry):
+        """Uncount a removed entry, and the frames and arrays no other entry holds."""
+        _, size, parts = entry
+        self.bytes -= size
+        for part in parts:
+            self.shared[part][1] -= 1
+            if not self.shared[part][1]:
+                self.bytes -= self.shared.pop(part)[0]
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.disk_dir, self.name, digest + '.pkl')
+
+    def read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        try:
+            with open(self.disk_path(key), 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if stored_key == key else None
+
+    def write_disk(self, key, value):
+        if self.disk_dir is None:
+            return
+        path = self.disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def write(tmp):
+            try:
+                with open(tmp, 'wb') as f:
+                    pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                os.remove(tmp)
+                raise
+        try:
+            write_atomic(path, write)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return  # not picklable, memory tier only
+        self.prune_disk(os.path.dirname(path))
+
+    def prune_disk(self, directory):
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith('.pkl')]
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            if total <= self.disk_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.shared.clear()
+            self.bytes = 0
+
+    def stats(self):
+        lookups = self.counters['hit'] + self.counters['disk_hit'] + self.counters['miss']
+        return dict(self.counters, entries=len(self.entries), mb=self.bytes / 2**20,
+                    hit_rate=(lookups - self.counters['miss']) / lookups if lookups else None)
+
+
+def all_stats():
+    """Totals since the process started, per cache."""
+    return {cache.name: cache.stats() for cache in CACHES}
+
+
+# loaded datasets and what is derived from them (indexes, cubes, samplers)
+DATASETS = ResultCache('datasets', DATASET_CACHE_MB)
+# per-filter results (slice outcomes, masks), the ones worth sharing across processes
+RESULTS = ResultCache('results', RESULT_CACHE_MB, RESULT_DISK_DIR, RESULT_DISK_MB)
+
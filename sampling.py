@@ -0,0 +1,56 @@
+"""
+Random person sampling without copying the frame.
+
+Everything a person description needs is converted once into numpy columns,
+together with each row's list of positive reasons (stored CSR style: one
+flat array of reason codes plus per-row offsets). Strata are kept as index
+arrays, so drawing a person is picking a random position and reading it back.
+"""
+import numpy as np
+
+from reshape import family_columns, suffix_labels
+
+
+class PersonSampler:
+    def __init__(self, df, fields, prefix, suffix='.+'):
+        self.columns = {f: df[f].to_numpy() for f in fields}
+        self.n_rows = len(df)
+
+        reason_columns = family_columns(df, prefix, suffix)
+        self.reason_labels = np.array(suffix_labels(reason_columns, prefix), dtype=object)
+        values = df[reason_columns].to_numpy(dtype=float, na_value=np.nan)
+        rows, codes = np.nonzero(np.nan_to_num(values) > 0)
+        self.reason_codes = codes
+        self.reason_offsets = np.searchsorted(rows, np.arange(self.n_rows + 1))
+
+        self.strata = {'all': np.arange(self.n_rows)}
+
+    def add_stratum(self, name, mask):
+        """Register the rows in boolean `mask` as a named stratum."""
+        self.strata[name] = np.flatnonzero(np.asarray(mask, dtype=bool))
+
+    def reasons(self, i):
+        codes = self.reason_codes[self.reason_offsets[i]:self.reason_offsets[i + 1]]
+        return list(self.reason_labels[codes])
+
+    def person(self, i):
+        """Row `i` as a dict of the sampled fields plus its `reasons` list."""
+        record = {f: values[i] for f, values in self.columns.items()}
+        record['reasons'] = self.reasons(i)
+        return record
+
+    def sample(self, stratum='all', n=1, seed=None, mask=None):
+        """
+        Draw `n` distinct people from a named stratum, optionally restricted to
+        the rows in boolean `mask` (e.g. the current slice). Pass `seed` for a
+        reproducible draw. Returns a list of person dicts (fewer than n if the
+        stratum is smaller).
+        """
+        candidates = self.strata[stratum]
+        if mask is not None:
+            candidates = candidates[np.asarray(mask, dtype=bool)[candidates]]
+        if not len(candidates):
+            return []
+        rng = np.random.default_rng(seed)
+        picked = rng.choice(candidates, size=min(n, len(candidates)), replace=False)
+        return [self.person(i) for i in picked]
@@ -0,0 +1,91 @@
+"""
+Incremental reruns for the explorable pages.
+
+Streamlit reruns the whole script on every widget interaction. A page section
+declares what it depends on (dataset versions plus the keys of the widgets it
+reads) and draws through a recorder instead of `st` directly. The recorded
+calls are cached per input values, so a section whose inputs did not change
+just replays its previous output (cheap) instead of rebuilding charts,
+reshapes and sorts. The cache is module level and therefore shared by every
+session in the server process.
+
+    def state_grants(out):
+        out.subheader("...")
+        out.chart(state_grants_chart(states=...))   # a charts.chart_template
+
+    run_section('state_grants', state_grants, versions=[dataset_version(path)], page='innovation')
+
+Widgets themselves must stay outside sections; give them a `key` and list
+that key in `widgets`.
+"""
+from collections import OrderedDict
+import threading
+
+import streamlit as st
+
+from instrumentation import count, span
+from result_cache import freeze
+
+MAX_CACHED_OUTPUTS = 256
+
+_outputs = OrderedDict()
+_lock = threading.Lock()
+
+
+class Recorder:
+    """
+    Stand-in for `st` inside a section: every call is recorded as
+    (method, args, kwargs) and replayed later on the real container.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def chart(self, spec, **kwargs):
+        """The spec returned by a charts.chart_template."""
+        self.calls.append(('vega_lite_chart', (spec,), kwargs))
+
+    def columns(self, spec):
+        children = [Recorder() for _ in range(spec if isinstance(spec, int) else len(spec))]
+        self.calls.append(('columns', (spec,), {'children': [c.calls for c in children]}))
+        return children
+
+    def __getattr__(self, method):
+        def record(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+        return record
+
+
+def replay(calls, target=st):
+    for method, args, kwargs in calls:
+        if method == 'columns':
+            children = kwargs['children']
+            for container, child_calls in zip(target.columns(*args), children):
+                replay(child_calls, container)
+        else:
+            getattr(target, method)(*args, **kwargs)
+
+
+def run_section(name, build, versions=(), widgets=(), page=None):
+    """
+    Draw section `name` of `page`, rebuilding it with build(recorder) only
+    when one of its inputs (dataset `versions`, values of the widget keys in
+    `widgets`) changed since it was last built. Pages served by the same
+    process may use the same section names, so the cache is keyed on both.
+    """
+    key = (page, name, tuple(versions), tuple(freeze(st.session_state.get(w)) for w in widgets))
+    with _lock:
+        calls = _outputs.get(key)
+        if calls is not None:
+            _outputs.move_to_end(key)
+    count('section:' + name, 'hit' if calls is not None else 'miss')
+    if calls is None:
+        recorder = Recorder()
+        with span('section:' + name):
+            build(recorder)
+        calls = recorder.calls
+        with _lock:
+            _outputs[key] = calls
+            while len(_outputs) > MAX_CACHED_OUTPUTS:
+                _outputs.popitem(last=False)
+    replay(calls)
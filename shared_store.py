@@ -0,0 +1,208 @@
+"""
+Process-shared dataset store.
+
+With SHARED_DATA=1 every dataset is published once per host into
+multiprocessing.shared_memory segments (one per column, categoricals as
+codes) and every app process attaches to those segments zero-copy, instead
+of each replica holding its own copy.
+
+A small JSON registry in <DATA_CACHE_DIR>/shared keeps
+  - aliases: source identity (paths + mtime/size of the source files) -> dataset key
+  - datasets: dataset key -> column manifest
+  - versions: the published source identity and dataset key per source group
+The dataset key is a hash of the parsed frame, so two different files with
+the same content (invention.csv and the Innovation Rates CSV only differ in
+how the floats are written) end up in the same segments.
+
+The pages key every dataset on its source version (data_store.dataset_version),
+so a changed file is loaded under a new identity by the first process that
+sees it, the other processes attach to that on their next rerun and the
+group's previous segments are released.
+
+Attached columns are read-only: the memory is shared by every process.
+"""
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from data_store import CACHE_DIR, dataset_version, read_dataset
+
+ENABLED = os.environ.get('SHARED_DATA') == '1'
+STORE_DIR = os.path.join(CACHE_DIR, 'shared')
+REGISTRY = os.path.join(STORE_DIR, 'registry.json')
+
+# segments handed out by this process, kept alive for the life of the process
+_attached = {}
+
+
+@contextmanager
+def registry_lock():
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with open(os.path.join(STORE_DIR, 'registry.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_registry():
+    try:
+        with open(REGISTRY) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'aliases': {}, 'datasets': {}, 'versions': {}}
+
+
+def write_registry(registry):
+    tmp = '{}.{}.tmp'.format(REGISTRY, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(registry, f)
+    os.replace(tmp, REGISTRY)
+
+
+def untracked(segment):
+    # the resource tracker would unlink the segment when this process exits,
+    # but other replicas are still using it
+    resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def content_key(df):
+    """Hash of the parsed frame (column names, dtypes and values)."""
+    h = hashlib.sha1()
+    h.update(json.dumps([(c, str(df[c].dtype)) for c in df.columns]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def column_arrays(series):
+    """
+    (array, categories) for a column; string and object columns are stored as
+    categoricals, segments can only hold fixed-size values.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype) and (
+            pd.api.types.is_string_dtype(series) or series.dtype.kind == 'O'):
+        series = series.astype('category')
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return np.asarray(series.cat.codes), series.cat.categories.tolist()
+    values = series.to_numpy()
+    if values.dtype.kind == 'O':
+        # e.g. nullable integers with missing values: pointers mean nothing in another process
+        raise TypeError('column {!r} ({}) can not be shared'.format(series.name, series.dtype))
+    return values, None
+
+
+def publish(df, key):
+    """Copy every column of `df` into its own segment and return the manifest."""
+    columns = []
+    for i, col in enumerate(df.columns):
+        values, categories = column_arrays(df[col])
+        name = 'iv_{}_{}'.format(key, i)
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=max(values.nbytes, 1))
+        except FileExistsError:
+            # left over from a publisher that died before registering it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=name, create=True, size=max(values.nbytes, 1))
+        untracked(segment)
+        np.ndarray(values.shape, values.dtype, buffer=segment.buf)[:] = values
+        segment.close()
+        columns.append({'name': col, 'segment': name, 'dtype': values.dtype.str,
+                        'length': len(values), 'categories': categories})
+    return {'columns': columns, 'attrs': df.attrs}
+
+
+def attach(manifest):
+    """Build a read-only DataFrame over the published segments without copying."""
+    data = {}
+    for column in manifest['columns']:
+        segment = _attached.get(column['segment'])
+        if segment is None:
+            segment = untracked(shared_memory.SharedMemory(name=column['segment']))
+            _attached[column['segment']] = segment
+        values = np.ndarray((column['length'],), np.dtype(column['dtype']), buffer=segment.buf)
+        values.flags.writeable = False
+        if column['categories'] is not None:
+            values = pd.Categorical.from_codes(values, categories=column['categories'])
+        data[column['name']] = values
+    df = pd.DataFrame(data, copy=False)
+    df.attrs.update(manifest.get('attrs') or {})
+    return df
+
+
+def release(registry, key):
+    """Unlink a dataset's segments once no alias points at it any more."""
+    if key in registry['aliases'].values():
+        return
+    for column in registry['datasets'].pop(key)['columns']:
+        try:
+            segment = shared_memory.SharedMemory(name=column['segment'])
+            segment.close()
+            segment.unlink()  # processes that still map it keep their view
+        except FileNotFoundError:
+            pass
+
+
+def open_shared(group, sources, loader):
+    """
+    The dataset built by `loader()` from the files in `sources`, shared across
+    processes. `group` names the dataset (e.g. the CSV path) for the version
+    counter. Only the first process to see a new source version loads it.
+    """
+    identity = '|'.join('{}:{}'.format(os.path.abspath(p), dataset_version(p)) for p in sorted(sources))
+    registry = read_registry()
+    key = registry['aliases'].get(identity)
+    if key in registry['datasets']:
+        try:
+            return attach(registry['datasets'][key])
+        except FileNotFoundError:
+            pass  # segments are gone (e.g. host restart), republish below
+
+    with registry_lock():
+        registry = read_registry()
+        key = registry['aliases'].get(identity)
+        if key in registry['datasets']:
+            try:
+                return attach(registry['datasets'][key])
+            except FileNotFoundError:
+                del registry['datasets'][key]
+        if key not in registry['datasets']:
+            df = loader().reset_index(drop=True)
+            key = content_key(df)
+            if key not in registry['datasets']:
+                registry['datasets'][key] = publish(df, key)
+            previous = registry['versions'].get(group)
+            if previous and previous['identity'] not in current_identities(registry, group):
+                registry['aliases'].pop(previous['identity'], None)
+            registry['aliases'][identity] = key
+            registry['versions'][group] = {'key': key, 'identity': identity}
+            if previous and previous['key'] != key and previous['key'] in registry['datasets']:
+                release(registry, previous['key'])
+            write_registry(registry)
+        return attach(registry['datasets'][key])
+
+
+def current_identities(registry, group):
+    """Identities currently published for groups other than `group`."""
+    return {v['identity'] for g, v in registry['versions'].items() if g != group}
+
+
+def load_frame(group, sources, loader):
+    """loader(), through the shared store when SHARED_DATA=1 (see open_shared)."""
+    if not ENABLED:
+        return loader()
+    return open_shared(group, sources, loader)
+
+
+def open_dataset(path):
+    """read_dataset, through the shared store when SHARED_DATA=1."""
+    return load_frame(path, [path], lambda: read_dataset(path))
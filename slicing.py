@@ -0,0 +1,121 @@
+"""
+Precomputed slice index for the custom slicing sections.
+
+A SliceIndex is built once per loaded dataset. For every categorical filter
+column it keeps one boolean bitmap per value, and for every range column the
+sorted values plus the row order that sorts them. Answering a widget
+combination is then a handful of ORs/ANDs over numpy arrays instead of
+isin/comparison scans over the DataFrame, and the result is a plain boolean
+mask (its complement is just ~mask) rather than a copied frame.
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+
+class SliceIndex:
+    def __init__(self, df, categorical=(), ranges=()):
+        self.n_rows = len(df)
+        self.bitmaps = {}
+        self.codes = {}
+        for col in categorical:
+            codes = pd.Categorical(df[col])
+            self.codes[col] = codes.codes
+            self.bitmaps[col] = {
+                value: np.asarray(codes.codes == code)
+                for code, value in enumerate(codes.categories)
+            }
+        self.sorted_values = {}
+        self.sort_order = {}
+        for col in ranges:
+            values = df[col].to_numpy()
+            order = np.argsort(values, kind='stable')
+            self.sort_order[col] = order
+            self.sorted_values[col] = values[order]
+
+    def values(self, col):
+        """Distinct values of a categorical filter column (for the multiselects)."""
+        return list(self.bitmaps[col])
+
+    def value_range(self, col):
+        """(min, max) of a range column (for the sliders)."""
+        values = self.sorted_values[col]
+        return values[0], values[-1]
+
+    def isin(self, col, selected):
+        """Bitmap of rows whose `col` value is one of `selected`."""
+        bitmaps = self.bitmaps[col]
+        mask = np.zeros(self.n_rows, dtype=bool)
+        for value in selected:
+            if value in bitmaps:
+                mask |= bitmaps[value]
+        return mask
+
+    def between(self, col, low, high):
+        """
+        Bitmap of rows with low <= `col` <= high, or None when the range covers
+        every row (so callers can skip the AND).
+        """
+        values = self.sorted_values[col]
+        start = np.searchsorted(values, low, side='left')
+        stop = np.searchsorted(values, high, side='right')
+        if start == 0 and stop == self.n_rows:
+            return None
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.sort_order[col][start:stop]] = True
+        return mask
+
+    def group_codes(self, by):
+        """
+        Cell number of every row in the grid of the categorical columns `by`
+        (-1 where one of them is missing) and the (value, ...) tuple of every
+        cell, e.g. by=['race', 'education'] for every race x education cell.
+        """
+        labels = [()]
+        codes = np.zeros(self.n_rows, dtype=np.int64)
+        missing = np.zeros(self.n_rows, dtype=bool)
+        for col in by:
+            values = self.values(col)
+            codes = codes * len(values) + self.codes[col]
+            missing |= self.codes[col] < 0
+            labels = [label + (value,) for label in labels for value in values]
+        codes[missing] = -1
+        return codes, labels
+
+    @timed('slice:mask')
+    def mask(self, selections=None, ranges=None):
+        """
+        Combine multiselect `selections` ({col: [values]}) and slider `ranges`
+        ({col: (low, high)}) into one boolean mask. Empty selections and None
+        ranges do not filter, matching the widgets' "nothing picked" state.
+        """
+        labels = np.ones(self.n_rows, dtype=bool)
+        for col, selected in (selections or {}).items():
+            if selected:
+                labels &= self.isin(col, selected)
+        for col, value_range in (ranges or {}).items():
+            if value_range is not None:
+                in_range = self.between(col, value_range[0], value_range[1])
+                if in_range is not None:
+                    labels &= in_range
+        return labels
+
+
+def plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def filter_key(selections=None, ranges=None):
+    """
+    Normalized, hashable form of a widget combination for cache keys: the
+    order in which values were picked does not matter, and empty selections
+    and None ranges (which do not filter, see SliceIndex.mask) are left out.
+    """
+    picked = tuple(sorted(
+        (col, tuple(sorted(plain(v) for v in selected)))
+        for col, selected in (selections or {}).items() if selected))
+    bounded = tuple(sorted(
+        (col, tuple(plain(v) for v in value_range))
+        for col, value_range in (ranges or {}).items() if value_range is not None))
+    return picked, bounded
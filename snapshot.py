@@ -0,0 +1,221 @@
+"""
+Static snapshots of the explorables.
+
+    python snapshot.py PAGE [--states FILE] [--out DIR] [--live URL] [--scripts DIR]
+
+runs the page script PAGE (e.g. innovation_streamlit_app.py) offline, with
+the same pipeline, caches and sections as a live session (through
+streamlit.testing), for its default widget state and for every state listed
+for it in FILE (default snapshots.json):
+
+    {"innovation_streamlit_app.py": [{"name": "top3", "widgets": {"states": ["California", ...]}}]}
+
+and writes to DIR (default <DATA_CACHE_DIR>/snapshots/<page>):
+
+    <name>.html        the page as HTML, charts drawn with vega-embed
+    <name>-<i>.vl.json every Vega-Lite spec of the page, its data inlined
+    index.json         {name: {"widgets": ..., "html": ..., "charts": [...]}}
+    vega-embed.js      vega, vega-lite and vega-embed for the pages
+
+vega-embed.js is the bundle altair inlines in charts saved with inline=True
+(from vl-convert-python, see requirements.txt), or the vega.min.js, vega-lite.min.js and
+vega-embed.min.js files found in DIR (--scripts, e.g. from the npm packages
+of the versions in alt.VEGA_VERSION, alt.VEGALITE_VERSION and
+alt.VEGAEMBED_VERSION). Nothing is loaded from a CDN, so the folder works
+offline and can be served by any static file server; the charts keep
+their Altair interactions (brushes, tooltips), the widgets are shown with
+their values and link to the live page (--live) for custom slicing.
+Run it from the directory with the data files, like the pages (PAGE is
+looked up next to this file when it is not in that directory).
+"""
+import html
+import json
+import os
+import re
+import sys
+
+import altair as alt
+import pyarrow as pa
+from altair.utils.data import to_values
+
+from benchmark import option
+from data_store import CACHE_DIR
+from tables import CONTROLS
+
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, 'snapshots')
+# the files of --scripts DIR, in load order, and the script the pages load them from
+SCRIPT_FILES = ['vega.min.js', 'vega-lite.min.js', 'vega-embed.min.js']
+EMBED_SCRIPT = 'vega-embed.js'
+STYLE = """
+body { font-family: sans-serif; max-width: 1200px; margin: 2em auto; padding: 0 1em; }
+.columns { display: flex; gap: 1em; } .columns > div { flex: 1; min-width: 0; }
+.widget { color: #555; font-size: 0.9em; } .caption { color: #777; font-size: 0.85em; }
+.metric .value { font-size: 2em; } table { border-collapse: collapse; font-size: 0.8em; }
+td, th { border: 1px solid #ddd; padding: 2px 6px; } .table { overflow-x: auto; }
+"""
+HEADINGS = {'title': 'h1', 'header': 'h2', 'subheader': 'h3'}
+WIDGETS = {'checkbox', 'multiselect', 'slider', 'selectbox', 'text_input', 'number_input', 'radio'}
+
+
+def inline_markdown(text):
+    """The markdown the pages use (headings, links, bold) as HTML."""
+    blocks = []
+    for block in re.split(r'\n\s*\n', text.strip()):
+        block = html.escape(block.strip())
+        block = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', block)
+        block = re.sub(r'\*\*([^*]+)\*\*', r'<b>\1</b>', block)
+        heading = re.match(r'(#{1,6})\s*(.*)', block, re.S)
+        if heading:
+            level = len(heading.group(1))
+            blocks.append('<h{0}>{1}</h{0}>'.format(level, heading.group(2)))
+        else:
+            blocks.append('<p>{}</p>'.format(block))
+    return '\n'.join(blocks)
+
+
+def widget_value(value):
+    if isinstance(value, list):
+        return '; '.join(map(str, value)) or 'all'
+    if isinstance(value, tuple):
+        return ' to '.join(map(str, value))
+    return str(value)
+
+
+def shown_value(widget):
+    """The widget's value as the page shows it (multiselect options through their format_func)."""
+    if getattr(widget, 'type', None) == 'multiselect':
+        return [widget.options[i] for i in widget.indices]
+    return widget.value
+
+
+def chart_spec(proto):
+    """A chart element's Vega-Lite spec with its datasets inlined."""
+    spec = json.loads(proto.spec)
+    datasets = spec.setdefault('datasets', {})
+    for dataset in proto.datasets:
+        df = pa.ipc.open_stream(dataset.data.data).read_pandas()
+        datasets[dataset.name] = to_values(df)['values']
+    if not datasets:
+        spec.pop('datasets')
+    return spec
+
+
+def embed_bundle(scripts_dir=None):
+    """vega, vega-lite and vega-embed as one script (see the module docstring)."""
+    if scripts_dir:
+        parts = []
+        for name in SCRIPT_FILES:
+            with open(os.path.join(scripts_dir, name)) as f:
+                parts.append(f.read())
+        return '\n;\n'.join(parts)
+    try:
+        import vl_convert
+    except ImportError:
+        raise RuntimeError('the chart scripts are not available offline: pip install vl-convert-python, '
+                           'or pass --scripts DIR with {}'.format(', '.join(SCRIPT_FILES)))
+    # the same Vega-Lite version altair writes the specs for
+    return vl_convert.javascript_bundle(vl_version='_'.join(alt.SCHEMA_VERSION.split('.')[:2]))
+
+
+class Snapshot:
+    """The HTML of one rendered page and its chart specs."""
+
+    def __init__(self, live_url=None):
+        self.live_url = live_url
+        self.charts = []
+
+    def render(self, node):
+        kind = getattr(node, 'type', None)
+        if kind in HEADINGS:
+            return '<{0}>{1}</{0}>'.format(HEADINGS[kind], html.escape(str(node.value)))
+        if kind == 'text':
+            return '<pre>{}</pre>'.format(html.escape(str(node.value)))
+        if kind == 'markdown':
+            return inline_markdown(str(node.value))
+        if kind == 'caption':
+            return '<p class="caption">{}</p>'.format(html.escape(str(node.value)))
+        if kind == 'metric':
+            return '<div class="metric"><div>{}</div><div class="value">{}</div></div>'.format(
+                html.escape(node.label), html.escape(str(node.value)))
+        if kind in ('dataframe', 'table'):
+            return '<div class="table">{}</div>'.format(node.value.to_html(max_rows=200, na_rep=''))
+        if kind in WIDGETS:
+            if str(getattr(node, 'key', None) or '').endswith(CONTROLS):
+                return ''  # paging a static table goes nowhere
+            link = ' (<a href="{}">change</a>)'.format(html.escape(self.live_url)) if self.live_url else ''
+            return '<p class="widget">{}: <b>{}</b>{}</p>'.format(
+                html.escape(str(node.label)), html.escape(widget_value(shown_value(node))), link)
+        if kind == 'vega_lite_chart':
+            self.charts.append(chart_spec(node.proto))
+            return '<div id="chart{}"></div>'.format(len(self.charts) - 1)
+        children = [self.render(child) for child in getattr(node, 'children', {}).values()]
+        if kind == 'expander':
+            return '<details><summary>{}</summary>{}</details>'.format(
+                html.escape(str(node.label)), ''.join(children))
+        if kind == 'flex_container' and all(getattr(c, 'type', None) == 'column' for c in node.children.values()):
+            return '<div class="columns">{}</div>'.format(''.join('<div>{}</div>'.format(c) for c in children))
+        return ''.join(children)
+
+    def page(self, title, body):
+        scripts = '<script src="{}"></script>'.format(EMBED_SCRIPT)
+        # the specs are inlined in a script element, which a '</' in a string would end
+        embeds = ''.join('vegaEmbed("#chart{}", {}, {{"actions": false}});'.format(i, json.dumps(spec).replace('</', '<\\/'))
+                         for i, spec in enumerate(self.charts))
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>{}</title>{}<style>{}</style></head>'
+                '<body>{}<script>{}</script></body></html>').format(html.escape(title), scripts, STYLE, body, embeds)
+
+
+def run_page(page, widgets, timeout=600):
+    """Run the page script with the given widget values, return the AppTest."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.abspath(page), default_timeout=timeout)
+    for key, value in widgets.items():
+        app.session_state[key] = tuple(value) if key.endswith('_range') else value
+    app.run()
+    if app.exception:
+        raise RuntimeError('{} failed for {}: {}'.format(page, widgets, app.exception[0].value))
+    return app
+
+
+def export(page, states, out_dir, live_url=None, scripts_dir=None):
+    """Write the snapshots of `page` for the default and the given widget `states`."""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, EMBED_SCRIPT), 'w') as f:
+        f.write(embed_bundle(scripts_dir))
+    index = {}
+    for state in [{'name': 'default', 'widgets': {}}] + list(states):
+        app = run_page(page, state['widgets'])
+        snapshot = Snapshot(live_url)
+        body = snapshot.render(app.main)
+        title = next((str(node.value) for node in app.main if getattr(node, 'type', None) == 'title'), page)
+        name = state['name']
+        with open(os.path.join(out_dir, name + '.html'), 'w') as f:
+            f.write(snapshot.page(title, body))
+        charts = []
+        for i, spec in enumerate(snapshot.charts):
+            charts.append('{}-{}.vl.json'.format(name, i))
+            with open(os.path.join(out_dir, charts[-1]), 'w') as f:
+                json.dump(spec, f)
+        index[name] = {'widgets': state['widgets'], 'html': name + '.html', 'charts': charts}
+        print('{}: {} charts'.format(os.path.join(out_dir, name + '.html'), len(charts)))
+    with open(os.path.join(out_dir, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    page, args = sys.argv[1], sys.argv[2:]
+    if not os.path.exists(page):
+        # the pages next to this file, run on the data of the current directory
+        page = os.path.join(os.path.dirname(os.path.abspath(__file__)), page)
+    states_file = option(args, '--states', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots.json'))
+    states = []
+    if os.path.exists(states_file):
+        with open(states_file) as f:
+            states = json.load(f).get(os.path.basename(page), [])
+    out_dir = option(args, '--out', os.path.join(SNAPSHOT_DIR, os.path.splitext(os.path.basename(page))[0]))
+    export(page, states, out_dir, option(args, '--live'), option(args, '--scripts'))
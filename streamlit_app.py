@@ -1,75 +1,186 @@
-from re import U
+import os
 import streamlit as st
-import pandas as pd
+import numpy as np
 import altair as alt
 
-@st.cache
-def load_data():
+from aggregation import comparison_table, group_stats, pair_table
+from backends import PandasBackend, SQLBackend
+from charts import chart_template
+from data_store import dataset_version, discover_waves, read_waves
+from instrumentation import begin_rerun, end_rerun
+from pages import Page, multiselect, range_slider
+from shared_store import load_frame
+from sampling import PersonSampler
+from slicing import SliceIndex, filter_key
+from tables import TableView, data_table
+from weighting import estimate
+
+begin_rerun('pulse')  # no-op unless EXPLORABLE_PROFILE=1, see instrumentation.py
+
+# every pulse<wave>.csv next to the app is loaded, newest wave first, within this budget
+PULSE_FILES = "pulse*.csv"
+PULSE_MEMORY_MB = float(os.environ.get("PULSE_MEMORY_MB", 2048))
+# optional database file (table `pulse`) the slice metrics are queried from, see backends.py
+QUERY_DB = os.environ.get("EXPLORABLE_DB")
+# its mtime and size key the cached query results, so a rewritten file is queried again
+QUERY_DB_VERSION = dataset_version(QUERY_DB) if QUERY_DB else None
+# person weight of the Pulse public use files; the outcomes are unweighted when the waves do not have it
+PULSE_WEIGHT = os.environ.get("PULSE_WEIGHT", "PWEIGHT")
+
+def pulse_columns(column):
+    """Only the columns the page uses are parsed from the wave files."""
+    return column.startswith('why_no_vaccine_') or column in [
+        'gender', 'race', 'education', 'age', 'sexual_orientation', 'marital_status',
+        'hispanic', 'received_vaccine', 'vaccine_intention', PULSE_WEIGHT]
+
+PULSE_VERSION = dataset_version(discover_waves(PULSE_FILES).values())
+
+# The datasets, filters and sections of the page are declared on a Page (see pages.py):
+# each dataset is warmed up in the background and loaded once per data version
+
+def read_pulse():
     """
-    Write 1-2 lines of code here to load the data from CSV to a pandas dataframe
-    and return it.
+    Stream all Household Pulse waves into one typed pandas dataframe with a
+    `wave` column (see data_store.read_waves), published once per host with
+    SHARED_DATA=1 (see shared_store.py).
     """
-    return pd.read_csv("pulse39.csv")
+    waves = discover_waves(PULSE_FILES)
+    return load_frame(PULSE_FILES, waves.values(), lambda: read_waves(
+        waves, usecols=pulse_columns, memory_budget_mb=PULSE_MEMORY_MB))
 
-@st.cache
-def get_slice_membership(df, genders, races, educations, age_range):
+def build_slice_index(df):
+    """The bitmap/sorted index over the slicing columns (see slicing.py)."""
+    return SliceIndex(df, categorical=['gender', 'race', 'education', 'wave'], ranges=['age'])
+
+def count_demographics(df):
     """
-    Implement a function that computes which rows of the given dataframe should
-    be part of the slice, and returns a boolean pandas Series that indicates 0
-    if the row is not part of the slice, and 1 if it is part of the slice.
-    
-    In the example provided, we assume genders is a list of selected strings
-    (e.g. ['Male', 'Transgender']). We then filter the labels based on which
-    rows have a value for gender that is contained in this list. You can extend
-    this approach to the other variables based on how they are returned from
-    their respective Streamlit components.
+    Joint race x education counts per wave behind the distribution charts, so
+    the browser gets one row per cell instead of one row per respondent.
     """
-    labels = pd.Series([1] * len(df), index=df.index)
-
-    if genders:
-        labels &= df['gender'].isin(genders)
-    if educations:
-        labels &= df['education'].isin(educations)
-    if races:
-        labels &= df['race'].isin(races)
-    if age_range is not None:
-        labels &= df['age'] >= age_range[0]
-        labels &= df['age'] <= age_range[1]
-        
-    return labels
-
-def make_long_reason_dataframe(df, reason_prefix):
+    return group_stats(df, ['wave', 'race', 'education'])
+
+EDUCATION_ORDER = [
+    'Less than high school',
+    'Some high school',
+    'High school graduate or equivalent',
+    'Some college',
+    'Associates degree',
+    'Bachelors degree',
+    'Graduate degree']
+
+PERSON_FIELDS = ['age', 'sexual_orientation', 'marital_status', 'gender', 'race', 'hispanic',
+                 'received_vaccine', 'vaccine_intention']
+
+def build_person_sampler(df):
     """
-    ======== You don't need to edit this =========
-    
-    Utility function that converts a dataframe containing multiple columns to
-    a long-style dataframe that can be plotted using Altair. For example, say
-    the input is something like:
-    
-         | why_no_vaccine_Reason 1 | why_no_vaccine_Reason 2 | ...
-    -----+-------------------------+-------------------------+------
-    1    | 0                       | 1                       | 
-    2    | 1                       | 1                       |
-    
-    This function, if called with the reason_prefix 'why_no_vaccine_', will
-    return a long dataframe:
-    
-         | id | reason      | agree
-    -----+----+-------------+---------
-    1    | 1  | Reason 2    | 1
-    2    | 2  | Reason 1    | 1
-    3    | 2  | Reason 2    | 1
-    
-    For every person (in the returned id column), there may be one or more
-    rows for each reason listed. The agree column will always contain 1s, so you
-    can easily sum that column for visualization.
+    Person fields and each row's reasons precomputed for sampling, with a
+    stratum for people who have not received the vaccine (see sampling.py).
     """
-    reasons = df[[c for c in df.columns if c.startswith(reason_prefix)]].copy()
-    reasons['id'] = reasons.index
-    reasons = pd.wide_to_long(reasons, reason_prefix, i='id', j='reason', suffix='.+')
-    reasons = reasons[~pd.isna(reasons[reason_prefix])].reset_index().rename({reason_prefix: 'agree'}, axis=1)
-    return reasons
+    sampler = PersonSampler(df, PERSON_FIELDS, 'why_no_vaccine_')
+    sampler.add_stratum('not_vaccinated', ~df['received_vaccine'])
+    return sampler
+
+def describe_person(person):
+    """Markdown lines describing one sampled person."""
+    lines = [f""" This person is a **{person['age']}**-year-old **{person['sexual_orientation']}**, **{person['marital_status'].lower()}** **{person['gender'].lower()}**, of **{person['race']}** race ({'**Hispanic**' if person['hispanic'] else '**non-Hispanic**'})."""]
+    if person['received_vaccine']:
+        lines.append(f"They **have** received the vaccine.")
+    else:
+        lines.append(f"They **have not** receive the vaccine and their intention to not get the vaccine is **{person['vaccine_intention']}**.")
+        lines.append(f"Their reasons for not getting the vaccine include: **" + ", ".join(person['reasons']) + "**")
+    return lines
+
+OUTCOMES = ['received_vaccine', 'vaccine_intention']
+
+def build_outcome_stats(backend):
+    """Survey-weighted outcome estimates with their intervals, from the backend (see weighting.py)."""
+    weight = PULSE_WEIGHT if PULSE_WEIGHT in backend.columns else None
+    return backend.weighted(OUTCOMES, PULSE_VERSION, weight=weight)
+
+def interval(row, fmt):
+    return "95% CI {} to {}".format(fmt.format(row['low']), fmt.format(row['high']))
+
+def build_backend(df, index):
+    """
+    Where the slice outcomes and estimates are computed: the shared database file
+    when EXPLORABLE_DB is set, otherwise the in-memory frame (see backends.py).
+    """
+    if QUERY_DB:
+        return SQLBackend(QUERY_DB, 'pulse')
+    return PandasBackend(df, index)
+
+@chart_template
+def demographics_chart(counts):
+    race_brush = alt.selection_multi(fields=['race'])
+    education_brush = alt.selection_multi(fields=['education'])
+
+    race_chart = alt.Chart(counts).mark_bar().encode(
+        x=alt.X('sum(count)', title='Count of Records'),
+        y=alt.Y('race', sort='x'),
+        color=alt.condition(race_brush, alt.value('steelblue'), alt.value('lightgray'))
+    ).transform_filter(education_brush).add_selection(race_brush).interactive()
+
+    education_chart = alt.Chart(counts).mark_bar().encode(
+        x=alt.X('sum(count)', title='Count of Records'),
+        y=alt.Y('education', sort=EDUCATION_ORDER),
+        color=alt.condition(education_brush, alt.value('salmon'), alt.value('lightgray'))
+    ).transform_filter(race_brush).add_selection(education_brush).interactive()
+
+    return race_chart & education_chart
+
+@chart_template
+def reasons_chart(reasons, title):
+    return alt.Chart(reasons, title=title).mark_bar().encode(
+        x='sum(agree)',
+        y= alt.Y('reason', sort = '-x')
+    )
+
+@chart_template
+def slice_grid_chart(cells):
+    bars = alt.Chart().mark_bar().encode(
+        x=alt.X('mean:Q', title=None),
+        y=alt.Y('education', sort=EDUCATION_ORDER, title=None),
+        color=alt.Color('race', legend=None),
+        tooltip=['race', 'education', 'rows', alt.Tooltip('mean:Q', format='.3f'),
+                 alt.Tooltip('low:Q', format='.3f'), alt.Tooltip('high:Q', format='.3f')]
+    )
+    # 95% intervals of the estimates
+    error = alt.Chart().mark_rule(color='black').encode(
+        x='low:Q', x2='high:Q', y=alt.Y('education', sort=EDUCATION_ORDER)
+    )
+    return alt.layer(bars, error, data=cells).properties(
+        width=220, height=140
+    ).facet(
+        row=alt.Row('race', title=None), column=alt.Column('measure', title=None)
+    ).resolve_scale(x='independent')
+
+@chart_template
+def pinned_reasons_chart(shares):
+    return alt.Chart(shares).mark_bar().encode(
+        x=alt.X('value:Q', title='Share agreeing', axis=alt.Axis(format='%')),
+        y=alt.Y('measure', sort='-x', title=None),
+        tooltip=['slice', 'size', alt.Tooltip('value:Q', format='.1%')]
+    ).properties(
+        width=220, height=260
+    ).facet(
+        column=alt.Column('slice', title=None)
+    )
 
+def slice_name(selections, ranges):
+    """Short label of a pinned slice, e.g. 'gender: Female; age: 25-40'."""
+    parts = ['{}: {}'.format(col, ', '.join(map(str, values))) for col, values in selections.items() if values]
+    parts += ['{}: {}-{}'.format(col, low, high) for col, (low, high) in ranges.items()]
+    return '; '.join(parts) or 'everyone'
+
+page = Page('pulse')
+page.dataset('data', read_pulse, version=PULSE_VERSION)
+page.dataset('slice_index', build_slice_index, after=['data'], cpu=True)
+page.dataset('demographics', count_demographics, after=['data'], cpu=True)
+page.dataset('person_sampler', build_person_sampler, after=['data'], cpu=True)
+page.dataset('backend', build_backend, after=['data', 'slice_index'], version=QUERY_DB_VERSION)
+page.dataset('outcome_stats', build_outcome_stats, after=['backend'], cpu=True)
+page.dataset('table', TableView, PULSE_VERSION, after=['data'], cpu=True)
+page.start()
 
 # MAIN CODE
 
@@ -79,107 +190,136 @@ st.header("COVID19 Survey from U.S. Census Bureau")
 st.text("https://www.census.gov/data/experimental-data-products/household-pulse-survey.html")
 
 with st.spinner(text="Loading data..."):
-    df = load_data()
+    df = page.get('data')
+    demographics_counts = page.get('demographics')
+    backend = page.get('backend')
+    outcome_stats = page.get('outcome_stats')
+    sampler = page.get('person_sampler')
+
+if df.attrs.get('skipped_waves'):
+    st.warning("Memory budget reached, waves {} were not loaded".format(df.attrs['skipped_waves']))
+waves = page.filters('slice_index', [multiselect('waves', 'Survey wave', 'wave')])[0]['wave']
+
 st.text("Let us Visualize the overall dataset")
 st.subheader("Race and Education Distribution")
 
-race_brush = alt.selection_multi(fields=['race'])
-education_brush = alt.selection_multi(fields=['education'])
+# The sections below are only rebuilt when their inputs change, otherwise their
+# output is replayed from the section cache (see sections.py)
+def demographics(out):
+    # the brushes only need the race x education table of the picked waves
+    counts = demographics_counts
+    if waves:
+        counts = counts[counts['wave'].isin(waves)]
+    counts = page.cached('demographics_pair', ['demographics'], filter_key({'wave': waves}),
+                         pair_table, counts, ['race', 'education'])
 
-race_chart = alt.Chart(df).mark_bar().encode(
-    x='count()',
-    y=alt.Y('race', sort='x'),
-    color=alt.condition(race_brush, alt.value('steelblue'), alt.value('lightgray'))
-).transform_filter(education_brush).add_selection(race_brush).interactive()
+    out.chart(demographics_chart(counts=counts))
 
-education_chart = alt.Chart(df).mark_bar().encode(
-    x='count()',
-    y=alt.Y('education', sort=[
-        'Less than high school',
-        'Some high school',
-        'High school graduate or equivalent',
-        'Some college',
-        'Associates degree',
-        'Bachelors degree',
-        'Graduate degree']),
-    color=alt.condition(education_brush, alt.value('salmon'), alt.value('lightgray'))
-).transform_filter(race_brush).add_selection(education_brush).interactive()
+page.section('demographics', demographics, inputs=['demographics'], widgets=['waves'])
 
-st.altair_chart(race_chart & education_chart)
-
-st.write(df)
+# the respondents of the picked waves, one page at a time (see tables.py)
+wave_rows = np.flatnonzero(page.cached('wave_rows', ['slice_index'], filter_key({'wave': waves}),
+                                       page.get('slice_index').mask, {'wave': waves}, {})) if waves else None
+data_table(page.get('table'), 'respondents', rows=wave_rows)
 
 st.header("Custom slicing")
 st.text("Vaccined Percentage by Gender, Education, Race and Age Range")
 
-cols = st.columns(3)
-with cols[0]:
-    genders = st.multiselect('Gender', df['gender'].unique())
-with cols[1]:
-    educations = st.multiselect('Education', df['education'].unique())
-with cols[2]:
-    races = st.multiselect('Race', df['race'].unique())
+selections, ranges = page.filters('slice_index', [
+    multiselect('genders', 'Gender', 'gender'),
+    multiselect('educations', 'Education', 'education'),
+    multiselect('races', 'Race', 'race'),
+    range_slider('age_range', 'Age', 'age'),
+], columns=3)
 
-age_range = st.slider('Age',
-                    min_value=int(df['age'].min()),
-                    max_value=int(df['age'].max()),
-                    value=(int(df['age'].min()), int(df['age'].max()))
-                    )
+slice_labels = page.mask('slice_index')
 
+def slice_outcomes(out):
+    # popular slices are shared by every session (see result_cache.py)
+    in_slice, out_slice = page.cached('slice_outcomes', ['backend'], page.slice_key(), backend.compare,
+                                      selections, ranges, prefix='why_no_vaccine_')
 
-slice_labels = get_slice_membership(df, genders, races, educations, age_range)
+    out.write("The sliced dataset contains {} elements".format(in_slice['size']))
+    # the percentages and means are population estimates (see weighting.py)
+    in_estimates, out_estimates = outcome_stats.slice(selections, ranges)
+    if outcome_stats.weight is None:
+        out.caption("Unweighted: the survey waves have no {} column".format(PULSE_WEIGHT))
 
-st.write("The sliced dataset contains {} elements".format(slice_labels.sum()))
+    vaccine_reasons_slice = in_slice['reasons']
+    received_vaccine_slice = estimate(in_estimates, 'received_vaccine')
+    vaccine_intention_slice = estimate(in_estimates, 'vaccine_intention')
 
-vaccine_reasons_slice = make_long_reason_dataframe(df[slice_labels], 'why_no_vaccine_')
-received_vaccine_slice = df[slice_labels]['received_vaccine'].mean()
-vaccine_intention_slice = df[slice_labels]['vaccine_intention'].mean()
+    vaccine_reasons_noslice = out_slice['reasons']
+    received_vaccine_noslice = estimate(out_estimates, 'received_vaccine')
+    vaccine_intention_noslice = estimate(out_estimates, 'vaccine_intention')
 
-vaccine_reasons_noslice = make_long_reason_dataframe(df[~slice_labels], 'why_no_vaccine_')
-received_vaccine_noslice = df[~slice_labels]['received_vaccine'].mean()
-vaccine_intention_noslice = df[~slice_labels]['vaccine_intention'].mean()
 
+    col1, col2 = out.columns(2)
 
-col1, col2 = st.columns(2)
+    col1.header("In Slice")
+    col1.metric('Percentage received vaccine', '{:.2%}'.format(received_vaccine_slice['mean']))
+    col1.caption(interval(received_vaccine_slice, '{:.2%}'))
+    col1.metric('Mean intention in slice (value 5 is certain to not get vaccine)', round(vaccine_intention_slice['mean'], 3))
+    col1.caption(interval(vaccine_intention_slice, '{:.3f}'))
+    col1.chart(reasons_chart(reasons=vaccine_reasons_slice, title="In Slice"))
 
-with col1:
-    st.header("In Slice")
-    st.metric('Percentage received vaccine', '{:.2%}'.format(received_vaccine_slice))
-    st.metric('Mean intention in slice (value 5 is certain to not get vaccine)', round(vaccine_intention_slice, 3))
+    col2.header("Out of Slice")
+    col2.metric('Percentage received vaccine', '{:.2%}'.format(received_vaccine_noslice['mean']))
+    col2.caption(interval(received_vaccine_noslice, '{:.2%}'))
+    col2.metric('Mean intention in slice (value 5 is certain to not get vaccine)', round(vaccine_intention_noslice['mean'], 3))
+    col2.caption(interval(vaccine_intention_noslice, '{:.3f}'))
+    col2.chart(reasons_chart(reasons=vaccine_reasons_noslice, title="Out of Slice"))
 
-    chart = alt.Chart(vaccine_reasons_slice, title="In Slice").mark_bar().encode(
-        x='sum(agree)',
-        y= alt.Y('reason', sort = '-x')
-    )
+page.section('slice_outcomes', slice_outcomes, inputs=['backend', 'outcome_stats'], widgets=page.filter_keys)
 
-    st.altair_chart(chart)
+#st.write(vaccine_reasons_slice)
 
-with col2:
-    st.header("Out of Slice")
-    st.metric('Percentage received vaccine', '{:.2%}'.format(received_vaccine_noslice))
-    st.metric('Mean intention in slice (value 5 is certain to not get vaccine)', round(vaccine_intention_noslice, 3))
+st.subheader("Compare every race and education slice")
 
-    chart = alt.Chart(vaccine_reasons_noslice, title="Out of Slice").mark_bar().encode(
-        x='sum(agree)',
-        y= alt.Y('reason',sort = '-x')
-    )
-    st.altair_chart(chart)
+def slice_grid(out):
+    # every cell in one grouped pass instead of one slice query per cell (see weighting.py)
+    cells = outcome_stats.groups(['race', 'education'], selections, ranges)
+    out.chart(slice_grid_chart(cells=cells))
 
-#st.write(vaccine_reasons_slice)
+page.section('slice_grid', slice_grid, inputs=['outcome_stats'], widgets=page.filter_keys)
+
+st.subheader("Compare pinned slices")
+st.text("Pin the current slice to see its reasons next to the slices pinned before")
+
+# the pins are normalized filter keys, so pinning the same slice twice keeps one
+pin_col, clear_col = st.columns(2)
+if pin_col.button("Pin the current slice", key='pin_slice'):
+    pinned = st.session_state.get('pinned_slices', ())
+    if page.slice_key() not in pinned:
+        st.session_state['pinned_slices'] = pinned + (page.slice_key(),)
+if clear_col.button("Clear pinned slices", key='clear_pinned'):
+    st.session_state['pinned_slices'] = ()
+pinned = st.session_state.get('pinned_slices', ())
+
+def pinned_slices(out):
+    if not pinned:
+        out.text("No slice pinned yet")
+        return
+    specs = [({col: list(values) for col, values in picked}, dict(bounded)) for picked, bounded in pinned]
+    # every pinned slice in one batched pass (see backends.py)
+    summaries = page.cached('pinned_slices', ['backend'], pinned, backend.compare_many, specs, prefix='why_no_vaccine_')
+    table = comparison_table([slice_name(*spec) for spec in specs], summaries)
+    out.chart(pinned_reasons_chart(shares=table[table['kind'] == 'share']))
+
+page.section('pinned_slices', pinned_slices, inputs=['backend'], widgets=['pinned_slices'])
 
 
 st.header("Person sampling")
 
-no_vaccine = st.checkbox("Sample a person who has not received the vaccine")
+no_vaccine = st.checkbox("Sample a person who has not received the vaccine", key='no_vaccine')
+in_slice_only = st.checkbox("Only sample people in the current slice", key='in_slice_only')
+num_people = st.number_input("Number of people", min_value=1, max_value=12, value=1, key='num_people')
 
-if st.button("Get Random Person"):
-    df_to_sample = df[~df['received_vaccine']] if no_vaccine else df
-    person = df_to_sample.sample(n=1).iloc[0]
-    st.write(f""" This person is a **{person.age}**-year-old **{person.sexual_orientation}**, **{person.marital_status.lower()}** **{person.gender.lower()}**, of **{person.race}** race ({'**Hispanic**' if person.hispanic else '**non-Hispanic**'}).""")
-    
-    if person.received_vaccine:
-        st.write(f"They **have** received the vaccine.")
-    else:
-        st.write(f"They **have not** receive the vaccine and their intention to not get the vaccine is **{person.vaccine_intention}**.")
-        st.write(f"Their reasons for not getting the vaccine include: **" + ", ".join([c.replace("why_no_vaccine_", "") for c in df.columns if "why_no_vaccine" in c and person[c] > 0]) + "**")
-        
+if st.button("Get Random Person", key='person'):
+    stratum = 'not_vaccinated' if no_vaccine else 'all'
+    people = sampler.sample(stratum, n=int(num_people), mask=slice_labels if in_slice_only else None)
+    for person in people:
+        for line in describe_person(person):
+            st.write(line)
+
+end_rerun()
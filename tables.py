@@ -0,0 +1,126 @@
+"""
+Paged raw-data tables for the explorables.
+
+st.write(df) sends the whole frame to the browser on every rerun. A
+data_table sends one page of rows: the rows are sorted and filtered on the
+server and only the visible window is drawn, the other pages are fetched
+when the page number changes.
+
+    view = TableView(df, version)                # once per dataset version
+    data_table(view, 'inventor_table')           # the whole table
+    data_table(view, 'zone_rows', rows=positions)  # some of its rows
+
+The sort order of a column and the rows matching a filter are computed once
+per (dataset version, column, filter) in result_cache.RESULTS, so paging,
+and other sessions sorting the same column, only slice them. Column
+summaries (min, max, nulls, distinct values) are computed with the view.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from instrumentation import note
+from result_cache import RESULTS
+
+TABLE_PAGE_ROWS = int(os.environ.get('TABLE_PAGE_ROWS', 50))
+# key suffixes of the controls of a table
+CONTROLS = ('_sort', '_desc', '_filter_column', '_filter', '_page')
+
+
+def column_summary(df):
+    """dtype, min, max, null and distinct counts per column of `df`."""
+    rows = []
+    for column in df.columns:
+        values = df[column]
+        ordered = pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)
+        known = values.dropna()
+        rows.append({
+            'column': column,
+            'dtype': str(values.dtype),
+            # as text, the columns hold values of every type
+            'min': str(known.min()) if ordered and len(known) else '',
+            'max': str(known.max()) if ordered and len(known) else '',
+            'nulls': int(values.isna().sum()),
+            'distinct': int(values.nunique()),
+        })
+    return pd.DataFrame(rows)
+
+
+class TableView:
+    """Column summaries, sort orders and filters of one frame (see the module docstring)."""
+
+    def __init__(self, df, version):
+        self.df = df
+        self.version = version
+        self.summary = column_summary(df)
+
+    def order(self, column, ascending=True):
+        """Row positions sorted by `column`, nulls last."""
+        return RESULTS.get_or_compute(('table_order', self.version, column, ascending),
+                                      self.sort_positions, column, ascending)
+
+    def sort_positions(self, column, ascending):
+        values = self.df[column].reset_index(drop=True)
+        return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+    def matches(self, column, text):
+        """Boolean mask of the rows whose `column` contains `text` (case-insensitive)."""
+        return RESULTS.get_or_compute(('table_filter', self.version, column, text.lower()),
+                                      self.match_rows, column, text)
+
+    def match_rows(self, column, text):
+        values = self.df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # match the categories once, then look the codes up
+            hits = values.cat.categories.astype(str).str.contains(text, case=False, regex=False)
+            codes = values.cat.codes.to_numpy()
+            return np.append(np.asarray(hits, dtype=bool), False)[codes]
+        return values.astype(str).str.contains(text, case=False, regex=False).to_numpy(dtype=bool, na_value=False)
+
+    def positions(self, rows=None, sort=None, ascending=True, filter_column=None, text=''):
+        """Positions of the rows to show, in display order."""
+        if sort is not None:
+            positions = self.order(sort, ascending)
+            if rows is not None:
+                keep = np.zeros(len(self.df), dtype=bool)
+                keep[rows] = True
+                positions = positions[keep[positions]]
+        else:
+            positions = np.arange(len(self.df)) if rows is None else np.asarray(rows)
+        if filter_column is not None and text:
+            positions = positions[self.matches(filter_column, text)[positions]]
+        return positions
+
+
+def data_table(view, key, rows=None, page_rows=TABLE_PAGE_ROWS, target=st):
+    """
+    Draw the rows of `view` (only those at positions `rows` if given) as a
+    sortable, filterable table, one page of `page_rows` rows at a time. The
+    widgets are keyed `<key>` + CONTROLS; tables can not be drawn inside
+    sections.
+    """
+    columns = list(view.df.columns)
+    with target.expander("Column summary"):
+        st.dataframe(view.summary, hide_index=True)
+
+    sort_col, desc_col, filter_col, text_col = target.columns([3, 1, 3, 3])
+    sort = sort_col.selectbox("Sort by", [None] + columns, format_func=lambda c: '(table order)' if c is None else c,
+                              key=key + '_sort')
+    descending = desc_col.checkbox("Descending", key=key + '_desc')
+    filter_column = filter_col.selectbox("Filter column", columns, key=key + '_filter_column')
+    text = text_col.text_input("contains", key=key + '_filter')
+
+    positions = view.positions(rows, sort, not descending, filter_column, text.strip())
+    pages = max(1, -(-len(positions) // page_rows))
+    page_key = key + '_page'
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = pages  # the filter left fewer pages
+    page = target.number_input("Page", min_value=1, max_value=pages, step=1, key=page_key)
+
+    start = (int(page) - 1) * page_rows
+    window = view.df.iloc[positions[start:start + page_rows]]
+    note('table_rows', len(window))
+    target.dataframe(window)
+    target.caption("Rows {}-{} of {}".format(min(start + 1, len(positions)), start + len(window), len(positions)))
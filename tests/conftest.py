@@ -0,0 +1,26 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# the modules live next to the page scripts, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def survey():
+    """A small Pulse-like frame: categorical filters, a reason family with NaNs, outcomes and weights."""
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame({
+        'gender': pd.Categorical(rng.choice(['Female', 'Male'], n)),
+        'race': pd.Categorical(rng.choice(['Asian', 'Black', 'White'], n)),
+        'age': rng.integers(18, 90, n),
+        'why_no_vaccine_Cost': rng.choice([np.nan, 0.0, 1.0], n),
+        'why_no_vaccine_Time': rng.choice([np.nan, 0.0, 1.0], n),
+        'received_vaccine': rng.choice([np.nan, 0.0, 1.0], n),
+        'vaccine_intention': rng.choice([np.nan, 1.0, 2.0, 3.0, 4.0, 5.0], n),
+        'PWEIGHT': rng.choice([np.nan, 0.5, 1.0, 2.5, 4.0], n),
+    })
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import SliceSummary, build_cube, group_stats, pair_table
+from charts import level_of_detail, lttb_indices, x_positions
+
+OUTCOMES = ['received_vaccine', 'vaccine_intention']
+
+
+def reference_lttb(x, y, n_out):
+    """Steinarsson's Largest-Triangle-Three-Buckets, point by point."""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    keep = [0]
+    for i in range(n_out - 2):
+        start, stop = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_stop = stop, min(int((i + 2) * every) + 1, n)
+        next_x = sum(x[next_start:next_stop]) / (next_stop - next_start)
+        next_y = sum(y[next_start:next_stop]) / (next_stop - next_start)
+        a = keep[-1]
+        best, best_area = start, -1.0
+        for b in range(start, stop):
+            area = abs((x[a] - next_x) * (y[b] - y[a]) - (x[a] - x[b]) * (next_y - y[a]))
+            if area > best_area:
+                best, best_area = b, area
+        keep.append(best)
+    keep.append(n - 1)
+    return keep
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(1)
+    x = np.sort(rng.choice(5000, 1200, replace=False)).astype(float)
+    return x, np.cumsum(rng.normal(size=len(x)))
+
+
+@pytest.mark.parametrize('n_out', [3, 10, 97, 600])
+def test_lttb_matches_reference(series, n_out):
+    x, y = series
+    assert lttb_indices(x, y, n_out).tolist() == reference_lttb(list(x), list(y), n_out)
+
+
+def test_lttb_keeps_short_series(series):
+    x, y = series
+    assert lttb_indices(x[:50], y[:50], 600).tolist() == list(range(50))
+
+
+def test_level_of_detail_decimates_each_series(series):
+    x, y = series
+    df = pd.DataFrame({'week': np.concatenate([x, x[:40]]), 'value': np.concatenate([y, y[:40]]),
+                       'state': ['A'] * len(x) + ['B'] * 40}).sample(frac=1, random_state=0)
+    out = level_of_detail(df, 'week', 'value', series='state', max_points=100)
+    for state, part in df.groupby('state'):
+        part = part.sort_values('week')
+        expected = part.iloc[reference_lttb(list(part['week']), list(part['value']), 100)] \
+            if len(part) > 100 else part
+        pd.testing.assert_frame_equal(out[out['state'] == state].reset_index(drop=True),
+                                      expected.reset_index(drop=True))
+
+
+def test_x_positions(survey):
+    assert x_positions(survey, 'age')['age'].tolist() == sorted(survey['age'].unique())
+
+
+def test_group_stats_matches_pandas(survey):
+    cube = group_stats(survey, ['race', 'gender'], OUTCOMES)
+    expected = survey.groupby(['race', 'gender'], observed=True)[OUTCOMES].agg(['sum', 'count', 'mean'])
+    expected.columns = ['{}_{}'.format(*c) for c in expected.columns]
+    expected.insert(0, 'count', survey.groupby(['race', 'gender'], observed=True).size())
+    pd.testing.assert_frame_equal(cube, expected.reset_index(), check_dtype=False)
+
+
+def test_pair_table_rolls_up_finer_cube(survey):
+    cube = build_cube(survey, {'fine': (['race', 'gender', 'age'], OUTCOMES)})['fine']
+    rolled = pair_table(cube, ['race', 'gender'], OUTCOMES)
+    pd.testing.assert_frame_equal(rolled[group_stats(survey, ['race', 'gender'], OUTCOMES).columns],
+                                  group_stats(survey, ['race', 'gender'], OUTCOMES), check_dtype=False)
+
+
+def reference_summary(rows):
+    family = ['why_no_vaccine_Cost', 'why_no_vaccine_Time']
+    return {
+        'size': len(rows),
+        'agree': rows[family].sum().tolist(),
+        'respondents': rows[family].count().tolist(),
+        'means': rows[OUTCOMES].mean().tolist(),
+    }
+
+
+def assert_matches(summary, rows):
+    expected = reference_summary(rows)
+    assert summary['size'] == expected['size']
+    assert summary['reasons']['reason'].tolist() == ['Cost', 'Time']
+    assert summary['reasons']['agree'].tolist() == pytest.approx(expected['agree'])
+    assert summary['reasons']['respondents'].tolist() == expected['respondents']
+    assert list(summary['means'].values()) == pytest.approx(expected['means'], nan_ok=True)
+
+
+def test_slice_summary_compare_matches_pandas(survey):
+    summary = SliceSummary(survey, 'why_no_vaccine_', OUTCOMES)
+    mask = (survey['gender'] == 'Female') & survey['age'].between(20, 40)
+    inside, outside = summary.compare(mask.to_numpy())
+    assert_matches(inside, survey[mask])
+    assert_matches(outside, survey[~mask])
+
+
+def test_slice_summary_compare_many_matches_pandas(survey, monkeypatch):
+    # two masks per batch, so the stacking crosses a batch boundary
+    monkeypatch.setattr('aggregation.BATCH_CELLS', 2 * len(survey))
+    summary = SliceSummary(survey, 'why_no_vaccine_', OUTCOMES)
+    masks = [(survey['race'] == race).to_numpy() for race in ['Asian', 'Black', 'White']]
+    masks.append(np.zeros(len(survey), dtype=bool))
+    for result, mask in zip(summary.compare_many(masks), masks):
+        assert_matches(result, survey[mask])
+
+
+def test_slice_summary_group_totals_matches_pandas(survey):
+    summary = SliceSummary(survey, 'why_no_vaccine_', OUTCOMES)
+    codes = survey['race'].cat.codes.to_numpy().copy()
+    codes[survey['age'].to_numpy() > 70] = -1
+    for code, result in enumerate(summary.group_totals(codes, 3)):
+        assert_matches(result, survey[codes == code])
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from backends import PandasBackend, SQLBackend, export_table
+from slicing import SliceIndex
+
+OUTCOMES = ['received_vaccine', 'vaccine_intention']
+SLICES = [({'gender': ['Female']}, {'age': (20, 40)}), ({}, {}), ({'race': ['Black', 'White']}, {})]
+
+
+@pytest.fixture
+def backends(survey, tmp_path):
+    path = str(tmp_path / 'pulse.db')
+    export_table(survey, path, 'pulse', indexed=['gender', 'race', 'age'])
+    index = SliceIndex(survey, categorical=['gender', 'race'], ranges=['age'])
+    return PandasBackend(survey, index), SQLBackend(path, 'pulse')
+
+
+def assert_same_summary(a, b):
+    assert a['size'] == b['size']
+    pd.testing.assert_frame_equal(a['reasons'], b['reasons'], check_dtype=False)
+    assert a['means'] == pytest.approx(b['means'], nan_ok=True)
+
+
+@pytest.mark.parametrize('selections, ranges', SLICES)
+def test_compare_matches(backends, selections, ranges):
+    pandas_backend, sql_backend = backends
+    for a, b in zip(pandas_backend.compare(selections, ranges, 'why_no_vaccine_', OUTCOMES),
+                    sql_backend.compare(selections, ranges, 'why_no_vaccine_', OUTCOMES)):
+        assert_same_summary(a, b)
+
+
+def test_compare_many_matches(backends):
+    pandas_backend, sql_backend = backends
+    for a, b in zip(pandas_backend.compare_many(SLICES, 'why_no_vaccine_', OUTCOMES),
+                    sql_backend.compare_many(SLICES, 'why_no_vaccine_', OUTCOMES)):
+        assert_same_summary(a, b)
+
+
+def test_compare_groups_matches(backends):
+    pandas_backend, sql_backend = backends
+    labels, summaries = pandas_backend.compare_groups(['race', 'gender'], ranges={'age': (30, 60)},
+                                                      prefix='why_no_vaccine_', means=OUTCOMES)
+    sql_labels, sql_summaries = sql_backend.compare_groups(['race', 'gender'], ranges={'age': (30, 60)},
+                                                           prefix='why_no_vaccine_', means=OUTCOMES)
+    assert sql_labels == labels
+    for a, b in zip(summaries, sql_summaries):
+        assert_same_summary(a, b)
+
+
+@pytest.mark.parametrize('weight', ['PWEIGHT', None])
+def test_weighted_slice_matches(backends, weight):
+    pandas_backend, sql_backend = backends
+    selections, ranges = SLICES[0]
+    for a, b in zip(pandas_backend.weighted(OUTCOMES, 'v', weight=weight).slice_estimates(selections, ranges),
+                    sql_backend.weighted(OUTCOMES, 'v', weight=weight).slice_estimates(selections, ranges)):
+        pd.testing.assert_frame_equal(a, b)
+
+
+def test_weighted_groups_match(backends):
+    pandas_backend, sql_backend = backends
+    a = pandas_backend.weighted(OUTCOMES, 'v', weight='PWEIGHT').group_estimates(['race', 'gender'], {}, {'age': (30, 60)})
+    b = sql_backend.weighted(OUTCOMES, 'v', weight='PWEIGHT').group_estimates(['race', 'gender'], {}, {'age': (30, 60)})
+    columns = ['race', 'gender', 'measure']
+    a = a.astype({'race': str, 'gender': str}).sort_values(columns).reset_index(drop=True)
+    b = b.astype({'race': str, 'gender': str}).sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(a, b, check_dtype=False)
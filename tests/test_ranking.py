@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ranking import Rankings, top_k, top_k_per_row
+from zones import ZoneIndex
+
+
+def reference_top_k(values, k, largest=True):
+    """Positions of the best `k` finite values, ties in table order."""
+    s = pd.Series(values, dtype=float)
+    s = s[np.isfinite(s)]
+    return s.sort_values(ascending=not largest, kind='stable').index[:k].tolist()
+
+
+@pytest.fixture
+def scores():
+    rng = np.random.default_rng(2)
+    # small integers so there are plenty of ties
+    values = rng.integers(0, 8, 60).astype(float)
+    values[rng.choice(60, 10, replace=False)] = np.nan
+    values[[3, 40]] = [np.inf, -np.inf]
+    return values
+
+
+@pytest.mark.parametrize('k', [0, 1, 5, 20, 60, 100])
+@pytest.mark.parametrize('largest', [True, False])
+def test_top_k_matches_pandas(scores, k, largest):
+    assert top_k(scores, k, largest).tolist() == reference_top_k(scores, k, largest)
+
+
+def test_top_k_all_nan():
+    assert top_k([np.nan, np.nan], 3).tolist() == []
+
+
+@pytest.mark.parametrize('k', [1, 3, 7, 10])
+@pytest.mark.parametrize('min_value', [None, 2.0])
+def test_top_k_per_row_matches_pandas(scores, k, min_value):
+    matrix = scores[:56].reshape(8, 7)
+    for row, (columns, values) in zip(matrix, top_k_per_row(matrix, k, min_value)):
+        expected = reference_top_k(row if min_value is None else np.where(row > min_value, row, np.nan), k)
+        assert columns.tolist() == expected
+        assert values.tolist() == row[expected].tolist()
+
+
+@pytest.fixture
+def inventors():
+    rng = np.random.default_rng(3)
+    zones = pd.DataFrame({
+        'par_state': ['California', 'California', 'California', 'Vermont', 'Vermont', 'Ohio'],
+        'par_stateabbrv': ['CA', 'CA', 'CA', 'VT', 'VT', 'OH'],
+        'par_cz': [101, 102, 103, 201, 202, 301],
+        'par_czname': ['Fresno', 'San Diego', 'Eureka', 'Burlington', 'Rutland', 'Toledo'],
+    })
+    df = zones.iloc[rng.integers(0, len(zones), 300)].reset_index(drop=True)
+    df['kid_count'] = rng.integers(1, 500, len(df)).astype(float)
+    for column in ['inventor', 'top5cit', 'top5cit_cat_1', 'top5cit_cat_2', 'top5cit_cat_3']:
+        df[column] = np.where(rng.random(len(df)) < 0.1, np.nan, rng.random(len(df)) / 100)
+    return df
+
+
+def weighted_means(df, by, column):
+    known = df[df[column].notna()]
+    sums = (known[column] * known['kid_count']).groupby([known[b] for b in by]).sum()
+    return sums / known.groupby(by)['kid_count'].sum()
+
+
+def test_rankings_match_pandas(inventors):
+    rankings = Rankings(ZoneIndex(inventors), 'test_rankings_match_pandas')
+
+    states = rankings.states('top5cit', 2)
+    expected = weighted_means(inventors, ['par_state'], 'top5cit').nlargest(2)
+    assert states['par_state'].tolist() == expected.index.tolist()
+    assert states['top5cit_mean'].tolist() == pytest.approx(expected.tolist())
+
+    zones = rankings.zones('inventor', 2, states=['CA', 'Ohio'])
+    means = weighted_means(inventors[inventors['par_state'].isin(['California', 'Ohio'])], ['par_cz'], 'inventor')
+    assert zones['par_cz'].tolist() == means.nlargest(2).index.tolist()
+    assert zones['inventor_mean'].tolist() == pytest.approx(means.nlargest(2).tolist())
+
+    categories = rankings.categories('top5cit_cat_', [202, 101], k=2)
+    for cz, part in categories.groupby('par_cz', sort=False):
+        rows = inventors[inventors['par_cz'] == cz]
+        means = pd.Series({c: weighted_means(rows, ['par_cz'], 'top5cit_cat_{}'.format(c)).iloc[0] for c in [1, 2, 3]})
+        assert part['category'].tolist() == means.nlargest(2).index.tolist()
+        assert part['top5cit_cat_'].tolist() == pytest.approx(means.nlargest(2).tolist())
+        assert part['rank'].tolist() == [1, 2]
+    assert categories['par_cz'].unique().tolist() == [202, 101]
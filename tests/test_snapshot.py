@@ -0,0 +1,54 @@
+import json
+import os
+import re
+
+import pytest
+
+import snapshot
+
+PAGE = '''
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+st.title("Tiny page")
+st.altair_chart(alt.Chart(pd.DataFrame({'x': ['a', 'b'], 'y': [1, 2]})).mark_bar().encode(x='x', y='y'))
+'''
+
+
+@pytest.fixture
+def scripts_dir(tmp_path):
+    folder = tmp_path / 'scripts'
+    folder.mkdir()
+    for name in snapshot.SCRIPT_FILES:
+        (folder / name).write_text('/* {} */'.format(name))
+    return str(folder)
+
+
+def test_scripts_dir_bundle_keeps_load_order(scripts_dir):
+    bundle = snapshot.embed_bundle(scripts_dir)
+    positions = [bundle.index(name) for name in snapshot.SCRIPT_FILES]
+    assert positions == sorted(positions)
+
+
+def test_vl_convert_bundle_defines_vega_embed():
+    pytest.importorskip('vl_convert')
+    assert 'window.vegaEmbed=' in snapshot.embed_bundle()
+
+
+def test_export_needs_no_network(tmp_path, scripts_dir):
+    page = tmp_path / 'tiny_app.py'
+    page.write_text(PAGE)
+    out_dir = str(tmp_path / 'out')
+    index = snapshot.export(str(page), [], out_dir, scripts_dir=scripts_dir)
+
+    with open(os.path.join(out_dir, 'default.html')) as f:
+        html = f.read()
+    assert '<script src="{}"></script>'.format(snapshot.EMBED_SCRIPT) in html
+    assert not re.search(r'src="https?:', html)
+    with open(os.path.join(out_dir, snapshot.EMBED_SCRIPT)) as f:
+        assert f.read() == snapshot.embed_bundle(scripts_dir)
+    assert index['default']['charts'] == ['default-0.vl.json']
+    with open(os.path.join(out_dir, 'default-0.vl.json')) as f:
+        spec = json.load(f)
+    assert [row['y'] for row in next(iter(spec['datasets'].values()))] == [1, 2]
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from slicing import SliceIndex
+from weighting import Z_95, WeightedStats, estimate
+
+OUTCOMES = ['received_vaccine', 'vaccine_intention']
+
+
+def reference_estimate(rows, measure, weight=None, frequency=False, proportion=False):
+    """Weighted mean, effective n and 95% interval straight from the definitions."""
+    w = rows[weight].fillna(0.0) if weight else pd.Series(1.0, index=rows.index)
+    known = rows[measure].notna() & (w > 0)
+    x, w = rows.loc[known, measure].to_numpy(), w[known].to_numpy()
+    mean = np.average(x, weights=w)
+    var = mean * (1 - mean) if proportion else np.average((x - mean) ** 2, weights=w)
+    n = w.sum() if frequency else w.sum() ** 2 / (w ** 2).sum()
+    se = np.sqrt(var / n)
+    return {'rows': int(known.sum()), 'weight': w.sum(), 'mean': mean, 'se': se,
+            'low': mean - Z_95 * se, 'high': mean + Z_95 * se}
+
+
+def assert_estimate(table, rows, measure, **options):
+    got = estimate(table, measure)
+    expected = reference_estimate(rows, measure, **options)
+    assert got['rows'] == expected['rows']
+    assert {k: got[k] for k in expected if k != 'rows'} == \
+        pytest.approx({k: v for k, v in expected.items() if k != 'rows'})
+
+
+@pytest.fixture
+def index(survey):
+    return SliceIndex(survey, categorical=['gender', 'race'], ranges=['age'])
+
+
+@pytest.mark.parametrize('options', [
+    {'weight': 'PWEIGHT'},
+    {'weight': None},
+    {'weight': 'PWEIGHT', 'frequency': True},
+])
+def test_slice_matches_reference(survey, index, options):
+    stats = WeightedStats(survey, index, OUTCOMES, 'v', **options)
+    mask = (survey['gender'] == 'Female') & survey['age'].between(20, 40)
+    inside, outside = stats.slice_estimates({'gender': ['Female']}, {'age': (20, 40)})
+    for measure in OUTCOMES:
+        assert_estimate(inside, survey[mask], measure, **options)
+        assert_estimate(outside, survey[~mask], measure, **options)
+
+
+def test_proportion_interval(survey, index):
+    stats = WeightedStats(survey, index, OUTCOMES, 'v', weight='PWEIGHT', frequency=True,
+                          proportions=['received_vaccine'])
+    inside, _ = stats.slice_estimates({'race': ['Black']}, {})
+    rows = survey[survey['race'] == 'Black']
+    assert_estimate(inside, rows, 'received_vaccine', weight='PWEIGHT', frequency=True, proportion=True)
+    assert_estimate(inside, rows, 'vaccine_intention', weight='PWEIGHT', frequency=True)
+
+
+def test_groups_match_reference(survey, index):
+    stats = WeightedStats(survey, index, OUTCOMES, 'v', weight='PWEIGHT')
+    cells = stats.group_estimates(['race', 'gender'], {}, {'age': (30, 60)})
+    rows = survey[survey['age'].between(30, 60)]
+    groups = rows.groupby(['race', 'gender'], observed=True)
+    assert len(cells) == len(OUTCOMES) * groups.ngroups
+    for (race, gender), part in groups:
+        cell = cells[(cells['race'] == race) & (cells['gender'] == gender)]
+        for measure in OUTCOMES:
+            assert_estimate(cell, part, measure, weight='PWEIGHT')
+
+
+def test_empty_slice_has_no_estimate(survey, index):
+    stats = WeightedStats(survey, index, OUTCOMES, 'v', weight='PWEIGHT')
+    inside, outside = stats.slice_estimates({}, {'age': (200, 300)})
+    assert (inside['rows'] == 0).all() and inside['mean'].isna().all()
+    assert_estimate(outside, survey, 'received_vaccine', weight='PWEIGHT')
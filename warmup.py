@@ -0,0 +1,266 @@
+"""
+Warm-up of the datasets and derived tables behind a page.
+
+A page declares what it loads and precomputes as named tasks and calls
+start() at the top of the script:
+
+    warmup.start('innovation', [
+        warmup.task(('data', path, version), open_dataset, path),
+        warmup.task(('zones', path, version), ZoneIndex,
+                    after=[('data', path, version)], cpu=True),
+    ])
+
+The first run in a server process launches every task in the background,
+each as soon as the tasks listed in `after` (whose results are passed as the
+first arguments) are done: loading on one thread pool, CPU-heavy tasks
+(cpu=True) on a second one, so indexes do not queue behind file reads. The
+indexes and group-bys are numpy/pandas kernels that release the GIL; worker
+processes are not used because Streamlit runs the page as __main__, which
+spawned workers would re-execute, and forking the threaded server is unsafe.
+The loaders then call get(page, name, compute, *args), which waits for the
+warm-up result instead of computing the same thing again, and simply calls
+compute(*args) when no such task was registered (e.g. the data changed since).
+A result handed out by get() goes into the caller's cache (the page's
+DATASETS), so the warm-up lets go of it as soon as no pending task needs it
+any more: the cache's eviction then decides how long it stays in memory.
+
+Once every task finished, a readiness file <WARMUP_READY_DIR>/explorable-<page>.ready
+is written with the per-task timings and the pid of the process. Streamlit
+has no server-start hook and would only start the warm-up with the first
+visitor's script run, so start the server with
+
+    python warmup.py --serve innovation_streamlit_app.py [streamlit run options]
+
+which runs the page once headlessly in the server process (see first_run)
+and then starts the Streamlit server in that same process. A health probe
+checks that the readiness file was written by a live process with
+
+    python warmup.py --check innovation
+
+Host-level caches (Parquet files, SHARED_DATA=1 segments) can also be filled
+before any server starts with
+
+    python warmup.py invention.csv ...
+
+Set WARMUP=0 to turn warm-up off.
+"""
+from concurrent import futures
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from data_store import write_atomic
+
+ENABLED = os.environ.get('WARMUP', '1') != '0'
+READY_DIR = os.environ.get('WARMUP_READY_DIR', tempfile.gettempdir())
+IO_WORKERS = int(os.environ.get('WARMUP_IO_WORKERS', 4))
+CPU_WORKERS = int(os.environ.get('WARMUP_CPU_WORKERS', min(4, os.cpu_count() or 1)))
+
+_runs = {}
+_lock = threading.Lock()
+
+# the result of a task once it was handed out and no pending task needs it
+RELEASED = object()
+
+
+def task(name, func, *args, after=(), cpu=False):
+    """A warm-up step: func(*results of `after`, *args), stored under `name`."""
+    return {'name': name, 'func': func, 'args': args, 'after': list(after), 'cpu': cpu}
+
+
+def ready_path(page):
+    return os.path.join(READY_DIR, 'explorable-{}.ready'.format(page))
+
+
+def write_ready(page, status):
+    def write(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(dict({'pid': os.getpid()}, **status), f, default=str)
+    write_atomic(ready_path(page), write)
+
+
+class Warmup:
+    def __init__(self, page, tasks):
+        self.page = page
+        self.tasks = {t['name']: t for t in tasks}
+        self.futures = {name: Future() for name in self.tasks}
+        self.timings = {}
+        self.launched = set()
+        self.handed = set()
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.pools = {False: ThreadPoolExecutor(IO_WORKERS, thread_name_prefix='warmup-io'),
+                      True: ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix='warmup-cpu')}
+        self.launch_ready()
+
+    def launch_ready(self):
+        """Launch every task whose dependencies are done."""
+        with self.lock:
+            runnable = [name for name, t in self.tasks.items() if name not in self.launched
+                        and all(self.futures[d].done() for d in t['after'])]
+            self.launched.update(runnable)
+            # taken here, as a released dependency's future is replaced
+            inputs = {name: [self.futures[d] for d in self.tasks[name]['after']] for name in runnable}
+            self.release()
+        for name in runnable:
+            self.launch(name, inputs[name])
+        if len(self.launched) == len(self.tasks) and all(f.done() for f in self.futures.values()):
+            self.finish()
+
+    def launch(self, name, inputs):
+        t = self.tasks[name]
+        failed = [d for d, f in zip(t['after'], inputs) if f.exception() is not None]
+        if failed:
+            self.settle(name, time.perf_counter(), None, RuntimeError('dependency {!r} failed'.format(failed[0])))
+            return
+        args = [f.result() for f in inputs] + list(t['args'])
+        started = time.perf_counter()
+        inner = self.pools[t['cpu']].submit(t['func'], *args)
+        inner.add_done_callback(lambda f: self.settle(name, started, f))
+
+    def settle(self, name, started, inner, error=None):
+        self.timings[name] = time.perf_counter() - started
+        error = error or inner.exception()
+        if error is not None:
+            self.futures[name].set_exception(error)
+        else:
+            self.futures[name].set_result(inner.result())
+        self.launch_ready()
+
+    def hand_out(self, name):
+        """The result of `name` went to the caller's cache, drop it once no pending task needs it."""
+        with self.lock:
+            self.handed.add(name)
+            self.release()
+
+    def release(self):
+        for name in list(self.handed):
+            if all(other in self.launched for other, t in self.tasks.items() if name in t['after']):
+                released = Future()
+                released.set_result(RELEASED)
+                self.futures[name] = released
+                self.handed.discard(name)
+
+    def finish(self):
+        with self.lock:
+            if self.pools is None:
+                return
+            pools, self.pools = self.pools, None
+        for pool in pools.values():
+            pool.shutdown(wait=False)
+        write_ready(self.page, self.status())
+
+    def status(self):
+        return {
+            'page': self.page,
+            'ready': self.ready(),
+            'seconds': time.perf_counter() - self.start_time,
+            'tasks': {str(name): {'done': f.done(),
+                                  'error': repr(f.exception()) if f.done() and f.exception() else None,
+                                  'seconds': self.timings.get(name)}
+                      for name, f in self.futures.items()},
+        }
+
+    def ready(self):
+        return all(f.done() and f.exception() is None for f in self.futures.values())
+
+
+def start(page, tasks):
+    """Start warming `page` up (once per process) and return its Warmup, or None when disabled."""
+    if not ENABLED:
+        return None
+    with _lock:
+        if page not in _runs:
+            _runs[page] = Warmup(page, tasks)
+        return _runs[page]
+
+
+def get(page, name, compute, *args):
+    """The warm-up result `name` of `page` (waiting for it if needed), else compute(*args)."""
+    run = _runs.get(page)
+    future = run.futures.get(name) if run is not None else None
+    if future is not None:
+        try:
+            result = future.result()
+        except Exception:
+            result = RELEASED  # failed in the background, retry on the request thread
+        if result is not RELEASED:
+            run.hand_out(name)
+            return result
+    return compute(*args)
+
+
+def wait(page, timeout=None):
+    """Wait until every warm-up task of `page` finished (or failed)."""
+    run = _runs.get(page)
+    if run is not None:
+        futures.wait(list(run.futures.values()), timeout)
+
+
+def ready(page):
+    run = _runs.get(page)
+    return run is not None and run.ready()
+
+
+def check(page):
+    """True if the readiness file of `page` exists and the server process that wrote it is alive."""
+    try:
+        with open(ready_path(page)) as f:
+            status = json.load(f)
+        os.kill(int(status['pid']), 0)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    return bool(status.get('ready'))
+
+
+def warm_files(paths):
+    """Fill the Parquet cache (and the shared store with SHARED_DATA=1) for `paths`."""
+    from shared_store import open_dataset
+
+    with ThreadPoolExecutor(IO_WORKERS) as pool:
+        for path, df in zip(paths, pool.map(open_dataset, paths)):
+            print('{}: {} rows'.format(path, len(df)))
+
+
+def first_run(script, timeout=600):
+    """
+    Run the page script once headlessly in this process (through
+    streamlit.testing, as snapshot.py does): it starts the warm-up and loads
+    every dataset the page shows by default into the process-wide caches.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    started = time.perf_counter()
+    app = AppTest.from_file(os.path.abspath(script), default_timeout=timeout)
+    app.run()
+    if app.exception:
+        print('warm-up run of {} failed: {}'.format(script, app.exception[0].value), file=sys.stderr)
+    else:
+        print('warm-up run of {}: {:.1f} s'.format(script, time.perf_counter() - started), file=sys.stderr)
+
+
+def serve(script, options):
+    """first_run(script), then `streamlit run script *options` in this process."""
+    from streamlit.web import cli
+
+    # the test run replaces the streamlit runtime while it runs, so it goes before the server starts
+    first_run(script)
+    sys.argv = ['streamlit', 'run', script] + list(options)
+    cli.main()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['--check'] and len(args) == 2:
+        sys.exit(0 if check(args[1]) else 1)
+    if args[:1] == ['--serve'] and len(args) >= 2:
+        serve(args[1], args[2:])
+        sys.exit(0)
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    warm_files(args)
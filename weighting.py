@@ -0,0 +1,134 @@
+"""
+Weighted population statistics for slices and groups of a dataset.
+
+Row means describe the rows, not the population behind them: a commuting
+zone row with 29,001 kids counts as much as one with 30, and every Pulse
+respondent as much as any other whatever their survey weight. A
+WeightedStats converts the value and weight columns once per dataset
+version into a float matrix with, for every value column x and weight w
+(over the rows where x is known),
+
+    [known rows | sum w | sum w^2 | sum w*x | sum w*x^2]
+
+so the estimates of a slice are one mask @ matrix product (the rest of the
+data is the column totals minus the slice), and those of every cell of a
+grid one bincount pass per column. From the sums:
+
+    mean = sum w*x / sum w
+    n    = sum w                        frequency weights (kid_count: a row stands for w kids)
+         = (sum w)^2 / sum w^2          sampling weights (Kish effective sample size), also no weights
+    var  = mean * (1 - mean)            `proportions` (shares of a 0/1 outcome) with frequency weights
+         = sum w*x^2 / sum w - mean^2   otherwise
+    se   = sqrt(var / n), 95% interval mean -/+ 1.96 se
+
+Estimates are computed on the bounded worker pool (see workers.py) and
+cached in result_cache.RESULTS per (dataset version, values, weight, slice
+or grid):
+
+    stats = WeightedStats(df, slice_index, ['received_vaccine'], version, weight='PWEIGHT')
+    inside, outside = stats.slice(selections, ranges)
+    cells = stats.groups(['race', 'education'], selections, ranges)
+"""
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from result_cache import RESULTS
+from slicing import filter_key
+import workers
+
+Z_95 = 1.959964
+
+SUMS = ['rows', 'weight', 'weight2', 'wx', 'wx2']
+
+
+class WeightedStats:
+    def __init__(self, df, index, values, version, weight=None, frequency=False, proportions=()):
+        self.index = index
+        self.values = list(values)
+        self.version = version
+        self.weight = weight
+        self.frequency = frequency
+        self.proportions = np.array([v in proportions for v in self.values])
+
+        x = df[self.values].to_numpy(dtype=float, na_value=np.nan)
+        if weight is None:
+            w = np.ones(len(df))
+        else:
+            w = df[weight].to_numpy(dtype=float, na_value=np.nan)
+            w = np.where(np.isnan(w), 0.0, w)
+        known = ~np.isnan(x) & (w[:, None] > 0)
+        wk = np.where(known, w[:, None], 0.0)
+        wx = wk * np.where(known, x, 0.0)
+        self.matrix = np.hstack([known, wk, wk * w[:, None], wx, wx * np.where(known, x, 0.0)])
+        self.totals = self.matrix.sum(axis=0)
+
+    def key(self, kind, *parts):
+        return ('weighted', kind, self.version, tuple(self.values), self.weight) + parts
+
+    def slice(self, selections=None, ranges=None):
+        """Estimates (see estimates) for the rows in the slice and for the rest."""
+        return RESULTS.get_or_compute(self.key('slice', filter_key(selections, ranges)),
+                                      workers.run, self.slice_estimates, selections, ranges)
+
+    def groups(self, by, selections=None, ranges=None):
+        """
+        Estimates for every cell of the categorical columns `by` within the
+        filters, one row per (cell, measure) with the cell's `by` columns.
+        Empty cells are left out.
+        """
+        return RESULTS.get_or_compute(self.key('groups', tuple(by), filter_key(selections, ranges)),
+                                      workers.run, self.group_estimates, by, selections, ranges)
+
+    def slice_estimates(self, selections, ranges):
+        return self.compare(self.index.mask(selections, ranges))
+
+    @timed('weighted:slice')
+    def compare(self, mask):
+        inside = np.asarray(mask, dtype=float) @ self.matrix
+        return self.estimates(inside[None]), self.estimates((self.totals - inside)[None])
+
+    @timed('weighted:groups')
+    def group_estimates(self, by, selections, ranges):
+        codes, labels = self.index.group_codes(by)
+        # left out rows go to an extra last bin, as in SliceSummary.group_totals
+        codes = np.where(self.index.mask(selections, ranges) & (codes >= 0), codes, len(labels))
+        sums = np.zeros((len(labels), self.matrix.shape[1]))
+        for j in range(self.matrix.shape[1]):
+            sums[:, j] = np.bincount(codes, weights=self.matrix[:, j], minlength=len(labels) + 1)[:len(labels)]
+        return self.cell_estimates(by, labels, sums)
+
+    def cell_estimates(self, by, labels, sums):
+        """The estimates of every cell (a row of `sums`) with its `by` columns, empty cells left out."""
+        table = self.estimates(sums)
+        cells = pd.DataFrame(np.repeat(np.array(labels, dtype=object).reshape(len(labels), len(by)),
+                                       len(self.values), axis=0), columns=list(by))
+        table = pd.concat([cells, table], axis=1)
+        return table[table['rows'] > 0].reset_index(drop=True)
+
+    def estimates(self, sums):
+        """
+        Long frame of (measure, rows, weight, mean, se, low, high) per row of
+        `sums` (one totals vector per slice or cell) and value column.
+        """
+        k = len(self.values)
+        rows, weight, weight2, wx, wx2 = (sums[:, i * k:(i + 1) * k] for i in range(len(SUMS)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = wx / weight
+            var = np.where(self.proportions, mean * (1 - mean), np.maximum(wx2 / weight - mean ** 2, 0.0))
+            n = weight if self.frequency else weight ** 2 / weight2
+            se = np.sqrt(var / n)
+        return pd.DataFrame({
+            'measure': np.tile(self.values, len(sums)),
+            'rows': rows.ravel().astype(int),
+            'weight': weight.ravel(),
+            'mean': mean.ravel(),
+            'se': se.ravel(),
+            'low': (mean - Z_95 * se).ravel(),
+            'high': (mean + Z_95 * se).ravel(),
+        })
+
+
+def estimate(table, measure):
+    """The estimate row (a dict) of `measure` in a slice's estimates."""
+    return table[table['measure'] == measure].iloc[0].to_dict()
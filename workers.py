@@ -0,0 +1,89 @@
+"""
+Bounded worker pool for the slice computations of the pages.
+
+Every Streamlit session reruns its script on its own thread. With hundreds
+of sessions changing filters at once, each thread would run its own slice
+query, grouped pass or weighted estimate side by side, and the server would
+thrash. The heavy computations of the pages (pages.Page.cached,
+weighting.WeightedStats) go through run(), which executes them on
+COMPUTE_WORKERS threads with at most COMPUTE_QUEUE more waiting. When the
+queue is full, a caller waits up to COMPUTE_WAIT seconds for room and then
+gets Busy: back-pressure, the page shows a retry message for that section
+instead of piling more work onto the server. Identical computations are
+already shared through result_cache (one session computes, the others
+wait for it), so only distinct slices take a slot.
+
+    inside, outside = workers.run(stats.compare, mask)
+
+A computation that calls run() itself (on a worker thread) runs inline, so
+nested calls never wait for slots held by their own callers.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+from instrumentation import count, current, rerun_of
+
+COMPUTE_WORKERS = int(os.environ.get('COMPUTE_WORKERS', os.cpu_count() or 4))
+COMPUTE_QUEUE = int(os.environ.get('COMPUTE_QUEUE', 64))
+COMPUTE_WAIT = float(os.environ.get('COMPUTE_WAIT', 10))
+
+_local = threading.local()
+
+
+class Busy(RuntimeError):
+    """Raised by run() when the pool stayed full for COMPUTE_WAIT seconds."""
+
+
+class WorkerPool:
+    def __init__(self, workers, queue, wait):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='compute')
+        self.capacity = workers + queue
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.wait = wait
+        self.counters = {'run': 0, 'inline': 0, 'busy': 0}
+        self.lock = threading.Lock()
+
+    def event(self, event):
+        with self.lock:
+            self.counters[event] += 1
+        count('compute_pool', event)
+
+    def run(self, func, *args, **kwargs):
+        """func(*args, **kwargs) on a pool thread; the caller waits for the result."""
+        if getattr(_local, 'worker', False):
+            self.event('inline')
+            return func(*args, **kwargs)
+        if not self.slots.acquire(timeout=self.wait):
+            self.event('busy')
+            raise Busy('{} computations running or queued'.format(self.capacity))
+        self.event('run')
+        try:
+            future = self.pool.submit(self.execute, current(), func, args, kwargs)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+    @staticmethod
+    def execute(record, func, args, kwargs):
+        # spans and counters still go to the rerun that asked (see instrumentation.py)
+        _local.worker = True
+        try:
+            with rerun_of(record):
+                return func(*args, **kwargs)
+        finally:
+            _local.worker = False
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+POOL = WorkerPool(COMPUTE_WORKERS, COMPUTE_QUEUE, COMPUTE_WAIT)
+
+
+def run(func, *args, **kwargs):
+    """func(*args, **kwargs) on the process-wide pool (see the module docstring)."""
+    return POOL.run(func, *args, **kwargs)
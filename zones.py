@@ -0,0 +1,112 @@
+"""
+State -> commuting zone drill-down index for the inventor dataset.
+
+Zones are sorted by (par_state, par_czname) once, so the zones of a state
+are one contiguous slice of the zone table (kept as start/stop offsets per
+state), and the dataset rows are ordered the same way (CSR style: row
+positions plus per-zone offsets), so the rows of a state or zone are a slice
+too. Every drill-down is therefore a dictionary lookup and a slice instead
+of an isin scan over all zones per chart.
+
+The zone and state tables carry, for every value column v (inventor,
+top5cit and the *_cat_1..7 rates), v_sum = sum(v * kid_count) and
+v_count = sum(kid_count) over the rows where v is known, plus the
+kid-weighted rate v_mean. That is the cube layout of aggregation.py, so
+charts can re-aggregate them with charts.reaggregate_mean.
+"""
+import numpy as np
+import pandas as pd
+
+from reshape import family_columns
+
+ZONE_COLUMNS = ['par_state', 'par_stateabbrv', 'par_cz', 'par_czname']
+
+
+def rate_columns(df):
+    """inventor, top5cit and their category families."""
+    return (['inventor', 'top5cit'] + family_columns(df, 'inventor_cat_', r'\d+')
+            + family_columns(df, 'top5cit_cat_', r'\d+'))
+
+
+def weighted_sums(df, values, weight):
+    """Frame of v_sum / v_count per row (see the module docstring)."""
+    w = df[weight].to_numpy(dtype=float, na_value=np.nan)
+    w = np.where(np.isnan(w), 0.0, w)
+    sums = {}
+    for v in values:
+        x = df[v].to_numpy(dtype=float, na_value=np.nan)
+        known = ~np.isnan(x)
+        sums[v + '_sum'] = np.where(known, x * w, 0.0)
+        sums[v + '_count'] = np.where(known, w, 0.0)
+    sums[weight] = w
+    return pd.DataFrame(sums, index=df.index)
+
+
+def add_means(table, values):
+    for v in values:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table[v + '_mean'] = table[v + '_sum'] / table[v + '_count'].where(table[v + '_count'] > 0)
+    return table
+
+
+class ZoneIndex:
+    def __init__(self, df, values=None, weight='kid_count'):
+        self.values = list(values) if values is not None else rate_columns(df)
+        keys = pd.DataFrame({c: df[c].astype(str) if c != 'par_cz' else df[c] for c in ZONE_COLUMNS})
+        sums = weighted_sums(df, self.values, weight)
+
+        # zone table sorted by state then zone name
+        zones = pd.concat([keys, sums], axis=1).groupby(ZONE_COLUMNS, sort=False).sum().reset_index()
+        zones = zones.sort_values(['par_state', 'par_czname', 'par_cz'], kind='stable').reset_index(drop=True)
+        self.zones = add_means(zones, self.values)
+        self.zone_position = {cz: i for i, cz in enumerate(self.zones['par_cz'])}
+
+        states = self.zones['par_state'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, states[1:] != states[:-1]])
+        stops = np.r_[starts[1:], len(states)]
+        self.state_slices = {states[s]: (s, e) for s, e in zip(starts, stops)}
+        self.abbreviations = dict(zip(self.zones['par_stateabbrv'], self.zones['par_state']))
+
+        state_sums = self.zones.groupby('par_state', sort=True)[list(sums.columns)].sum()
+        self.states = add_means(state_sums, self.values)
+
+        # dataset rows grouped by zone, in zone table order
+        row_zone = pd.Index(self.zones['par_cz']).get_indexer(df['par_cz'])
+        self.row_order = np.argsort(row_zone, kind='stable')
+        self.row_offsets = np.searchsorted(row_zone[self.row_order], np.arange(len(self.zones) + 1))
+
+    def state_names(self):
+        return list(self.state_slices)
+
+    def state(self, name):
+        """Full state name for a name or an abbreviation (CA -> California)."""
+        return self.abbreviations.get(name, name)
+
+    def zone_positions(self, states):
+        """Positions in the zone table of every zone of `states`."""
+        ranges = [self.state_slices[self.state(s)] for s in states if self.state(s) in self.state_slices]
+        if not ranges:
+            return np.array([], dtype=np.int64)
+        return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+
+    def zones_in(self, states):
+        """Zone table rows (rollups) of `states`."""
+        return self.zones.iloc[self.zone_positions(states)]
+
+    def rows(self, zones):
+        """Dataset row positions of the zones with ids (par_cz) `zones`."""
+        parts = [self.row_order[self.row_offsets[p]:self.row_offsets[p + 1]]
+                 for p in (self.zone_position[cz] for cz in zones if cz in self.zone_position)]
+        return np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+
+    def state_rows(self, states):
+        """Dataset row positions of `states` (one slice per state)."""
+        parts = []
+        for s in states:
+            start, stop = self.state_slices.get(self.state(s), (0, 0))
+            parts.append(self.row_order[self.row_offsets[start]:self.row_offsets[stop]])
+        return np.concatenate(parts) if parts else np.array([], dtype=np.int64)
+
+    def label(self, cz):
+        zone = self.zones.iloc[self.zone_position[cz]]
+        return '{}, {}'.format(zone['par_czname'], zone['par_stateabbrv'])